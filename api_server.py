@@ -1,6 +1,9 @@
 #!/usr/bin/env python
 """
 API server for lead qualification evaluation service
+Usage: python api_server.py [--production]
+
+  --production : Run under gunicorn with preloaded, pre-warmed workers (see gunicorn.conf.py)
 """
 
 import os
@@ -11,11 +14,19 @@ sys.path.insert(0, os.path.abspath(os.path.dirname(__file__)))
 
 # Import Flask app from api module
 from src.argent_qualify_lead6.api import app
+from src.argent_qualify_lead6.warmup import warm_up
 
 if __name__ == "__main__":
+    if "--production" in sys.argv[1:]:
+        # Replace this process with the gunicorn master
+        root = os.path.abspath(os.path.dirname(__file__))
+        os.chdir(root)
+        os.execvp("gunicorn", ["gunicorn", "-c", os.path.join(root, "gunicorn.conf.py"), "wsgi:app"])
+
     print("Starting Lead Qualification API Server...")
     print("API available at http://localhost:5000")
     print("Endpoints:")
     print("  - POST /api/evaluate-lead")
     print("  - POST /api/evaluate-lead-from-data")
+    warm_up()
     app.run(debug=True, host='0.0.0.0', port=5000) 
\ No newline at end of file
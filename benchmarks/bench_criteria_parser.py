@@ -0,0 +1,105 @@
+#!/usr/bin/env python
+"""
+Benchmark criteria extraction on large prompts.
+
+Compares the single-pass line parser (criteria_parser.parse_criteria) with the
+previous regex-based extraction on synthetic playbooks of increasing size,
+and checks that parsing time grows linearly with the prompt size.
+
+Usage: python benchmarks/bench_criteria_parser.py [--sizes 10,100,1000] [--repeat 3]
+"""
+import argparse
+import os
+import re
+import sys
+import time
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from src.argent_qualify_lead6.criteria_parser import parse_criteria
+
+PLAYBOOK_SECTION = """
+Section {n}: objection handling and qualification notes. The customer may ask about
+pricing tiers, onboarding, integrations and support - answer briefly, then return to
+the qualification questions below.
+
+Qualification criteria for segment {n}:
+- Customer has a minimum budget of $10,000
+- Customer has decision-making authority
+  or can bring the decision maker to the next call
+- Customer has a clear need for the product:
+  * HR or payroll processes are handled manually
+  * more than 50 employees
+1. Customer needs implementation within 3 months
+2. Customer agreed to a follow-up demo
+   2.1. demo date confirmed
+
+
+
+"""
+
+
+def legacy_extract(prompt):
+    """Previous implementation: two DOTALL lazy regexes over the whole prompt."""
+    criteria = []
+    bullet_points = re.findall(r'[-•*]\s*(.*?)(?=\s*\n\s*[-•*]|\s*\n\s*\n|\s*\Z)', prompt, re.DOTALL)
+    numbered_points = re.findall(r'\d+\.\s*(.*?)(?=\s*\n\s*\d+\.|\s*\n\s*\n|\s*\Z)', prompt, re.DOTALL)
+    for point in bullet_points + numbered_points:
+        clean_point = re.sub(r'\s+', ' ', point).strip()
+        if clean_point:
+            criteria.append(clean_point)
+    return criteria
+
+
+def build_prompt(size_kb):
+    sections = []
+    total = 0
+    n = 0
+    while total < size_kb * 1024:
+        section = PLAYBOOK_SECTION.format(n=n)
+        sections.append(section)
+        total += len(section.encode("utf-8"))
+        n += 1
+    return "".join(sections)
+
+
+def best_time(function, prompt, repeat):
+    best = float("inf")
+    result = None
+    for _ in range(repeat):
+        start = time.perf_counter()
+        result = function(prompt)
+        best = min(best, time.perf_counter() - start)
+    return best, result
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--sizes", default="10,100,1000", help="Comma-separated prompt sizes in KB")
+    parser.add_argument("--repeat", type=int, default=3, help="Runs per measurement (best is reported)")
+    parser.add_argument("--skip-legacy", action="store_true", help="Only benchmark the line parser")
+    args = parser.parse_args()
+
+    print(f"{'size KB':>8} {'parser ms':>10} {'MB/s':>8} {'items':>7} {'legacy ms':>10} {'legacy items':>13}")
+    for size_kb in [int(size) for size in args.sizes.split(",")]:
+        prompt = build_prompt(size_kb)
+        elapsed, criteria = best_time(parse_criteria, prompt, args.repeat)
+        line = f"{size_kb:>8} {elapsed * 1000:>10.2f} {len(prompt) / elapsed / 1e6:>8.1f} {len(criteria):>7}"
+        if not args.skip_legacy:
+            legacy_elapsed, legacy_criteria = best_time(legacy_extract, prompt, 1)
+            line += f" {legacy_elapsed * 1000:>10.2f} {len(legacy_criteria):>13}"
+        print(line)
+
+    # Pathological input for the lookahead-based regexes: a long whitespace run
+    # (e.g. a pasted table) is rescanned from every position, which is quadratic
+    prompt = "- a" + " " * 20000 + "x"
+    elapsed, _ = best_time(parse_criteria, prompt, args.repeat)
+    line = f"whitespace run ({len(prompt) // 1024} KB): parser {elapsed * 1000:.2f} ms"
+    if not args.skip_legacy:
+        legacy_elapsed, _ = best_time(legacy_extract, prompt, 1)
+        line += f", legacy {legacy_elapsed * 1000:.2f} ms"
+    print(line)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,337 @@
+#!/usr/bin/env python
+"""
+Load generator for the evaluation API.
+
+Drives the API with a configurable number of concurrent clients, a weighted
+mix of request types and a distribution of transcript sizes, and reports
+throughput, p50/p95/p99 latency and error rate, overall and per request type.
+
+Targets:
+    inprocess   Flask test client in this process (no network, no server start)
+    flask       Flask threaded server started locally
+    asgi        uvicorn (ASGI mode) started locally
+    gunicorn    gunicorn (production mode) started locally
+    --url       An already running server
+
+Results can be saved with --output and compared with a previous run with
+--baseline; the exit status is 1 when throughput or p95 latency regressed by
+more than --tolerance.
+
+Usage:
+    python benchmarks/load_test.py --target inprocess --requests 500 --concurrency 8
+    python benchmarks/load_test.py --target asgi --duration 30 --mix evaluate-lead:3,compact:1 \\
+        --sizes 1:0.7,20:0.25,200:0.05 --output run.json --baseline previous.json
+"""
+import argparse
+import bisect
+import contextlib
+import http.client
+import io
+import json
+import os
+import random
+import statistics
+import subprocess
+import sys
+import threading
+import time
+from urllib.parse import urlparse
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, ROOT)
+sys.path.insert(0, os.path.dirname(os.path.abspath(__file__)))
+
+import serving_concurrency  # noqa: E402
+from serving_concurrency import PROMPT, TRANSCRIPT_BLOCK, free_port  # noqa: E402
+
+SERVERS = {
+    **serving_concurrency.SERVERS,
+    "gunicorn": [sys.executable, "-m", "gunicorn", "-c", "gunicorn.conf.py", "wsgi:app", "--bind"],
+}
+
+LEAD_DOCUMENT = {
+    "_id": {"$oid": "6815bdbb1660633e3262c056"},
+    "userId": {"$oid": "67b1c1331e12c93a79317bbb"},
+    "flowId": {"$oid": "67f704b14cd3acb38825d64c"},
+}
+
+
+def transcript_of_size(size_kb):
+    """Return a transcript of about size_kb KB built from the sample exchange."""
+    blocks = max(1, int(size_kb * 1024 / len(TRANSCRIPT_BLOCK.encode("utf-8"))))
+    return TRANSCRIPT_BLOCK * blocks
+
+
+def build_request(kind, transcript, prompt_id):
+    """Return (method, path, body) of a request of the given kind."""
+    if kind == "evaluate-lead":
+        return "POST", "/api/evaluate-lead", {"prompt": PROMPT, "transcript": transcript}
+    if kind == "compact":
+        return "POST", "/api/evaluate-lead", {"prompt": PROMPT, "transcript": transcript, "format": "compact"}
+    if kind == "from-data":
+        return "POST", "/api/evaluate-lead-from-data", {
+            "prompt": PROMPT, "data": {**LEAD_DOCUMENT, "leadData": {"transcript": transcript}}}
+    if kind == "prompt-id":
+        return "POST", "/api/evaluate-lead", {"prompt_id": prompt_id, "transcript": transcript}
+    if kind == "job":
+        return "POST", "/api/jobs", {"type": "evaluate-lead", "priority": "batch",
+                                     "payload": {"prompt": PROMPT, "transcript": transcript}}
+    raise ValueError(f"Unknown request kind '{kind}'")
+
+
+REQUEST_KINDS = ("evaluate-lead", "compact", "from-data", "prompt-id", "job")
+# Status codes counted as success per request kind
+EXPECTED_STATUS = {"job": (202,)}
+
+
+def parse_weights(spec, cast=str):
+    """Parse "a:3,b:1" into [(a, 3.0), (b, 1.0)]."""
+    weights = []
+    for item in spec.split(","):
+        name, _, weight = item.partition(":")
+        weights.append((cast(name.strip()), float(weight) if weight else 1.0))
+    return weights
+
+
+class WeightedChoice:
+    """Draw items according to their weights."""
+
+    def __init__(self, weights):
+        self.items = [item for item, _ in weights]
+        self.cumulative = []
+        total = 0.0
+        for _, weight in weights:
+            total += weight
+            self.cumulative.append(total)
+
+    def draw(self, rng):
+        index = bisect.bisect_right(self.cumulative, rng.random() * self.cumulative[-1])
+        return self.items[min(index, len(self.items) - 1)]
+
+
+class HttpTransport:
+    """Keep-alive HTTP client of one load thread."""
+
+    def __init__(self, host, port):
+        self.host, self.port = host, port
+        self.connection = http.client.HTTPConnection(host, port, timeout=120)
+
+    def send(self, method, path, body):
+        try:
+            self.connection.request(method, path, body=json.dumps(body),
+                                    headers={"Content-Type": "application/json"})
+            response = self.connection.getresponse()
+            response.read()
+            return response.status
+        except (OSError, http.client.HTTPException):
+            self.connection.close()
+            self.connection = http.client.HTTPConnection(self.host, self.port, timeout=120)
+            return 0
+
+    def close(self):
+        self.connection.close()
+
+
+class InProcessTransport:
+    """Flask test client of one load thread."""
+
+    def __init__(self, app):
+        self.client = app.test_client()
+
+    def send(self, method, path, body):
+        return self.client.open(path, method=method, json=body).status_code
+
+    def close(self):
+        pass
+
+
+def start_server(target, port):
+    """Start a server in a subprocess and wait until it accepts connections."""
+    env = dict(os.environ)
+    if target == "gunicorn":
+        env.setdefault("LEAD_API_WORKERS", str(os.cpu_count() or 1))
+    process = subprocess.Popen(SERVERS[target] + ([f"127.0.0.1:{port}"] if target == "gunicorn" else [str(port)]),
+                               cwd=ROOT, env=env, stdout=subprocess.DEVNULL, stderr=subprocess.DEVNULL)
+    deadline = time.time() + 60
+    while time.time() < deadline:
+        connection = http.client.HTTPConnection("127.0.0.1", port, timeout=2)
+        try:
+            connection.request("GET", "/readyz")
+            if connection.getresponse().status == 200:
+                return process
+        except OSError:
+            pass
+        finally:
+            connection.close()
+        time.sleep(0.2)
+    process.kill()
+    raise RuntimeError(f"{target} server did not become ready on port {port}")
+
+
+def percentile(sorted_values, fraction):
+    if not sorted_values:
+        return 0.0
+    index = min(len(sorted_values) - 1, max(0, int(round(fraction * len(sorted_values))) - 1))
+    return sorted_values[index]
+
+
+def summarize(samples, elapsed):
+    """Return throughput, latency percentiles (ms) and error rate of (latency, ok) samples."""
+    latencies = sorted(latency for latency, _ in samples)
+    errors = sum(1 for _, ok in samples if not ok)
+    return {
+        "requests": len(samples),
+        "throughput_rps": round(len(samples) / elapsed, 2) if elapsed else 0.0,
+        "p50_ms": round(statistics.median(latencies) * 1000, 2) if latencies else 0.0,
+        "p95_ms": round(percentile(latencies, 0.95) * 1000, 2),
+        "p99_ms": round(percentile(latencies, 0.99) * 1000, 2),
+        "error_rate": round(errors / len(samples), 4) if samples else 0.0,
+    }
+
+
+def run_load(make_transport, args, prompt_id):
+    """Run the load and return (elapsed seconds, {kind: [(latency, ok)]})."""
+    mix = WeightedChoice(parse_weights(args.mix))
+    sizes = WeightedChoice(parse_weights(args.sizes, float))
+    transcripts = {size: transcript_of_size(size) for size in sizes.items}
+    samples = {}
+    lock = threading.Lock()
+    remaining = [args.requests]
+    deadline = time.perf_counter() + args.duration if args.duration else None
+
+    def worker(index):
+        rng = random.Random(args.seed + index)
+        transport = make_transport()
+        local = []
+        while True:
+            if deadline is not None:
+                if time.perf_counter() >= deadline:
+                    break
+            else:
+                with lock:
+                    if remaining[0] == 0:
+                        break
+                    remaining[0] -= 1
+            kind = mix.draw(rng)
+            method, path, body = build_request(kind, transcripts[sizes.draw(rng)], prompt_id)
+            start = time.perf_counter()
+            status = transport.send(method, path, body)
+            local.append((kind, time.perf_counter() - start, status in EXPECTED_STATUS.get(kind, (200,))))
+        transport.close()
+        with lock:
+            for kind, latency, ok in local:
+                samples.setdefault(kind, []).append((latency, ok))
+
+    threads = [threading.Thread(target=worker, args=(index,)) for index in range(args.concurrency)]
+    start = time.perf_counter()
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+    return time.perf_counter() - start, samples
+
+
+def compare(report, baseline, tolerance):
+    """Return the regressions of report against baseline, as messages."""
+    regressions = []
+    current, previous = report["overall"], baseline["overall"]
+    if previous["throughput_rps"] and current["throughput_rps"] < previous["throughput_rps"] * (1 - tolerance):
+        regressions.append(f"throughput {current['throughput_rps']} req/s < baseline {previous['throughput_rps']}")
+    if previous["p95_ms"] and current["p95_ms"] > previous["p95_ms"] * (1 + tolerance):
+        regressions.append(f"p95 {current['p95_ms']} ms > baseline {previous['p95_ms']}")
+    if current["error_rate"] > previous["error_rate"] + 0.01:
+        regressions.append(f"error rate {current['error_rate']} > baseline {previous['error_rate']}")
+    return regressions
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--target", default="inprocess", choices=["inprocess"] + list(SERVERS),
+                        help="Server to drive (ignored with --url)")
+    parser.add_argument("--url", help="Base URL of an already running server, e.g. http://127.0.0.1:5000")
+    parser.add_argument("--concurrency", type=int, default=8, help="Concurrent clients")
+    parser.add_argument("--requests", type=int, default=500, help="Total requests (unless --duration is set)")
+    parser.add_argument("--duration", type=float, default=0, help="Run for this many seconds instead")
+    parser.add_argument("--mix", default="evaluate-lead:1",
+                        help=f"Weighted request kinds, from: {', '.join(REQUEST_KINDS)}")
+    parser.add_argument("--sizes", default="2:0.7,20:0.25,100:0.05", help="Weighted transcript sizes in KB")
+    parser.add_argument("--seed", type=int, default=1, help="Random seed of the request sequence")
+    parser.add_argument("--output", help="Write the report as JSON to this file")
+    parser.add_argument("--baseline", help="Report of a previous run to compare with")
+    parser.add_argument("--tolerance", type=float, default=0.2, help="Allowed relative regression (0.2 = 20%%)")
+    args = parser.parse_args()
+
+    for kind, _ in parse_weights(args.mix):
+        if kind not in REQUEST_KINDS:
+            parser.error(f"unknown request kind '{kind}', expected one of: {', '.join(REQUEST_KINDS)}")
+
+    process = None
+    silence = contextlib.nullcontext()
+    if args.url:
+        target = args.url
+        parsed = urlparse(args.url)
+        make_transport = lambda: HttpTransport(parsed.hostname, parsed.port or 80)  # noqa: E731
+    elif args.target == "inprocess":
+        from src.argent_qualify_lead6.api import app
+        from src.argent_qualify_lead6.warmup import warm_up
+        target = "inprocess"
+        warm_up()
+        make_transport = lambda: InProcessTransport(app)  # noqa: E731
+        # The evaluator prints debug lines for every criterion
+        silence = contextlib.redirect_stdout(io.StringIO())
+    else:
+        target = args.target
+        port = free_port()
+        process = start_server(args.target, port)
+        make_transport = lambda: HttpTransport("127.0.0.1", port)  # noqa: E731
+
+    try:
+        prompt_id = None
+        if any(kind == "prompt-id" for kind, _ in parse_weights(args.mix)):
+            transport = make_transport()
+            with silence:
+                transport.send("POST", "/api/prompts", {"prompt": PROMPT, "prompt_id": "load-test"})
+            transport.close()
+            prompt_id = "load-test"
+        with silence:
+            # Warm up connections, imports and process pools
+            make_transport().send(*build_request("evaluate-lead", TRANSCRIPT_BLOCK, prompt_id))
+            elapsed, samples = run_load(make_transport, args, prompt_id)
+    finally:
+        if process is not None:
+            process.terminate()
+            process.wait()
+
+    all_samples = [sample for kind_samples in samples.values() for sample in kind_samples]
+    report = {
+        "target": target,
+        "concurrency": args.concurrency,
+        "mix": args.mix,
+        "sizes_kb": args.sizes,
+        "elapsed_seconds": round(elapsed, 3),
+        "overall": summarize(all_samples, elapsed),
+        "by_kind": {kind: summarize(kind_samples, elapsed) for kind, kind_samples in sorted(samples.items())},
+    }
+
+    print(f"target={target} concurrency={args.concurrency} elapsed={elapsed:.2f}s")
+    print(f"{'kind':<14} {'requests':>9} {'req/s':>8} {'p50 ms':>9} {'p95 ms':>9} {'p99 ms':>9} {'errors':>7}")
+    for kind, summary in [("overall", report["overall"])] + list(report["by_kind"].items()):
+        print(f"{kind:<14} {summary['requests']:>9} {summary['throughput_rps']:>8.1f} {summary['p50_ms']:>9.1f} "
+              f"{summary['p95_ms']:>9.1f} {summary['p99_ms']:>9.1f} {summary['error_rate']:>7.1%}")
+
+    if args.output:
+        with open(args.output, "w", encoding="utf-8") as f:
+            json.dump(report, f, indent=2)
+
+    if args.baseline:
+        with open(args.baseline, "r", encoding="utf-8") as f:
+            regressions = compare(report, json.load(f), args.tolerance)
+        for regression in regressions:
+            print(f"REGRESSION: {regression}")
+        if regressions:
+            sys.exit(1)
+        print("No regression against the baseline")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,139 @@
+#!/usr/bin/env python
+"""
+Compare the concurrent-request capacity of the Flask and ASGI serving modes.
+
+Starts each server on a free local port, fires the same /api/evaluate-lead
+requests at increasing concurrency levels and reports throughput and latency.
+
+Usage: python benchmarks/serving_concurrency.py [--concurrency 1,8,32] [--requests 200]
+"""
+import argparse
+import http.client
+import json
+import os
+import socket
+import statistics
+import subprocess
+import sys
+import threading
+import time
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+PROMPT = """
+Lead qualification criteria:
+- Customer has a minimum budget of $10,000
+- Customer has decision-making authority
+- Customer has a clear need for the product
+- Customer needs implementation within 3 months
+"""
+
+TRANSCRIPT_BLOCK = """Sales: What's the budget for this project?
+Customer: About $15,000, and I need a human resources management system.
+Sales: Are you the final decision maker?
+Customer: Yes, I'm the HR director and I want to implement it next month.
+"""
+
+SERVERS = {
+    # Flask's threaded development server, as started by api_server.py
+    "flask": [sys.executable, "-c",
+              "import sys; from src.argent_qualify_lead6.api import app; "
+              "app.run(host='127.0.0.1', port=int(sys.argv[1]), threaded=True)"],
+    "asgi": [sys.executable, "-m", "uvicorn", "src.argent_qualify_lead6.asgi:app",
+             "--host", "127.0.0.1", "--log-level", "warning", "--port"],
+}
+
+
+def free_port():
+    with socket.socket() as sock:
+        sock.bind(("127.0.0.1", 0))
+        return sock.getsockname()[1]
+
+
+def start_server(mode, port):
+    """Start a server in a subprocess and wait until it accepts connections."""
+    process = subprocess.Popen(SERVERS[mode] + [str(port)], cwd=ROOT,
+                               stdout=subprocess.DEVNULL, stderr=subprocess.DEVNULL)
+    deadline = time.time() + 30
+    while time.time() < deadline:
+        try:
+            socket.create_connection(("127.0.0.1", port), timeout=0.5).close()
+            return process
+        except OSError:
+            time.sleep(0.2)
+    process.kill()
+    raise RuntimeError(f"{mode} server did not start on port {port}")
+
+
+def run_load(port, body, concurrency, total_requests):
+    """Send total_requests POSTs from `concurrency` threads; return (elapsed, latencies, errors)."""
+    latencies = []
+    errors = [0]
+    lock = threading.Lock()
+    remaining = [total_requests]
+
+    def worker():
+        connection = http.client.HTTPConnection("127.0.0.1", port, timeout=120)
+        while True:
+            with lock:
+                if remaining[0] == 0:
+                    break
+                remaining[0] -= 1
+            start = time.perf_counter()
+            try:
+                connection.request("POST", "/api/evaluate-lead", body=body,
+                                   headers={"Content-Type": "application/json"})
+                response = connection.getresponse()
+                response.read()
+                ok = response.status == 200
+            except (OSError, http.client.HTTPException):
+                connection.close()
+                connection = http.client.HTTPConnection("127.0.0.1", port, timeout=120)
+                ok = False
+            with lock:
+                latencies.append(time.perf_counter() - start)
+                if not ok:
+                    errors[0] += 1
+        connection.close()
+
+    threads = [threading.Thread(target=worker) for _ in range(concurrency)]
+    start = time.perf_counter()
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+    return time.perf_counter() - start, latencies, errors[0]
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--concurrency", default="1,8,32", help="Comma-separated concurrency levels")
+    parser.add_argument("--requests", type=int, default=200, help="Requests per concurrency level")
+    parser.add_argument("--transcript-blocks", type=int, default=50,
+                        help="Size of the transcript, in repetitions of a 4-line exchange")
+    parser.add_argument("--modes", default="flask,asgi", help="Serving modes to compare")
+    args = parser.parse_args()
+
+    body = json.dumps({"prompt": PROMPT, "transcript": TRANSCRIPT_BLOCK * args.transcript_blocks})
+    levels = [int(level) for level in args.concurrency.split(",")]
+
+    print(f"{'mode':<6} {'conc':>5} {'req/s':>9} {'p50 ms':>9} {'p95 ms':>9} {'errors':>7}")
+    for mode in args.modes.split(","):
+        port = free_port()
+        process = start_server(mode, port)
+        try:
+            # Warm up imports, process pools and connection handling
+            run_load(port, body, 2, 4)
+            for concurrency in levels:
+                elapsed, latencies, errors = run_load(port, body, concurrency, args.requests)
+                latencies.sort()
+                p95 = latencies[int(len(latencies) * 0.95) - 1]
+                print(f"{mode:<6} {concurrency:>5} {len(latencies) / elapsed:>9.1f} "
+                      f"{statistics.median(latencies) * 1000:>9.1f} {p95 * 1000:>9.1f} {errors:>7}")
+        finally:
+            process.terminate()
+            process.wait()
+
+
+if __name__ == "__main__":
+    main()
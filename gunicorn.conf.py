@@ -0,0 +1,35 @@
+"""
+Gunicorn configuration for the lead qualification API.
+
+Usage: gunicorn -c gunicorn.conf.py wsgi:app   (or: python api_server.py --production)
+"""
+import gc
+import multiprocessing
+import os
+
+bind = os.getenv("LEAD_API_BIND", "0.0.0.0:5000")
+workers = int(os.getenv("LEAD_API_WORKERS", str(multiprocessing.cpu_count() * 2 + 1)))
+threads = int(os.getenv("LEAD_API_THREADS", "1"))
+timeout = int(os.getenv("LEAD_API_TIMEOUT", "120"))
+graceful_timeout = 30
+keepalive = 5
+
+# Each worker keeps analytics in memory; with several workers they add their counts to a
+# shared SQLite store instead, so every worker answers /api/analytics for the whole server
+if workers > 1 and os.getenv("LEAD_ANALYTICS", "1").lower() not in ("0", "false", "no"):
+    os.environ.setdefault("LEAD_ANALYTICS_DB", "analytics.db")
+
+# Import the app (and warm up the rule tables, see wsgi.py) in the master before forking
+preload_app = True
+
+
+def when_ready(server):
+    # Runs in the master after the app is loaded and before workers are forked.
+    # Move everything allocated so far out of the tracked generations so the
+    # collector in the workers does not touch (and copy) the shared pages.
+    gc.freeze()
+    server.log.info("Rule tables warmed up, %d objects frozen for copy-on-write sharing", gc.get_freeze_count())
+
+
+def post_fork(server, worker):
+    server.log.info("Worker spawned (pid: %s)", worker.pid)
@@ -2,21 +2,54 @@
 """
 Command line tool to evaluate lead qualification based on transcript.
 Usage: python qualify_lead.py <path_to_lead_data.json> [path_to_criteria_prompt.txt]
+       python qualify_lead.py <leads.jsonl> [path_to_criteria_prompt.txt] --sink sqlite:results.db [--sink parquet:results/]
+       python qualify_lead.py <leads.jsonl> [path_to_criteria_prompt.txt] --queue /shared/backfill.db --enqueue
+       python qualify_lead.py --queue /shared/backfill.db --work    (on any number of hosts)
+       python qualify_lead.py --queue /shared/backfill.db --status [--sink parquet:results/]
 """
 
+import argparse
 import json
 import sys
 import os
-from src.argent_qualify_lead6.call_quality_evaluator import evaluate_lead_qualification
+from src.argent_qualify_lead6.call_quality_evaluator import LeadQualificationEvaluator, evaluate_lead_qualification
+from src.argent_qualify_lead6.results_sink import ResultWriter, criteria_key, make_record, open_sink
+from src.argent_qualify_lead6.work_queue import WorkQueue, run_worker
 
-def print_usage():
-    print(f"""
-Usage: python {sys.argv[0]} <path_to_lead_data.json> [path_to_criteria_prompt.txt]
-
-Arguments:
-  path_to_lead_data.json    : Path to JSON file containing lead data with transcript
-  path_to_criteria_prompt.txt: Path to text file containing business prompt with evaluation criteria (optional)
-    """)
+def parse_args(argv=None):
+    parser = argparse.ArgumentParser(
+        description="Evaluate lead qualification from lead data files.",
+        epilog="Without --sink the file must hold one lead, whose result is printed and saved to "
+               "<lead>_result.json. With --sink, the file may hold one lead, a JSON array of leads or "
+               "one lead per line (.jsonl), and results are appended in batches to the sinks. With --queue, "
+               "a backfill is shared by workers on several hosts: --enqueue adds the leads of the file to the "
+               "queue database, --work evaluates chunks until the queue is drained, --status reports the "
+               "progress, and --sink exports the results stored in the queue.")
+    parser.add_argument("lead_data", nargs="?", help="JSON file containing lead data with transcript")
+    parser.add_argument("prompt", nargs="?",
+                        help="Text file containing business prompt with evaluation criteria (optional)")
+    parser.add_argument("--sink", action="append", default=[], metavar="KIND:PATH",
+                        help="Bulk output, 'sqlite:<db file>' or 'parquet:<directory>' (repeatable)")
+    parser.add_argument("--batch-size", type=int, default=1000, help="Results buffered before a write (default 1000)")
+    parser.add_argument("--flush-interval", type=float, default=5.0,
+                        help="Maximum seconds between writes (default 5)")
+    parser.add_argument("--queue", metavar="DB", help="Work queue database (SQLite) on storage shared by the workers")
+    parser.add_argument("--enqueue", action="store_true", help="Add the leads of the file to the queue")
+    parser.add_argument("--work", action="store_true", help="Evaluate queued chunks until the queue is drained")
+    parser.add_argument("--status", action="store_true", help="Print the progress of the queue")
+    parser.add_argument("--retry-failed", action="store_true", help="Put the failed chunks back in the queue")
+    parser.add_argument("--chunk-size", type=int, default=500, help="Leads per queued chunk (default 500)")
+    parser.add_argument("--lease", type=float, default=120.0,
+                        help="Seconds a chunk stays leased without a heartbeat (default 120)")
+    parser.add_argument("--max-attempts", type=int, default=3,
+                        help="Leases of a chunk before it is marked failed (default 3)")
+    args = parser.parse_args(argv)
+    queue_actions = args.enqueue or args.work or args.status or args.retry_failed
+    if queue_actions and not args.queue:
+        parser.error("--enqueue, --work, --status and --retry-failed require --queue")
+    if args.lead_data is None and (args.enqueue or not args.queue):
+        parser.error("the lead_data file is required")
+    return args
 
 def read_lead_data(file_path):
     """Read lead data from JSON file."""
@@ -48,6 +81,21 @@ def get_default_prompt():
     - Customer has a specific implementation timeline
     """
 
+def iter_leads(file_path):
+    """Yield the lead documents of a file: one lead, a JSON array of leads, or one lead per line."""
+    try:
+        if os.path.splitext(file_path)[1] in (".jsonl", ".ndjson"):
+            with open(file_path, 'r', encoding='utf-8') as f:
+                for line in f:
+                    if line.strip():
+                        yield json.loads(line)
+            return
+        lead_data = read_lead_data(file_path)
+        yield from (lead_data if isinstance(lead_data, list) else [lead_data])
+    except ValueError as e:
+        print(f"Error reading file {file_path}: {str(e)}")
+        sys.exit(1)
+
 def extract_transcript(lead_data):
     """Extract transcript from lead data."""
     try:
@@ -60,21 +108,122 @@ def extract_transcript(lead_data):
         print(f"Error extracting transcript: {str(e)}")
         sys.exit(1)
 
-def main():
-    # Check command line parameters
-    if len(sys.argv) < 2:
-        print_usage()
+def write_results(leads_path, prompt, sink_specs, batch_size, flush_interval):
+    """Evaluate every lead of a file and append the results to the sinks in batches."""
+    try:
+        sinks = [open_sink(spec) for spec in sink_specs]
+    except (ValueError, RuntimeError) as e:
+        print(f"Error: {str(e)}")
+        sys.exit(1)
+    
+    evaluator = LeadQualificationEvaluator()
+    # Extract the criteria once for all leads
+    criteria = evaluator.extract_criteria_from_prompt(prompt)
+    skipped = 0
+    with ResultWriter(sinks, batch_size=batch_size, flush_interval=flush_interval) as writer:
+        for lead_data in iter_leads(leads_path):
+            lead_info = lead_data.get("leadData", {}) if isinstance(lead_data, dict) else {}
+            if "transcript" not in lead_info:
+                skipped += 1
+                continue
+            writer.add(lead_data, evaluator.evaluate_result(criteria, lead_info["transcript"]))
+    
+    print(f"\nWrote {writer.written} results to: {', '.join(sink_specs)}")
+    if skipped:
+        print(f"Skipped {skipped} leads without 'leadData.transcript'")
+
+def evaluate_record(evaluator, criteria, key, lead_data):
+    """Evaluate one lead document of a queued chunk, None when it has no transcript."""
+    lead_info = lead_data.get("leadData", {}) if isinstance(lead_data, dict) else {}
+    if "transcript" not in lead_info:
+        return None
+    return make_record(lead_data, evaluator.evaluate_result(criteria, lead_info["transcript"]), key)
+
+def print_progress(queue):
+    """Print the progress and throughput of a work queue."""
+    progress = queue.progress()
+    chunks, documents = progress["chunks"], progress["documents"]
+    print(f"Chunks: {chunks['done']}/{chunks['total']} done, {chunks['leased']} leased, "
+          f"{chunks['pending']} pending, {chunks['failed']} failed")
+    print(f"Leads: {documents['done']}/{documents['total']} processed ({progress['leads_evaluated']} evaluated, "
+          f"{progress['leads_skipped']} without transcript), {documents['failed']} in failed chunks")
+    eta = progress["eta_seconds"]
+    print(f"Throughput: {progress['recent_throughput']} leads/s (last 5 min), {progress['throughput']} leads/s overall"
+          + (f", about {eta // 60} min remaining" if eta else ""))
+    for owner, done in progress["workers"].items():
+        print(f"  {owner}: {done['chunks']} chunks, {done['leads']} leads")
+
+def export_results(queue, sink_specs, batch_size):
+    """Copy the results stored in a work queue to the sinks."""
+    try:
+        sinks = [open_sink(spec) for spec in sink_specs]
+    except (ValueError, RuntimeError) as e:
+        print(f"Error: {str(e)}")
         sys.exit(1)
+    criteria = queue.criteria() or []
+    key = criteria_key(criteria)
+    exported = 0
+    for sink in sinks:
+        sink.add_criteria(key, criteria)
+    for records in queue.records(batch_size):
+        for sink in sinks:
+            sink.write(records)
+        exported += len(records)
+    for sink in sinks:
+        sink.close()
+    print(f"Exported {exported} results to: {', '.join(sink_specs)}")
+
+def run_queue(args, prompt):
+    """Enqueue, work on, report on or export a shared work queue."""
+    queue = WorkQueue(args.queue, lease_seconds=args.lease, max_attempts=args.max_attempts)
+    try:
+        if args.enqueue:
+            criteria = LeadQualificationEvaluator().extract_criteria_from_prompt(prompt)
+            try:
+                queue.set_criteria(criteria)
+            except ValueError as e:
+                print(f"Error: {str(e)}")
+                sys.exit(1)
+            added = queue.enqueue(os.path.abspath(args.lead_data), iter_leads(args.lead_data), args.chunk_size)
+            print(f"Enqueued {added} chunks from {args.lead_data}")
+        if args.retry_failed:
+            print(f"Re-queued {queue.retry_failed()} failed chunks")
+        if args.work:
+            criteria = queue.criteria()
+            if criteria is None:
+                print("Error: the queue is empty, enqueue leads first")
+                sys.exit(1)
+            evaluator = LeadQualificationEvaluator()
+            key = criteria_key(criteria)
+            stats = run_worker(queue, lambda lead_data: evaluate_record(evaluator, criteria, key, lead_data))
+            print(f"\nWorker done: {stats['chunks']} chunks, {stats['leads']} leads, {stats['retried']} retried, "
+                  f"{stats['failed']} failed, {stats['lost']} lost leases")
+        if args.sink:
+            export_results(queue, args.sink, args.batch_size)
+        if args.status or args.work:
+            print_progress(queue)
+    finally:
+        queue.close()
+
+def main():
+    args = parse_args()
     
-    lead_data_path = sys.argv[1]
+    lead_data_path = args.lead_data
     
     # Read prompt from file if provided, otherwise use default
-    if len(sys.argv) >= 3:
-        criteria_prompt_path = sys.argv[2]
-        prompt = read_criteria_prompt(criteria_prompt_path)
+    if args.prompt:
+        prompt = read_criteria_prompt(args.prompt)
     else:
         prompt = get_default_prompt()
     
+    if args.queue:
+        run_queue(args, prompt)
+        return
+    
+    if args.sink:
+        write_results(lead_data_path, prompt, args.sink, args.batch_size, args.flush_interval)
+        return
+    
     # Read lead data
     lead_data = read_lead_data(lead_data_path)
     
@@ -0,0 +1,449 @@
+#!/usr/bin/env python
+"""
+Streaming qualification analytics per flow and tenant.
+
+Every completed evaluation updates in-memory aggregates for its flowId, its
+userId and the whole server: the number of evaluations per qualification
+status, a histogram of confidence scores, and Met / Unclear / Not Met counts
+per criterion. Aggregates are kept over rolling windows (the last hour, day
+and week by default) and since startup. A window is split into buckets with
+a running total; expired buckets are subtracted from the total as time
+moves on, so reading an aggregate never rescans evaluations.
+
+Aggregates live in the process that serves the API. With a shared SQLite
+store (several gunicorn or uvicorn workers), each process adds the counts
+of its evaluations to the stored buckets every few seconds and lookups read
+the sum of all processes from the store.
+"""
+import atexit
+import json
+import os
+import sqlite3
+import threading
+import time
+from collections import deque
+from typing import Any, Dict, Iterable, List, Optional, Sequence, Tuple
+
+from .results import STATUS_LABELS, CriterionStatus
+
+QUALIFICATION_STATUSES = ("Qualified", "Needs More Info", "Disqualified")
+HISTOGRAM_BINS = 10
+SCOPE_ALL = "all"
+SCOPE_FLOW = "flow"
+SCOPE_USER = "user"
+WINDOW_ALL = "all"
+DEFAULT_WINDOWS = (3600, 86400, 604800)
+
+_UNITS = ((86400, "d"), (3600, "h"), (60, "m"), (1, "s"))
+
+
+def window_name(seconds: int) -> str:
+    """
+    Return the name of a window length, e.g. 3600 -> "1h", 604800 -> "7d".
+    """
+    for unit, suffix in _UNITS:
+        if seconds % unit == 0:
+            return f"{seconds // unit}{suffix}"
+    return f"{seconds}s"
+
+
+class Aggregate:
+    """
+    Counts of a set of evaluations: per status, per confidence bin and per criterion outcome.
+    """
+    __slots__ = ("evaluations", "statuses", "confidence_bins", "confidence_sum", "criteria")
+
+    def __init__(self):
+        self.evaluations = 0
+        self.statuses = [0] * len(QUALIFICATION_STATUSES)
+        # Bin i counts confidence scores in [10 * i, 10 * i + 10), 100 falls in the last bin
+        self.confidence_bins = [0] * HISTOGRAM_BINS
+        self.confidence_sum = 0
+        # Criterion text -> counts indexed by status code (Not Met, Unclear, Met)
+        self.criteria: Dict[str, List[int]] = {}
+
+    def add(self, status_index: int, confidence: int, outcomes: Iterable[Tuple[str, int]], sign: int = 1) -> None:
+        """
+        Add (or with sign -1, remove) one evaluation.
+        """
+        self.evaluations += sign
+        self.statuses[status_index] += sign
+        self.confidence_bins[min(confidence * HISTOGRAM_BINS // 100, HISTOGRAM_BINS - 1)] += sign
+        self.confidence_sum += sign * confidence
+        for criterion, status in outcomes:
+            counts = self.criteria.get(criterion)
+            if counts is None:
+                counts = self.criteria[criterion] = [0] * len(STATUS_LABELS)
+            counts[status] += sign
+
+    def merge(self, other: "Aggregate", sign: int = 1) -> None:
+        """
+        Add (or with sign -1, remove) the counts of another aggregate.
+        """
+        self.evaluations += sign * other.evaluations
+        for index, count in enumerate(other.statuses):
+            self.statuses[index] += sign * count
+        for index, count in enumerate(other.confidence_bins):
+            self.confidence_bins[index] += sign * count
+        self.confidence_sum += sign * other.confidence_sum
+        for criterion, other_counts in other.criteria.items():
+            counts = self.criteria.setdefault(criterion, [0] * len(STATUS_LABELS))
+            for index, count in enumerate(other_counts):
+                counts[index] += sign * count
+            if not any(counts):
+                del self.criteria[criterion]
+
+    def to_dict(self) -> Dict[str, Any]:
+        """
+        Render the aggregate: counts, qualification rate, average confidence, histogram and
+        per-criterion met rates.
+        """
+        evaluations = self.evaluations
+        criteria = {}
+        for criterion, counts in self.criteria.items():
+            total = sum(counts)
+            criteria[criterion] = {
+                "evaluations": total,
+                **{STATUS_LABELS[status].lower().replace(" ", "_"): counts[status] for status in CriterionStatus},
+                "met_rate": round(counts[CriterionStatus.MET] / total, 4) if total else 0.0,
+            }
+        return {
+            "evaluations": evaluations,
+            "qualification_status": dict(zip(QUALIFICATION_STATUSES, self.statuses)),
+            "qualification_rate": round(self.statuses[0] / evaluations, 4) if evaluations else 0.0,
+            "average_confidence": round(self.confidence_sum / evaluations, 2) if evaluations else 0.0,
+            "confidence_histogram": list(self.confidence_bins),
+            "criteria": criteria,
+        }
+
+    def to_state(self) -> List[Any]:
+        return [self.evaluations, self.statuses, self.confidence_bins, self.confidence_sum, self.criteria]
+
+    @classmethod
+    def from_state(cls, state: List[Any]) -> "Aggregate":
+        aggregate = cls()
+        aggregate.evaluations, aggregate.statuses, aggregate.confidence_bins, aggregate.confidence_sum, \
+            aggregate.criteria = state
+        return aggregate
+
+
+class _Window:
+    """
+    Rolling window of a scope: buckets of equal length and their running total.
+    """
+    __slots__ = ("seconds", "bucket_seconds", "buckets", "total")
+
+    def __init__(self, seconds: int, bucket_count: int):
+        self.seconds = seconds
+        self.bucket_seconds = max(seconds / bucket_count, 1.0)
+        self.buckets: deque = deque()
+        self.total = Aggregate()
+
+    def expire(self, now: float) -> None:
+        """
+        Subtract the buckets that fell out of the window.
+        """
+        oldest = int((now - self.seconds) // self.bucket_seconds)
+        while self.buckets and self.buckets[0][0] <= oldest:
+            _, bucket = self.buckets.popleft()
+            self.total.merge(bucket, -1)
+
+    def add(self, now: float, status_index: int, confidence: int, outcomes: Sequence[Tuple[str, int]]) -> None:
+        self.expire(now)
+        bucket_id = int(now // self.bucket_seconds)
+        if not self.buckets or self.buckets[-1][0] != bucket_id:
+            self.buckets.append((bucket_id, Aggregate()))
+        self.buckets[-1][1].add(status_index, confidence, outcomes)
+        self.total.add(status_index, confidence, outcomes)
+
+
+class AnalyticsStore:
+    """
+    SQLite store of aggregate buckets, shared by the processes of a server.
+
+    A row holds the counts of a scope (scope, key) in one bucket of one window;
+    window 0 is the aggregate since the store was created.
+    """
+
+    def __init__(self, db_path: str):
+        """
+        Open (and create if needed) the store.
+
+        Args:
+            db_path (str): Path of the SQLite database file
+        """
+        self.db_path = db_path
+        self._lock = threading.Lock()
+        # Transactions are opened explicitly, so concurrent read-modify-write of a bucket is serialised
+        self._conn = sqlite3.connect(db_path, check_same_thread=False, timeout=30, isolation_level=None)
+        with self._lock:
+            self._conn.execute("PRAGMA journal_mode=WAL")
+            self._conn.execute("PRAGMA synchronous=NORMAL")
+            self._conn.execute("""
+                CREATE TABLE IF NOT EXISTS analytics_buckets (
+                    scope TEXT NOT NULL,
+                    key TEXT NOT NULL,
+                    window INTEGER NOT NULL,
+                    bucket_id INTEGER NOT NULL,
+                    state TEXT NOT NULL,
+                    PRIMARY KEY (scope, key, window, bucket_id)
+                ) WITHOUT ROWID
+            """)
+
+    def merge(self, deltas: Dict[Tuple[str, str, int, int], Aggregate], oldest: Dict[int, int]) -> None:
+        """
+        Add counts to the stored buckets and drop the buckets that fell out of their window.
+
+        Args:
+            deltas (Dict[Tuple[str, str, int, int], Aggregate]): Counts by (scope, key, window, bucket id)
+            oldest (Dict[int, int]): Last expired bucket id of every window length
+        """
+        with self._lock:
+            self._conn.execute("BEGIN IMMEDIATE")
+            try:
+                for (scope, key, window, bucket_id), delta in deltas.items():
+                    row = self._conn.execute(
+                        "SELECT state FROM analytics_buckets "
+                        "WHERE scope = ? AND key = ? AND window = ? AND bucket_id = ?",
+                        (scope, key, window, bucket_id)).fetchone()
+                    if row is not None:
+                        stored = Aggregate.from_state(json.loads(row[0]))
+                        stored.merge(delta)
+                        delta = stored
+                    self._conn.execute(
+                        "INSERT OR REPLACE INTO analytics_buckets (scope, key, window, bucket_id, state) "
+                        "VALUES (?, ?, ?, ?, ?)",
+                        (scope, key, window, bucket_id, json.dumps(delta.to_state(), ensure_ascii=False)))
+                for window, bucket_id in oldest.items():
+                    self._conn.execute("DELETE FROM analytics_buckets WHERE window = ? AND bucket_id <= ?",
+                                       (window, bucket_id))
+                self._conn.execute("COMMIT")
+            except BaseException:
+                self._conn.execute("ROLLBACK")
+                raise
+
+    def read(self, scope: str, key: str, oldest: Dict[int, int]) -> Tuple[Aggregate, Dict[int, Aggregate]]:
+        """
+        Return the aggregate since the store was created and the total of every window of a scope.
+
+        Args:
+            scope (str): Scope (SCOPE_ALL, SCOPE_FLOW or SCOPE_USER)
+            key (str): flowId or userId ('' for SCOPE_ALL)
+            oldest (Dict[int, int]): Last expired bucket id of every window length
+        """
+        with self._lock:
+            rows = self._conn.execute(
+                "SELECT window, bucket_id, state FROM analytics_buckets WHERE scope = ? AND key = ?",
+                (scope, key)).fetchall()
+        lifetime = Aggregate()
+        totals = {window: Aggregate() for window in oldest}
+        for window, bucket_id, state in rows:
+            if window == 0:
+                lifetime.merge(Aggregate.from_state(json.loads(state)))
+            elif window in totals and bucket_id > oldest[window]:
+                totals[window].merge(Aggregate.from_state(json.loads(state)))
+        return lifetime, totals
+
+    def close(self) -> None:
+        with self._lock:
+            self._conn.close()
+
+
+class QualificationAnalytics:
+    """
+    Aggregates of evaluations per scope (server, flowId, userId) and window, in memory
+    or, with a store, shared by the processes of a server.
+    """
+
+    def __init__(self, windows: Sequence[int] = DEFAULT_WINDOWS, bucket_count: int = 60,
+                 store: Optional[AnalyticsStore] = None):
+        """
+        Args:
+            windows (Sequence[int]): Lengths of the rolling windows, in seconds
+            bucket_count (int): Buckets per window; a window's start moves in steps of its length / bucket_count
+            store (AnalyticsStore, optional): Shared store; counts are then kept in memory only until flush()
+        """
+        self.windows = tuple(sorted(set(int(seconds) for seconds in windows)))
+        self.bucket_count = bucket_count
+        self.store = store
+        self._lock = threading.Lock()
+        # (scope, key) -> (aggregate since startup, {window seconds: _Window})
+        self._scopes: Dict[Tuple[str, str], Tuple[Aggregate, Dict[int, _Window]]] = {}
+        # With a store: counts not flushed yet, by (scope, key, window, bucket id), window 0 for the lifetime
+        self._pending: Dict[Tuple[str, str, int, int], Aggregate] = {}
+        self._flush_lock = threading.Lock()
+        self._stop = threading.Event()
+        self._flush_thread: Optional[threading.Thread] = None
+
+    def _scope(self, scope: str, key: str) -> Tuple[Aggregate, Dict[int, _Window]]:
+        entry = self._scopes.get((scope, key))
+        if entry is None:
+            entry = self._scopes[(scope, key)] = (
+                Aggregate(), {seconds: _Window(seconds, self.bucket_count) for seconds in self.windows})
+        return entry
+
+    def _bucket_seconds(self, seconds: int) -> float:
+        return max(seconds / self.bucket_count, 1.0)
+
+    def _oldest(self, now: float) -> Dict[int, int]:
+        """
+        Return the last expired bucket id of every window at a time.
+        """
+        return {seconds: int((now - seconds) // self._bucket_seconds(seconds)) for seconds in self.windows}
+
+    def record(self, flow_id: str, user_id: str, qualification_status: str, confidence_score: int,
+               outcomes: Sequence[Tuple[str, int]], timestamp: Optional[float] = None) -> None:
+        """
+        Add a completed evaluation to the aggregates of the server, its flow and its user.
+
+        Args:
+            flow_id (str): flowId of the lead ('' when unknown)
+            user_id (str): userId of the lead ('' when unknown)
+            qualification_status (str): Overall outcome, one of QUALIFICATION_STATUSES
+            confidence_score (int): Confidence score (0-100)
+            outcomes (Sequence[Tuple[str, int]]): (criterion text, status code) of every criterion
+            timestamp (float, optional): Completion time, now by default
+        """
+        if qualification_status not in QUALIFICATION_STATUSES:
+            return
+        status_index = QUALIFICATION_STATUSES.index(qualification_status)
+        confidence = max(0, min(100, int(confidence_score)))
+        now = time.time() if timestamp is None else timestamp
+        scopes = [(SCOPE_ALL, "")]
+        if flow_id:
+            scopes.append((SCOPE_FLOW, flow_id))
+        if user_id:
+            scopes.append((SCOPE_USER, user_id))
+        with self._lock:
+            for scope, key in scopes:
+                if self.store is None:
+                    lifetime, windows = self._scope(scope, key)
+                    lifetime.add(status_index, confidence, outcomes)
+                    for window in windows.values():
+                        window.add(now, status_index, confidence, outcomes)
+                    continue
+                buckets = [(0, 0)] + [(seconds, int(now // self._bucket_seconds(seconds))) for seconds in self.windows]
+                for window, bucket_id in buckets:
+                    pending = self._pending.get((scope, key, window, bucket_id))
+                    if pending is None:
+                        pending = self._pending[(scope, key, window, bucket_id)] = Aggregate()
+                    pending.add(status_index, confidence, outcomes)
+
+    def summary(self, scope: str = SCOPE_ALL, key: str = "", window: Optional[str] = None) -> Dict[str, Any]:
+        """
+        Return the aggregates of a scope, for every window or for one window name ("1h", ..., "all").
+        With a store, the counts of the other processes are included up to their last flush.
+
+        Raises:
+            ValueError: When the window is unknown
+        """
+        names = {window_name(seconds): seconds for seconds in self.windows}
+        if window is not None and window != WINDOW_ALL and window not in names:
+            raise ValueError(f"Unknown window '{window}', expected one of: {', '.join([*names, WINDOW_ALL])}")
+        now = time.time()
+        if self.store is not None:
+            # Flush first so the evaluations of this process are counted
+            self.flush(now)
+            lifetime, totals = self.store.read(scope, key, self._oldest(now))
+            return self._render(scope, key, window, now, lifetime, totals)
+        with self._lock:
+            entry = self._scopes.get((scope, key))
+            lifetime, windows = entry if entry is not None else (Aggregate(), {})
+            totals = {}
+            for seconds, rolling in windows.items():
+                rolling.expire(now)
+                totals[seconds] = rolling.total
+            return self._render(scope, key, window, now, lifetime, totals)
+
+    def _render(self, scope: str, key: str, window: Optional[str], now: float, lifetime: Aggregate,
+                totals: Dict[int, Aggregate]) -> Dict[str, Any]:
+        result = {}
+        for seconds in self.windows:
+            name = window_name(seconds)
+            if window in (None, name):
+                result[name] = totals.get(seconds, Aggregate()).to_dict()
+        if window in (None, WINDOW_ALL):
+            result[WINDOW_ALL] = lifetime.to_dict()
+        return {"scope": scope, "key": key, "generated_at": now, "windows": result}
+
+    def flush(self, now: Optional[float] = None) -> None:
+        """
+        Add the counts recorded since the last flush to the store (no-op without a store).
+        """
+        if self.store is None:
+            return
+        with self._flush_lock:
+            with self._lock:
+                pending, self._pending = self._pending, {}
+            try:
+                self.store.merge(pending, self._oldest(time.time() if now is None else now))
+            except Exception:
+                # Keep the counts for the next flush
+                with self._lock:
+                    for bucket_key, delta in pending.items():
+                        current = self._pending.get(bucket_key)
+                        if current is None:
+                            self._pending[bucket_key] = delta
+                        else:
+                            current.merge(delta)
+                raise
+
+    def start_flushing(self, interval: float = 5) -> None:
+        """
+        Flush to the store every interval seconds in a daemon thread.
+        """
+        def flush_loop():
+            while not self._stop.wait(interval):
+                try:
+                    self.flush()
+                except sqlite3.Error as e:
+                    print(f"Could not flush analytics: {e}")
+
+        self._flush_thread = threading.Thread(target=flush_loop, name="analytics-flush", daemon=True)
+        self._flush_thread.start()
+
+    def stop(self) -> None:
+        """
+        Stop the flush thread and flush the remaining counts, so none are lost on shutdown.
+        """
+        self._stop.set()
+        if self._flush_thread is not None:
+            self._flush_thread.join()
+            self._flush_thread = None
+        self.flush()
+
+
+def outcomes_from_body(body: Dict[str, Any], criteria: Optional[Sequence[str]] = None) -> List[Tuple[str, int]]:
+    """
+    Return the (criterion text, status code) pairs of a rendered evaluation result, verbose
+    ("criteria_evaluation") or compact ("criteria_status", with its "criteria" or the given list).
+    """
+    if "criteria_status" in body:
+        return list(zip(body.get("criteria") or criteria or (), body["criteria_status"]))
+    outcomes = []
+    for criterion, evaluation in body.get("criteria_evaluation", {}).items():
+        label = evaluation.split(" - ", 1)[0]
+        if label in STATUS_LABELS:
+            outcomes.append((criterion, STATUS_LABELS.index(label)))
+    return outcomes
+
+
+def analytics_from_env() -> Optional[QualificationAnalytics]:
+    """
+    Build the analytics configured by LEAD_ANALYTICS (enabled unless "0"), LEAD_ANALYTICS_WINDOWS
+    (comma-separated seconds, default "3600,86400,604800"), LEAD_ANALYTICS_DB (store shared by the
+    processes of the server, none by default) and LEAD_ANALYTICS_FLUSH_INTERVAL (default 5 seconds),
+    or return None when disabled.
+    """
+    if os.getenv("LEAD_ANALYTICS", "1").lower() in ("0", "false", "no"):
+        return None
+    windows = os.getenv("LEAD_ANALYTICS_WINDOWS", "")
+    db_path = os.getenv("LEAD_ANALYTICS_DB", "")
+    analytics = QualificationAnalytics(
+        [int(seconds) for seconds in windows.split(",") if seconds.strip()] if windows else DEFAULT_WINDOWS,
+        store=AnalyticsStore(db_path) if db_path else None)
+    if analytics.store is not None:
+        analytics.start_flushing(float(os.getenv("LEAD_ANALYTICS_FLUSH_INTERVAL", "5")))
+        # The counts of the last interval are written on exit
+        atexit.register(analytics.stop)
+    return analytics
@@ -3,14 +3,482 @@ from flask import Flask, request, jsonify
 import json
 import os
 import sys
+import threading
+import time
 
 # Add project root directory to sys.path for easier imports
 sys.path.append(os.path.dirname(os.path.dirname(os.path.dirname(os.path.abspath(__file__)))))
 
-from src.argent_qualify_lead6.call_quality_evaluator import evaluate_lead_qualification
+from src.argent_qualify_lead6.analytics import SCOPE_ALL, SCOPE_FLOW, SCOPE_USER, analytics_from_env
+from src.argent_qualify_lead6.call_quality_evaluator import LeadQualificationEvaluator
+from src.argent_qualify_lead6.compression import (
+    MIN_COMPRESS_SIZE, BodyTooLarge, InvalidBody, UnsupportedEncoding, choose_encoding, compress_body, compress_stream,
+    decode_body,
+)
+from src.argent_qualify_lead6.criterion_store import criterion_store_from_env, diff_criteria, transcript_hash
+from src.argent_qualify_lead6.dedup import reuse_index_from_env
+from src.argent_qualify_lead6.delivery import delivery_from_env
+from src.argent_qualify_lead6.engines import (
+    CriteriaEngine, UnknownEngine, available_engines, get_engine, register_engine, run_engines
+)
+from src.argent_qualify_lead6.features import TranscriptFeatures
+from src.argent_qualify_lead6.jobs import JobQueueFull, job_manager_from_env
+from src.argent_qualify_lead6.metrics import registry
+from src.argent_qualify_lead6.profiling import attach_profile, profile_call, requested_profile
+from src.argent_qualify_lead6.prompt_registry import PromptNotFound, prompt_registry_from_env
+from src.argent_qualify_lead6.results import FORMAT_COMPACT, RESULT_FORMATS
+from src.argent_qualify_lead6.scheduling import LANE_BATCH, LANE_REALTIME, LANES
+from src.argent_qualify_lead6.transcript_index import transcript_index_from_env
+from src.argent_qualify_lead6.warmup import liveness, readiness, warm_up
 
 app = Flask(__name__)
 
+_job_manager = None
+_job_manager_lock = threading.Lock()
+_prompt_registry = None
+_prompt_registry_lock = threading.Lock()
+_reuse_index = None
+_reuse_index_lock = threading.Lock()
+_criterion_store = None
+_criterion_store_lock = threading.Lock()
+_transcript_index = None
+_transcript_index_lock = threading.Lock()
+_analytics = None
+_analytics_lock = threading.Lock()
+_result_delivery = None
+_result_delivery_lock = threading.Lock()
+
+# Request handling shared by the Flask app and the ASGI app (asgi.py). Parsers
+# return (arguments, None) on success and (None, (error body, status code)) otherwise.
+
+def _error_result(error, notes):
+    """Build an error response following the evaluation result schema."""
+    return {
+        "error": error,
+        "qualification_status": "Needs More Info",
+        "confidence_score": 0,
+        "criteria_evaluation": {},
+        "notes": notes
+    }
+
+def get_prompt_registry():
+    """Return the process prompt registry, opening it on first use."""
+    global _prompt_registry
+    with _prompt_registry_lock:
+        if _prompt_registry is None:
+            _prompt_registry = prompt_registry_from_env()
+        return _prompt_registry
+
+def get_reuse_index():
+    """Return the process index of evaluated transcripts (None unless LEAD_DEDUP is enabled)."""
+    global _reuse_index
+    with _reuse_index_lock:
+        if _reuse_index is None:
+            _reuse_index = reuse_index_from_env() or False
+        return _reuse_index or None
+
+def get_criterion_store():
+    """Return the process store of per-criterion outcomes (None unless LEAD_CRITERIA_DB is set)."""
+    global _criterion_store
+    with _criterion_store_lock:
+        if _criterion_store is None:
+            _criterion_store = criterion_store_from_env() or False
+        return _criterion_store or None
+
+def get_transcript_index():
+    """Return the process index of evaluated leads (None unless LEAD_INDEX_DB is set)."""
+    global _transcript_index
+    with _transcript_index_lock:
+        if _transcript_index is None:
+            _transcript_index = transcript_index_from_env() or False
+        return _transcript_index or None
+
+def get_analytics():
+    """Return the process qualification analytics (None when LEAD_ANALYTICS is "0")."""
+    global _analytics
+    with _analytics_lock:
+        if _analytics is None:
+            _analytics = analytics_from_env() or False
+        return _analytics or None
+
+def disable_analytics():
+    """
+    Turn off analytics in this process, e.g. in process pool workers (see init_pool_worker).
+    """
+    global _analytics
+    with _analytics_lock:
+        _analytics = False
+
+def get_result_delivery():
+    """Return the process webhook delivery of results (None unless LEAD_WEBHOOK_URLS is set)."""
+    global _result_delivery
+    with _result_delivery_lock:
+        if _result_delivery is None:
+            _result_delivery = delivery_from_env() or False
+        return _result_delivery or None
+
+def init_pool_worker():
+    """
+    Initializer of process pools: their workers return their results to the parent,
+    which keeps the analytics and delivers the results.
+
+    Forked workers also drop the stores inherited from the parent, whose SQLite
+    connections must not be used across fork, and get new locks, which a parent
+    thread may have held when the worker was forked. Each worker opens its own
+    stores on first use.
+    """
+    global _prompt_registry, _prompt_registry_lock, _reuse_index, _reuse_index_lock
+    global _criterion_store, _criterion_store_lock, _transcript_index, _transcript_index_lock
+    global _analytics, _analytics_lock, _result_delivery, _result_delivery_lock
+    _prompt_registry, _prompt_registry_lock = None, threading.Lock()
+    _reuse_index, _reuse_index_lock = None, threading.Lock()
+    _criterion_store, _criterion_store_lock = None, threading.Lock()
+    _transcript_index, _transcript_index_lock = None, threading.Lock()
+    _analytics, _analytics_lock = False, threading.Lock()
+    _result_delivery, _result_delivery_lock = False, threading.Lock()
+
+def deliver_result(lead, result):
+    """
+    Queue the result (EvaluationResult or rendered body) of a lead for webhook delivery, when
+    enabled. The lead is its document, or a {"lead_id", "user_id", "flow_id"} record.
+    """
+    delivery = get_result_delivery()
+    if delivery is not None:
+        ids = lead if "lead_id" in lead else {name: _oid(lead, field) for name, field in
+                                              (("lead_id", "_id"), ("user_id", "userId"), ("flow_id", "flowId"))}
+        delivery.submit({"lead_id": ids.get("lead_id", ""), "user_id": ids.get("user_id", ""),
+                         "flow_id": ids.get("flow_id", ""), "evaluated_at": time.time(), "result": result})
+
+def record_analytics(lead_data, qualification_status, confidence_score, outcomes):
+    """Add a completed evaluation to the analytics of its flowId and userId, when enabled."""
+    analytics = get_analytics()
+    if analytics is not None:
+        analytics.record(_oid(lead_data, "flowId"), _oid(lead_data, "userId"), qualification_status,
+                         confidence_score, outcomes)
+
+def record_evaluated_leads(evaluated):
+    """
+    Keep the evaluated lead documents, as (lead document, transcript, EvaluationResult) triples,
+    for re-scoring (criterion store), queries (transcript index), analytics and webhook
+    delivery, when enabled.
+    """
+    store = get_criterion_store()
+    if store is not None:
+        store.remember_leads([(lead_data, transcript) for lead_data, transcript, _ in evaluated])
+    index = get_transcript_index()
+    if index is not None:
+        for lead_data, transcript, result in evaluated:
+            index.add(lead_data, transcript, result)
+    for lead_data, _, result in evaluated:
+        record_analytics(lead_data, result.qualification_status, result.confidence_score,
+                         list(zip(result.criteria, result.statuses)))
+        deliver_result(lead_data, result)
+
+def _evaluate_result(evaluator, criteria, transcript, lead_data=None, features=None):
+    """
+    Evaluate a transcript, reusing stored per-criterion outcomes and the outcomes of a
+    (near-)duplicate when enabled. With a criterion store, the outcomes scored here are
+    stored; the lead document, when given, is recorded (see record_evaluated_leads).
+    Preprocessed features shared with other engines are used when given.
+    """
+    store = get_criterion_store()
+    known = None
+    if store is not None:
+        digest = transcript_hash(transcript)
+        known = store.known(criteria, digest)
+    reuse_index = get_reuse_index()
+    if known:
+        result = evaluator.evaluate_result(criteria, transcript, known=known, features=features)
+    elif reuse_index is None:
+        result = evaluator.evaluate_result(criteria, transcript, features=features)
+    else:
+        result = reuse_index.evaluate(evaluator, criteria, transcript, features)
+    if store is not None:
+        store.save(result, digest)
+    if lead_data is not None:
+        record_evaluated_leads([(lead_data, transcript, result)])
+    else:
+        record_analytics(None, result.qualification_status, result.confidence_score,
+                         list(zip(result.criteria, result.statuses)))
+    return result
+
+def _criteria_engine_result(criteria, features):
+    """Evaluation function of the criteria engine, with the reuse, storage and analytics of the API."""
+    return _evaluate_result(LeadQualificationEvaluator(), criteria, features.transcript, features.lead_data, features)
+
+register_engine(CriteriaEngine(_criteria_engine_result))
+
+def resolve_prompt(request_data, flow_id=""):
+    """
+    Return (prompt, criteria, prompt info) for a body carrying 'prompt', or 'prompt_id'
+    (and optionally 'prompt_version'), falling back to the prompt registered for flow_id.
+    
+    The prompt text is returned as is (criteria None); registered prompts come with
+    their pre-extracted criteria and {"prompt_id", "prompt_version"} (prompt None).
+    Raises PromptNotFound when no registered prompt matches.
+    """
+    if 'prompt' in request_data:
+        return request_data['prompt'], None, None
+    if request_data.get('prompt_id'):
+        version = request_data.get('prompt_version')
+        if version is not None:
+            try:
+                version = int(version)
+            except (TypeError, ValueError):
+                raise PromptNotFound(f"Invalid prompt_version '{version}'")
+        record = get_prompt_registry().get(request_data['prompt_id'], version)
+    elif flow_id:
+        record = get_prompt_registry().for_flow(flow_id)
+    else:
+        raise PromptNotFound("No 'prompt' or 'prompt_id' given and no flowId to resolve a prompt from")
+    return None, record['criteria'], {"prompt_id": record['prompt_id'], "prompt_version": record['version']}
+
+def _parse_result_format(request_data):
+    """Return (result format, None), or (None, (error body, status code)) for an unknown 'format'."""
+    result_format = request_data.get('format')
+    if result_format is not None and result_format not in RESULT_FORMATS:
+        return None, (_error_result(f"Unknown format '{result_format}', expected one of: {', '.join(RESULT_FORMATS)}",
+                                    "Invalid format."), 400)
+    return result_format, None
+
+def _parse_engines(request_data):
+    """
+    Return (engine names or None, None), or (None, (error body, status code)) for an invalid 'engines'.
+    
+    None (no 'engines') selects the default response of the criteria evaluator.
+    """
+    engines = request_data.get('engines')
+    if engines is None:
+        return None, None
+    if not isinstance(engines, list) or not engines or not all(isinstance(name, str) for name in engines):
+        return None, (_error_result("'engines' must be a non-empty list of engine names", "Invalid engines."), 400)
+    try:
+        for name in engines:
+            get_engine(name)
+    except UnknownEngine as e:
+        return None, (_error_result(str(e), "Invalid engines."), 400)
+    return engines, None
+
+def _uses_criteria(engines):
+    """Return True when the selected engines (None for the default) score the criteria of a prompt."""
+    return engines is None or any(get_engine(name).uses_criteria for name in engines)
+
+def parse_evaluate_lead_request(request_data):
+    """Validate a /api/evaluate-lead body and return the keyword arguments of evaluate_lead_dict."""
+    if not request_data or 'transcript' not in request_data:
+        return None, (_error_result("Missing required fields 'prompt' (or 'prompt_id') and/or 'transcript'",
+                                    "Missing required data."), 400)
+    engines, error = _parse_engines(request_data)
+    if error:
+        return None, error
+    if _uses_criteria(engines) and 'prompt' not in request_data and 'prompt_id' not in request_data:
+        return None, (_error_result("Missing required fields 'prompt' (or 'prompt_id') and/or 'transcript'",
+                                    "Missing required data."), 400)
+    result_format, error = _parse_result_format(request_data)
+    if error:
+        return None, error
+    prompt, criteria, prompt_info = "", [], None
+    try:
+        if _uses_criteria(engines):
+            prompt, criteria, prompt_info = resolve_prompt(request_data)
+    except PromptNotFound as e:
+        return None, (_error_result(str(e), "Unknown prompt."), 404)
+    return {"prompt": prompt, "transcript": request_data['transcript'], "criteria": criteria,
+            "prompt_info": prompt_info, "result_format": result_format, "engines": engines}, None
+
+def parse_evaluate_lead_from_data_request(request_data):
+    """Validate a /api/evaluate-lead-from-data body and return the keyword arguments of evaluate_lead_dict."""
+    if not request_data or 'data' not in request_data:
+        return None, (_error_result("Missing required fields 'prompt' and/or 'data'", "Missing required data."), 400)
+    
+    lead_data = request_data['data']
+    if "leadData" not in lead_data or "transcript" not in lead_data["leadData"]:
+        return None, (_error_result("Missing transcript in leadData", "Missing transcript in lead data."), 400)
+    
+    engines, error = _parse_engines(request_data)
+    if error:
+        return None, error
+    result_format, error = _parse_result_format(request_data)
+    if error:
+        return None, error
+    prompt, criteria, prompt_info = "", [], None
+    try:
+        if _uses_criteria(engines):
+            # Without 'prompt' or 'prompt_id', use the prompt registered for the lead's flow
+            prompt, criteria, prompt_info = resolve_prompt(request_data, _oid(lead_data, "flowId"))
+    except PromptNotFound as e:
+        return None, (_error_result(str(e), "Unknown prompt."), 404)
+    
+    lead_id = lead_data.get("_id", {}).get("$oid", "") if "_id" in lead_data else ""
+    return {"prompt": prompt, "transcript": lead_data["leadData"]["transcript"], "criteria": criteria,
+            "prompt_info": prompt_info, "result_format": result_format, "lead_id": lead_id,
+            "lead_data": lead_data, "engines": engines}, None
+
+def evaluate_lead_dict(prompt, transcript, criteria=None, prompt_info=None, result_format=None, lead_id=None,
+                       lead_data=None, engines=None):
+    """
+    Evaluate a lead and return the result as a dict (module-level so it can run in a process pool).
+    
+    Pre-extracted criteria (of a registered prompt) are used instead of parsing the prompt.
+    The compact format lists the criteria texts unless they come from a registered prompt.
+    The lead document, when given, is remembered for re-scoring by the criterion store.
+    With engines, the selected engines run on one shared preprocessing of the transcript
+    and their results are returned under "engines", by engine name.
+    """
+    evaluator = LeadQualificationEvaluator()
+    if criteria is None:
+        criteria = evaluator.extract_criteria_from_prompt(prompt)
+    if engines is not None:
+        features = TranscriptFeatures(transcript, lead_data)
+        result = {"engines": run_engines(engines, features, criteria if _uses_criteria(engines) else None,
+                                         result_format, include_criteria=prompt_info is None)}
+    else:
+        result = _evaluate_result(evaluator, criteria, transcript, lead_data).to_dict(
+            result_format, include_criteria=prompt_info is None)
+    result.update(prompt_info or {})
+    if lead_id is not None:
+        result["lead_id"] = lead_id
+    return result
+
+def parse_evaluate_lead_batch_request(request_data):
+    """
+    Validate a /api/evaluate-lead-batch body and return the batch arguments:
+    the criteria (extracted once for the whole batch), prompt info, result format and leads.
+    """
+    if not request_data or 'leads' not in request_data:
+        return None, (_error_result("Missing required fields 'prompt' (or 'prompt_id') and/or 'leads'",
+                                    "Missing required data."), 400)
+    if not isinstance(request_data['leads'], list):
+        return None, (_error_result("'leads' must be a list of lead documents", "Invalid leads."), 400)
+
+    result_format, error = _parse_result_format(request_data)
+    if error:
+        return None, error
+    leads = request_data['leads']
+    try:
+        # Without 'prompt' or 'prompt_id', use the prompt registered for the flow of the first lead
+        prompt, criteria, prompt_info = resolve_prompt(request_data, _oid(leads[0], "flowId") if leads else "")
+    except PromptNotFound as e:
+        return None, (_error_result(str(e), "Unknown prompt."), 404)
+    if criteria is None:
+        criteria = LeadQualificationEvaluator().extract_criteria_from_prompt(prompt)
+    return {"criteria": criteria, "prompt_info": prompt_info, "result_format": result_format, "leads": leads}, None
+
+def lead_transcript(lead_data):
+    """Return the transcript of a lead document, or None when it has none."""
+    if isinstance(lead_data, dict) and "transcript" in lead_data.get("leadData", {}):
+        return lead_data["leadData"]["transcript"]
+    return None
+
+def batch_lead_result(lead_data, result=None, prompt_info=None, result_format=None):
+    """
+    Render the result of one lead of a batch from its EvaluationResult (None for a lead without transcript).
+
+    Compact results leave out the criteria and prompt info, which the batch lists once.
+    """
+    if result is None:
+        body = _error_result("Missing transcript in leadData", "Missing transcript in lead data.")
+    else:
+        body = result.to_dict(result_format)
+        if result_format != FORMAT_COMPACT:
+            body.update(prompt_info or {})
+    body["lead_id"] = _oid(lead_data, "_id")
+    return body
+
+def evaluate_batch_lead(criteria, lead_data, prompt_info=None, result_format=None):
+    """Evaluate one lead document of a batch (module-level so it can run in a process pool)."""
+    transcript = lead_transcript(lead_data)
+    try:
+        result = None if transcript is None else _evaluate_result(LeadQualificationEvaluator(), criteria, transcript,
+                                                                  lead_data)
+    except Exception as e:
+        return {**_error_result(str(e), f"Error: {str(e)}"), "lead_id": _oid(lead_data, "_id")}
+    return batch_lead_result(lead_data, result, prompt_info, result_format)
+
+def batch_header(args):
+    """Return the first NDJSON line of a compact batch, {"criteria": [...], prompt info}, or None."""
+    if args['result_format'] != FORMAT_COMPACT:
+        return None
+    return {"criteria": args['criteria'], **(args['prompt_info'] or {})}
+
+def ndjson_line(document):
+    """Serialise a document as one NDJSON line."""
+    return (json.dumps(document, ensure_ascii=False) + "\n").encode("utf-8")
+
+def iter_batch_ndjson(args):
+    """Evaluate the leads of a batch one by one, yielding each result as an NDJSON line."""
+    header = batch_header(args)
+    if header is not None:
+        yield ndjson_line(header)
+    for lead_data in args['leads']:
+        yield ndjson_line(evaluate_batch_lead(args['criteria'], lead_data, args['prompt_info'], args['result_format']))
+
+def evaluate_lead_profiled(args):
+    """Evaluate a lead under the profiler and return (result, profile report) (module-level for process pools)."""
+    return profile_call(evaluate_lead_dict, **args)
+
+def profile_context(route, request_data):
+    """Return the request information stored with a profile report."""
+    lead_data = request_data.get('data') if isinstance(request_data.get('data'), dict) else {}
+    return {
+        "route": route,
+        "user_id": _oid(lead_data, "userId"),
+        "flow_id": _oid(lead_data, "flowId"),
+        "prompt_id": request_data.get('prompt_id', ""),
+    }
+
+def _profiled_response(args, profile_mode, route, request_data):
+    """Evaluate under the profiler and return the Flask response with the report attached."""
+    result, report = evaluate_lead_profiled(args)
+    headers = attach_profile(result, report, profile_mode, profile_context(route, request_data))
+    response = jsonify(result)
+    response.headers.update(headers)
+    return response
+
+def _request_json():
+    """
+    Return the JSON body of the Flask request, decompressing it according to its
+    Content-Encoding (gzip, or zstd when available). Returns None for a missing or invalid body.
+    """
+    data = decode_body(request.get_data(cache=False), request.headers.get('Content-Encoding'))
+    try:
+        return json.loads(data) if data else None
+    except ValueError:
+        return None
+
+@app.errorhandler(UnsupportedEncoding)
+def unsupported_encoding(e):
+    return jsonify({"error": str(e)}), 415
+
+@app.errorhandler(BodyTooLarge)
+def body_too_large(e):
+    return jsonify({"error": str(e)}), 413
+
+@app.errorhandler(InvalidBody)
+def invalid_body(e):
+    return jsonify({"error": str(e)}), 400
+
+@app.after_request
+def compress_response(response):
+    """
+    Compress the response with the best encoding of the request's Accept-Encoding.
+    Streamed (NDJSON) responses are compressed chunk by chunk as they are produced.
+    """
+    encoding = choose_encoding(request.headers.get('Accept-Encoding'))
+    if encoding is None or 'Content-Encoding' in response.headers or response.direct_passthrough:
+        return response
+    if response.is_streamed:
+        response.response = compress_stream(response.response, encoding)
+        response.headers.pop('Content-Length', None)
+    else:
+        data = response.get_data()
+        if len(data) < MIN_COMPRESS_SIZE:
+            return response
+        response.set_data(compress_body(data, encoding))
+    response.headers['Content-Encoding'] = encoding
+    response.vary.add('Accept-Encoding')
+    return response
+
 @app.route('/api/evaluate-lead', methods=['POST'])
 def evaluate_lead():
     """
@@ -18,8 +486,11 @@ def evaluate_lead():
     
     Request:
     {
-        "prompt": "Business prompt containing lead evaluation criteria",
-        "transcript": "Call conversation content to evaluate"
+        "prompt": "Business prompt containing lead evaluation criteria",  // Or "prompt_id" of a registered prompt
+        "prompt_version": 2,  // Optional, with "prompt_id". Defaults to the latest version
+        "transcript": "Call conversation content to evaluate",
+        "format": "verbose | compact",  // Optional, defaults to verbose
+        "engines": ["criteria", "bant"]  // Optional, see below
     }
     
     Response: JSON with format:
@@ -30,41 +501,42 @@ def evaluate_lead():
             "Criterion 1": "Met/Not Met/Unclear - brief explanation",
             "Criterion 2": "Met/Not Met/Unclear - brief explanation"
         },
-        "notes": "Additional observations"
+        "notes": "Additional observations",
+        "prompt_id": "...", "prompt_version": 2  // When a registered prompt was used
     }
+    
+    Compact format:
+    {
+        "qualification_status": "Qualified/Disqualified/Needs More Info",
+        "confidence_score": 0-100,
+        "criteria_status": [2, 0, 1],  // Status code per criterion index: 0 Not Met, 1 Unclear, 2 Met
+        "criteria_score": [100, 0, 33],
+        "criteria": ["Criterion 1", ...]  // Only when the prompt text was sent
+    }
+    
+    With "engines" (see /api/engines), the selected engines run on one shared preprocessing
+    of the transcript and the response is {"engines": {"criteria": {...}, "bant": {...}}};
+    a prompt is only required when an engine scoring criteria is selected.
+    
+    With LEAD_PROFILING enabled, the header "X-Lead-Profile: inline" adds a "profile"
+    report (total time, time per phase, top functions) to the response, and
+    "X-Lead-Profile: store" saves it to LEAD_PROFILE_DIR and returns its id in X-Lead-Profile-Id.
     """
+    request_data = _request_json()
     try:
-        # Get data from request
-        request_data = request.json
-        
-        if not request_data or 'prompt' not in request_data or 'transcript' not in request_data:
-            return jsonify({
-                "error": "Missing required fields 'prompt' and/or 'transcript'",
-                "qualification_status": "Needs More Info",
-                "confidence_score": 0,
-                "criteria_evaluation": {},
-                "notes": "Missing required data."
-            }), 400
-            
-        # Get prompt and transcript
-        prompt = request_data['prompt']
-        transcript = request_data['transcript']
-        
-        # Evaluate lead qualification
-        result_json = evaluate_lead_qualification(prompt, transcript)
-        result_dict = json.loads(result_json)
+        # Validate request and get prompt (or registered criteria) and transcript
+        args, error = parse_evaluate_lead_request(request_data)
+        if error:
+            return jsonify(error[0]), error[1]
         
-        # Return result
-        return jsonify(result_dict)
+        # Evaluate lead qualification, under the profiler when the request asks for it
+        profile_mode = requested_profile(request.headers)
+        if profile_mode:
+            return _profiled_response(args, profile_mode, '/api/evaluate-lead', request_data)
+        return jsonify(evaluate_lead_dict(**args))
         
     except Exception as e:
-        return jsonify({
-            "error": str(e),
-            "qualification_status": "Needs More Info",
-            "confidence_score": 0,
-            "criteria_evaluation": {},
-            "notes": f"Error: {str(e)}"
-        }), 500
+        return jsonify(_error_result(str(e), f"Error: {str(e)}")), 500
 
 @app.route('/api/evaluate-lead-from-data', methods=['POST'])
 def evaluate_lead_from_data():
@@ -73,7 +545,8 @@ def evaluate_lead_from_data():
     
     Request:
     {
-        "prompt": "Business prompt containing lead evaluation criteria",
+        "prompt": "Business prompt containing lead evaluation criteria",  // Optional, see below
+        "prompt_id": "...",  // Registered prompt, used when "prompt" is absent
         "data": {
             "_id": { "$oid": "..." }, // Optional
             "leadData": {
@@ -82,6 +555,8 @@ def evaluate_lead_from_data():
         }
     }
     
+    Without "prompt" or "prompt_id", the latest prompt registered for the lead's flowId is used.
+    
     Response: JSON with format:
     {
         "qualification_status": "Qualified/Disqualified/Needs More Info",
@@ -93,54 +568,454 @@ def evaluate_lead_from_data():
         "notes": "Additional observations",
         "lead_id": "Lead ID (if available)"
     }
+    
+    With "format": "compact", the compact format of /api/evaluate-lead plus "lead_id".
+    Supports the X-Lead-Profile header like /api/evaluate-lead.
     """
+    request_data = _request_json()
     try:
-        # Get data from request
-        request_data = request.json
+        # Validate request and get prompt (or registered criteria), transcript and lead id
+        args, error = parse_evaluate_lead_from_data_request(request_data)
+        if error:
+            return jsonify(error[0]), error[1]
         
-        if not request_data or 'prompt' not in request_data or 'data' not in request_data:
-            return jsonify({
-                "error": "Missing required fields 'prompt' and/or 'data'",
-                "qualification_status": "Needs More Info",
-                "confidence_score": 0,
-                "criteria_evaluation": {},
-                "notes": "Missing required data."
-            }), 400
-            
-        # Get prompt and lead data
-        prompt = request_data['prompt']
-        lead_data = request_data['data']
-        
-        # Get transcript from lead data
-        if "leadData" in lead_data and "transcript" in lead_data["leadData"]:
-            transcript = lead_data["leadData"]["transcript"]
-        else:
-            return jsonify({
-                "error": "Missing transcript in leadData",
-                "qualification_status": "Needs More Info",
-                "confidence_score": 0,
-                "criteria_evaluation": {},
-                "notes": "Missing transcript in lead data."
-            }), 400
-        
-        # Evaluate lead qualification
-        result_json = evaluate_lead_qualification(prompt, transcript)
-        result_dict = json.loads(result_json)
-        
-        # Add lead information to the result
-        result_dict["lead_id"] = lead_data.get("_id", {}).get("$oid", "") if "_id" in lead_data else ""
-        
-        # Return result
-        return jsonify(result_dict)
+        # Evaluate lead qualification and add lead information to the result
+        profile_mode = requested_profile(request.headers)
+        if profile_mode:
+            return _profiled_response(args, profile_mode, '/api/evaluate-lead-from-data', request_data)
+        return jsonify(evaluate_lead_dict(**args))
         
     except Exception as e:
-        return jsonify({
-            "error": str(e),
-            "qualification_status": "Needs More Info",
-            "confidence_score": 0,
-            "criteria_evaluation": {},
-            "notes": f"Error: {str(e)}"
-        }), 500
+        return jsonify(_error_result(str(e), f"Error: {str(e)}")), 500
+
+@app.route('/api/evaluate-lead-batch', methods=['POST'])
+def evaluate_lead_batch():
+    """
+    API endpoint to evaluate many leads against one prompt, streaming the results.
+
+    Request:
+    {
+        "prompt": "Business prompt containing lead evaluation criteria",  // Or "prompt_id", or omitted to use
+                                                                          // the prompt registered for the flow
+        "leads": [{"_id": {"$oid": "..."}, "leadData": {"transcript": "..."}}, ...],
+        "format": "verbose | compact"  // Optional, defaults to verbose
+    }
+
+    Response: application/x-ndjson, one line per lead in request order, written as
+    soon as the lead is evaluated. Each line has the format of /api/evaluate-lead-from-data;
+    leads without a transcript get an error line. With "format": "compact", the first
+    line is {"criteria": [...]} (plus "prompt_id" and "prompt_version") and lead lines
+    hold the status codes only.
+    """
+    args, error = parse_evaluate_lead_batch_request(_request_json())
+    if error:
+        return jsonify(error[0]), error[1]
+    return app.response_class(iter_batch_ndjson(args), mimetype='application/x-ndjson')
+
+def _job_arguments(parser, payload):
+    """Parse a job payload like the body of the matching endpoint, raising on invalid payloads."""
+    args, error = parser(payload)
+    if error:
+        raise ValueError(error[0]["error"])
+    return args
+
+def _run_evaluate_lead_job(payload):
+    """Job handler for 'evaluate-lead': same input and result as /api/evaluate-lead."""
+    return evaluate_lead_dict(**_job_arguments(parse_evaluate_lead_request, payload))
+
+def _run_evaluate_lead_from_data_job(payload):
+    """Job handler for 'evaluate-lead-from-data': same input and result as /api/evaluate-lead-from-data."""
+    return evaluate_lead_dict(**_job_arguments(parse_evaluate_lead_from_data_request, payload))
+
+def _run_evaluate_lead_batch_job(payload):
+    """
+    Job handler for 'evaluate-lead-batch': evaluates every lead of 'leads' against one prompt.
+    
+    Returns a list of results, or with "format": "compact" a single
+    {"criteria": [...], "results": [...]} object listing the criteria once.
+    """
+    args = _job_arguments(parse_evaluate_lead_batch_request, payload)
+    results = [evaluate_batch_lead(args['criteria'], lead_data, args['prompt_info'], args['result_format'])
+               for lead_data in args['leads']]
+    header = batch_header(args)
+    if header is not None:
+        return {**header, "results": results}
+    return results
+
+def _run_rescore_prompt_job(payload):
+    """
+    Job handler for 'rescore-prompt': re-scores the stored leads of a prompt's flow after the
+    prompt was edited, scoring only the criteria added or changed since 'from_version'
+    (default: the previous version) and reusing the stored outcomes of the others.
+    
+    Returns {"prompt_id", "prompt_version", "from_version", "flow_id", "added", "removed",
+    "unchanged", "leads", "criteria_scored", "criteria": [...], "results": [...]}, with
+    compact results unless "format" is "verbose".
+    """
+    store = get_criterion_store()
+    if store is None:
+        raise ValueError("Re-scoring requires the criterion store (set LEAD_CRITERIA_DB)")
+    prompts = get_prompt_registry()
+    record = prompts.get(payload['prompt_id'], payload.get('prompt_version'))
+    from_version = payload.get('from_version', record['version'] - 1)
+    previous = prompts.get(record['prompt_id'], from_version)['criteria'] if from_version else []
+    flow_id = payload.get('flow_id') or record['flow_id']
+    if not flow_id:
+        raise ValueError(f"Prompt '{record['prompt_id']}' has no flow_id, set 'flow_id' in the payload")
+    changes = diff_criteria(previous, record['criteria'])
+    
+    evaluator = LeadQualificationEvaluator()
+    result_format = payload.get('format', FORMAT_COMPACT)
+    prompt_info = {"prompt_id": record['prompt_id'], "prompt_version": record['version']}
+    results = []
+    criteria_scored = 0
+    for lead, result in store.rescore(evaluator, record['criteria'], flow_id):
+        criteria_scored += len(result) - len(result.reused)
+        body = result.to_dict(result_format)
+        if result_format != FORMAT_COMPACT:
+            body.update(prompt_info)
+        body["lead_id"] = lead["lead_id"]
+        results.append(body)
+        deliver_result({"lead_id": lead["lead_id"], "user_id": lead["user_id"], "flow_id": flow_id}, result)
+    return {**prompt_info, "from_version": from_version, "flow_id": flow_id,
+            **{name: len(criteria) for name, criteria in changes.items()},
+            "leads": len(results), "criteria_scored": criteria_scored,
+            "criteria": record['criteria'], "results": results}
+
+def _run_crew_job(payload):
+    """Job handler for 'crew': kicks off the crew with 'inputs', reusing cached task outputs."""
+    # Imported lazily so the rule-based API does not require crewai to be configured
+    from src.argent_qualify_lead6.crew import ArgentQualifyLead6
+    return ArgentQualifyLead6().kickoff_cached(inputs=payload['inputs'])
+
+# Job type -> (required payload fields, handler, default priority lane)
+JOB_TYPES = {
+    'evaluate-lead': (('prompt', 'transcript'), _run_evaluate_lead_job, LANE_REALTIME),
+    'evaluate-lead-from-data': (('prompt', 'data'), _run_evaluate_lead_from_data_job, LANE_REALTIME),
+    'evaluate-lead-batch': (('prompt', 'leads'), _run_evaluate_lead_batch_job, LANE_BATCH),
+    'rescore-prompt': (('prompt_id',), _run_rescore_prompt_job, LANE_BATCH),
+    'crew': (('inputs',), _run_crew_job, LANE_BATCH),
+}
+
+def _oid(document, field):
+    """Return the $oid of a lead document field ('' if absent)."""
+    value = document.get(field, "") if isinstance(document, dict) else ""
+    return value.get("$oid", "") if isinstance(value, dict) else str(value)
+
+def _job_tenant(job_type, payload):
+    """Return the (userId, flowId) a job is accounted to, taken from its lead document(s)."""
+    if job_type == 'evaluate-lead-from-data':
+        lead = payload['data']
+    elif job_type == 'evaluate-lead-batch' and payload['leads']:
+        lead = payload['leads'][0]
+    elif job_type == 'rescore-prompt':
+        lead = {"flowId": payload.get('flow_id', "")}
+    else:
+        lead = {}
+    return _oid(lead, "userId"), _oid(lead, "flowId")
+
+def get_job_manager():
+    """Return the process job manager, starting its workers on first use."""
+    global _job_manager
+    with _job_manager_lock:
+        if _job_manager is None:
+            _job_manager = job_manager_from_env({name: handler for name, (_, handler, _) in JOB_TYPES.items()})
+            _job_manager.start()
+        return _job_manager
+
+def submit_job_request(request_data):
+    """Validate and submit a /api/jobs body, returning (body, status code, headers)."""
+    if not request_data or 'type' not in request_data or not isinstance(request_data.get('payload'), dict):
+        return {"error": "Missing required fields 'type' and/or 'payload'"}, 400, {}
+    
+    job_type = request_data['type']
+    payload = request_data['payload']
+    if job_type not in JOB_TYPES:
+        return {"error": f"Unknown job type '{job_type}'", "job_types": list(JOB_TYPES)}, 400, {}
+    
+    # 'prompt' may be replaced by 'prompt_id' or resolved from the flow, see below
+    missing = [field for field in JOB_TYPES[job_type][0] if field not in payload and field != 'prompt']
+    if missing:
+        return {"error": f"Missing required payload fields: {', '.join(missing)}"}, 400, {}
+    if job_type == 'evaluate-lead-from-data' and (
+            not isinstance(payload['data'], dict) or "transcript" not in payload['data'].get("leadData", {})):
+        return {"error": "Missing transcript in leadData"}, 400, {}
+    if job_type == 'evaluate-lead-batch' and not isinstance(payload['leads'], list):
+        return {"error": "'leads' must be a list of lead documents"}, 400, {}
+    if job_type == 'rescore-prompt':
+        for field in ('prompt_version', 'from_version'):
+            if payload.get(field) is not None and (not isinstance(payload[field], int) or payload[field] < 0):
+                return {"error": f"'{field}' must be a version number"}, 400, {}
+        if get_criterion_store() is None:
+            return {"error": "Re-scoring requires the criterion store (set LEAD_CRITERIA_DB)"}, 400, {}
+        try:
+            record = get_prompt_registry().get(payload['prompt_id'], payload.get('prompt_version'))
+        except PromptNotFound as e:
+            return {"error": str(e)}, 404, {}
+        # Pin the version (and flow) current at submission time
+        payload = {**payload, "prompt_version": record['version'],
+                   "flow_id": payload.get('flow_id') or record['flow_id']}
+    if payload.get('format') is not None and payload['format'] not in RESULT_FORMATS:
+        return {"error": f"Unknown format '{payload['format']}', expected one of: {', '.join(RESULT_FORMATS)}"}, 400, {}
+    engines, error = _parse_engines(payload) if job_type in ('evaluate-lead', 'evaluate-lead-from-data') else (None, None)
+    if error:
+        return {"error": error[0]["error"]}, error[1], {}
+    
+    priority = request_data.get('priority', JOB_TYPES[job_type][2])
+    if priority not in LANES:
+        return {"error": f"Unknown priority '{priority}', expected one of: {', '.join(LANES)}"}, 400, {}
+    user_id, flow_id = _job_tenant(job_type, payload)
+    user_id = request_data.get('user_id', user_id)
+    flow_id = request_data.get('flow_id', flow_id)
+    if 'prompt' in JOB_TYPES[job_type][0] and 'prompt' not in payload and _uses_criteria(engines):
+        if 'prompt_id' not in payload and not flow_id:
+            return {"error": "Missing required payload fields: prompt (or prompt_id)"}, 400, {}
+        # Pin the registered prompt version that is current at submission time
+        try:
+            _, _, prompt_info = resolve_prompt(payload, flow_id)
+        except PromptNotFound as e:
+            return {"error": str(e)}, 404, {}
+        payload = {**payload, **prompt_info}
+    cost = len(payload['leads']) if job_type == 'evaluate-lead-batch' else 1
+    
+    try:
+        job_id = get_job_manager().submit(job_type, payload, lane=priority, user_id=user_id,
+                                          flow_id=flow_id, cost=cost)
+    except JobQueueFull as e:
+        return {"error": str(e)}, 429, {'Retry-After': '5'}
+    
+    status_url = f"/api/jobs/{job_id}"
+    return {"job_id": job_id, "status": "queued", "status_url": status_url}, 202, {'Location': status_url}
+
+def get_job_response(job_id):
+    """Return (body, status code) for a /api/jobs/<job_id> poll."""
+    job = get_job_manager().get(job_id)
+    if job is None:
+        return {"error": f"Job '{job_id}' not found or expired"}, 404
+    return job, 200
+
+@app.route('/api/jobs', methods=['POST'])
+def submit_job():
+    """
+    API endpoint to submit an asynchronous evaluation job.
+    
+    Request:
+    {
+        "type": "evaluate-lead | evaluate-lead-from-data | evaluate-lead-batch | rescore-prompt | crew",
+        "payload": {...},  // Same body as the synchronous endpoint; {"prompt", "leads": [...]} for batches, {"inputs"} for crew.
+                           // "prompt" may be replaced by "prompt_id", or omitted to use the prompt registered for the flow.
+                           // rescore-prompt: {"prompt_id", "prompt_version"?, "from_version"?, "flow_id"?, "format"?}
+        "priority": "realtime | batch",  // Optional, defaults to realtime for single leads and batch otherwise
+        "user_id": "...",  // Optional, defaults to the userId of the lead document
+        "flow_id": "..."   // Optional, defaults to the flowId of the lead document
+    }
+    
+    Response (202): {"job_id": "...", "status": "queued", "status_url": "/api/jobs/<job_id>"}
+    Response (429): Job queue is full, retry later
+    """
+    body, status, headers = submit_job_request(_request_json())
+    response = jsonify(body)
+    response.headers.update(headers)
+    return response, status
+
+@app.route('/api/jobs/<job_id>', methods=['GET'])
+def get_job(job_id):
+    """
+    API endpoint to poll an asynchronous job.
+    
+    Response: JSON with format:
+    {
+        "job_id": "...",
+        "type": "evaluate-lead",
+        "status": "queued/running/succeeded/failed",
+        "created_at": 1700000000.0,
+        "started_at": 1700000000.5,
+        "finished_at": 1700000001.0,
+        "result": {...},      // When succeeded
+        "error": "...",       // When failed
+        "expires_at": 1700003601.0
+    }
+    """
+    body, status = get_job_response(job_id)
+    return jsonify(body), status
+
+def register_prompt_request(request_data, prompt_id=None):
+    """Validate and register a /api/prompts body, returning (body, status code)."""
+    if not request_data or not isinstance(request_data.get('prompt'), str):
+        return {"error": "Missing required field 'prompt'"}, 400
+    record = get_prompt_registry().register(request_data['prompt'], prompt_id or request_data.get('prompt_id'),
+                                            request_data.get('flow_id'))
+    if request_data.get('rescore') and record['created'] and record['version'] > 1:
+        # Re-score the flow's stored leads, scoring only the criteria this version changed
+        job, _, _ = submit_job_request({"type": "rescore-prompt", "payload": {
+            "prompt_id": record['prompt_id'], "prompt_version": record['version'], "from_version": record['version'] - 1}})
+        record = {**record, "rescore": job}
+    return record, 201 if record['created'] else 200
+
+def get_prompt_response(prompt_id, version=None):
+    """Return (body, status code) for a /api/prompts/<prompt_id> lookup."""
+    try:
+        record = get_prompt_registry().get(prompt_id, int(version) if version is not None else None)
+    except ValueError:
+        return {"error": f"Invalid version '{version}'"}, 400
+    except PromptNotFound as e:
+        return {"error": str(e)}, 404
+    return {**record, "versions": get_prompt_registry().versions(prompt_id)}, 200
+
+@app.route('/api/prompts', methods=['POST'])
+def register_prompt():
+    """
+    API endpoint to register a business prompt, so evaluations can refer to it by id.
+    
+    Request:
+    {
+        "prompt": "Business prompt containing lead evaluation criteria",
+        "prompt_id": "...",  // Optional, generated when omitted; an existing id adds a version
+        "flow_id": "...",    // Optional, leads of this flowId are evaluated with the prompt by default
+        "rescore": true      // Optional, when adding a version: submit a rescore-prompt job for the flow's stored leads
+    }
+    
+    Response (201, or 200 when the text is unchanged):
+    {"prompt_id": "...", "version": 1, "prompt": "...", "criteria": ["..."], "flow_id": "...", "created_at": 1700000000.0, "created": true,
+     "rescore": {"job_id": "...", "status": "queued", "status_url": "..."}}  // With "rescore", the submitted job (or its error)
+    """
+    body, status = register_prompt_request(_request_json())
+    return jsonify(body), status
+
+@app.route('/api/prompts/<prompt_id>', methods=['GET', 'PUT'])
+def prompt_detail(prompt_id):
+    """
+    API endpoint to read (GET, optional ?version=N) or update (PUT, same body as POST /api/prompts)
+    a registered prompt. Updating adds a version; earlier versions stay available.
+    """
+    if request.method == 'PUT':
+        body, status = register_prompt_request(_request_json(), prompt_id)
+    else:
+        body, status = get_prompt_response(prompt_id, request.args.get('version'))
+    return jsonify(body), status
+
+def query_leads_request(request_data):
+    """Validate and run a /api/leads/query body against the transcript index, returning (body, status code)."""
+    index = get_transcript_index()
+    if index is None:
+        return {"error": "Lead queries require the transcript index (set LEAD_INDEX_DB)"}, 400
+    if not isinstance(request_data, dict):
+        return {"error": "Expected a JSON object of filters"}, 400
+    try:
+        return index.query(request_data), 200
+    except ValueError as e:
+        return {"error": str(e)}, 400
+
+@app.route('/api/leads/query', methods=['POST'])
+def query_leads():
+    """
+    API endpoint to find evaluated leads from the transcript index, without re-evaluating transcripts.
+    
+    Request (all filters optional, combined with AND):
+    {
+        "flow_id": "...", "user_id": "...",
+        "created_after": "2025-05-01",  // or epoch seconds; also "created_before", "created_within_days": 30
+        "terms": ["budget"],            // Words that must all occur in the transcript
+        "amount": {"min": 20000, "currency": "USD"},  // A money amount in range was mentioned ("max" too)
+        "timeframe_days": {"max": 90},  // A timeframe in range was mentioned (days from the call)
+        "criteria": {"Customer has decision-making authority": "Met"},
+        "qualification_status": "Qualified",
+        "limit": 100, "offset": 0
+    }
+    
+    Response: JSON with format:
+    {"total": 42, "leads": [{"lead_id": "...", "user_id": "...", "flow_id": "...", "created_at": 1746255291.1,
+                             "qualification_status": "...", "confidence_score": 83}, ...]}
+    """
+    body, status = query_leads_request(_request_json())
+    return jsonify(body), status
+
+def get_analytics_response(flow_id=None, user_id=None, window=None):
+    """Return (body, status code) for a /api/analytics lookup."""
+    analytics = get_analytics()
+    if analytics is None:
+        return {"error": "Analytics are disabled (LEAD_ANALYTICS=0)"}, 400
+    if flow_id and user_id:
+        return {"error": "Use either 'flow_id' or 'user_id'"}, 400
+    if flow_id:
+        scope, key = SCOPE_FLOW, flow_id
+    elif user_id:
+        scope, key = SCOPE_USER, user_id
+    else:
+        scope, key = SCOPE_ALL, ""
+    try:
+        return analytics.summary(scope, key, window), 200
+    except ValueError as e:
+        return {"error": str(e)}, 400
+
+@app.route('/api/analytics', methods=['GET'])
+def analytics():
+    """
+    API endpoint exposing qualification analytics, maintained as evaluations complete.
+    
+    Query parameters (optional): flow_id or user_id (default: all evaluations of the server),
+    window ("1h", "1d", "7d" or "all"; default: every window)
+    
+    Response: JSON with format:
+    {
+        "scope": "flow", "key": "...", "generated_at": 1700000000.0,
+        "windows": {
+            "1h": {
+                "evaluations": 120,
+                "qualification_status": {"Qualified": 30, "Needs More Info": 50, "Disqualified": 40},
+                "qualification_rate": 0.25,
+                "average_confidence": 61.5,
+                "confidence_histogram": [2, 0, 5, ...],  // 10 bins: 0-9, 10-19, ..., 90-100
+                "criteria": {"<criterion>": {"evaluations": 120, "not_met": 40, "unclear": 20, "met": 60, "met_rate": 0.5}}
+            },
+            ...
+        }
+    }
+    """
+    body, status = get_analytics_response(request.args.get('flow_id'), request.args.get('user_id'),
+                                          request.args.get('window'))
+    return jsonify(body), status
+
+@app.route('/api/engines', methods=['GET'])
+def engines():
+    """
+    API endpoint listing the evaluator engines that requests can select with "engines".
+    
+    Response: JSON with format:
+    {"engines": [{"name": "criteria", "description": "...", "uses_criteria": true, "features": ["normalized"]}, ...]}
+    """
+    return jsonify({"engines": [get_engine(name).describe() for name in available_engines()]})
+
+@app.route('/api/metrics', methods=['GET'])
+def metrics():
+    """
+    API endpoint exposing the in-process metrics.
+    
+    Response: JSON with format:
+    {
+        "counters": {"crew.task.llm_calls": [{"labels": {"name": "...", "agent": "..."}, "value": 3}]},
+        "gauges": {...},
+        "summaries": {"crew.task.wall_time_seconds": [{"labels": {...}, "count": 1, "sum": 4.2, "min": 4.2, "max": 4.2, "avg": 4.2}]}
+    }
+    """
+    return jsonify(registry.snapshot())
+
+@app.route('/healthz', methods=['GET'])
+def healthz():
+    """
+    Liveness probe: the process is up and serving requests.
+    """
+    body, status = liveness()
+    return jsonify(body), status
+
+@app.route('/readyz', methods=['GET'])
+def readyz():
+    """
+    Readiness probe: 503 until the rule tables have been warmed up, 200 afterwards.
+    """
+    body, status = readiness()
+    return jsonify(body), status
 
 if __name__ == '__main__':
+    warm_up()
     app.run(debug=True, host='0.0.0.0', port=5000) 
\ No newline at end of file
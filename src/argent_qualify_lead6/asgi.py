@@ -0,0 +1,449 @@
+#!/usr/bin/env python
+"""
+ASGI serving mode of the lead qualification API.
+
+Exposes the same routes and response schema as the Flask app (api.py), but
+requests are handled on an event loop: rule-based evaluation, which is
+CPU-bound, runs in a process pool so it is not serialised by the GIL, and
+blocking I/O (job store, crew/LLM calls) runs in threads so slow calls do not
+hold up other requests. Request bodies may be gzip (or zstd) encoded and
+responses are compressed according to Accept-Encoding, see compression.py.
+
+Run with:
+    uvicorn src.argent_qualify_lead6.asgi:app --host 0.0.0.0 --port 8000
+"""
+import asyncio
+import collections
+import contextlib
+import functools
+import json
+import os
+import sys
+from concurrent.futures import ProcessPoolExecutor
+from multiprocessing import resource_tracker
+
+from starlette.applications import Starlette
+from starlette.datastructures import Headers, MutableHeaders
+from starlette.middleware import Middleware
+from starlette.requests import Request
+from starlette.responses import JSONResponse, StreamingResponse
+from starlette.routing import Route
+
+# Add project root directory to sys.path for easier imports
+sys.path.append(os.path.dirname(os.path.dirname(os.path.dirname(os.path.abspath(__file__)))))
+
+from src.argent_qualify_lead6.analytics import outcomes_from_body
+from src.argent_qualify_lead6.api import (
+    _error_result,
+    _evaluate_result,
+    _oid,
+    batch_header,
+    batch_lead_result,
+    deliver_result,
+    evaluate_lead_dict,
+    evaluate_lead_profiled,
+    get_analytics,
+    get_analytics_response,
+    get_job_response,
+    get_prompt_response,
+    get_result_delivery,
+    init_pool_worker,
+    lead_transcript,
+    ndjson_line,
+    parse_evaluate_lead_batch_request,
+    parse_evaluate_lead_from_data_request,
+    parse_evaluate_lead_request,
+    profile_context,
+    query_leads_request,
+    record_analytics,
+    record_evaluated_leads,
+    register_prompt_request,
+    submit_job_request,
+)
+from src.argent_qualify_lead6.compression import (
+    MIN_COMPRESS_SIZE, BodyTooLarge, InvalidBody, StreamCompressor, UnsupportedEncoding, choose_encoding, decode_body
+)
+from src.argent_qualify_lead6.engines import ENGINE_CRITERIA, available_engines, get_engine
+from src.argent_qualify_lead6.metrics import registry
+from src.argent_qualify_lead6.parallel import SharedTranscripts, chunk_ranges, evaluate_shared
+from src.argent_qualify_lead6.profiling import attach_profile, requested_profile
+from src.argent_qualify_lead6.warmup import liveness, readiness, warm_up
+
+_process_pool = None
+
+
+def _process_workers():
+    return int(os.getenv("LEAD_ASGI_PROCESS_WORKERS", str(os.cpu_count() or 1)))
+
+
+def get_process_pool():
+    """
+    Return the process pool running CPU-bound evaluations.
+
+    Sized by LEAD_ASGI_PROCESS_WORKERS (default: number of CPUs).
+    """
+    global _process_pool
+    if _process_pool is None:
+        # Workers inherit the resource tracker, which removes the shared memory blocks of batches
+        resource_tracker.ensure_running()
+        # Workers return their results here, where the analytics are kept
+        _process_pool = ProcessPoolExecutor(max_workers=_process_workers(), initializer=init_pool_worker)
+    return _process_pool
+
+
+async def _json_body(request: Request):
+    """
+    Return the parsed JSON body, decompressed according to its Content-Encoding,
+    or None when it is missing or invalid.
+    """
+    body = await request.body()
+    if request.headers.get("content-encoding"):
+        # Decompressing a large body is CPU-bound, keep it off the event loop
+        body = await asyncio.to_thread(decode_body, body, request.headers["content-encoding"])
+    try:
+        return json.loads(body) if body else None
+    except ValueError:
+        return None
+
+
+async def _evaluate(args):
+    loop = asyncio.get_running_loop()
+    return await loop.run_in_executor(get_process_pool(), functools.partial(evaluate_lead_dict, **args))
+
+
+def _record_analytics(args, result):
+    """
+    Add a result evaluated in the process pool to the analytics of this process, and
+    queue it for webhook delivery when it belongs to a lead document.
+    """
+    if "engines" in result:
+        result = result["engines"].get(ENGINE_CRITERIA, {"error": "not evaluated"})
+    if "error" not in result:
+        record_analytics(args.get('lead_data'), result["qualification_status"], result["confidence_score"],
+                         outcomes_from_body(result, args['criteria']))
+        if args.get('lead_data') is not None:
+            deliver_result(args['lead_data'], result)
+
+
+async def _evaluate_response(request: Request, args, request_data, route):
+    """Evaluate in the process pool, under the profiler when the request asks for it."""
+    profile_mode = requested_profile(request.headers)
+    if not profile_mode:
+        result = await _evaluate(args)
+        _record_analytics(args, result)
+        return JSONResponse(result)
+    loop = asyncio.get_running_loop()
+    result, report = await loop.run_in_executor(get_process_pool(), evaluate_lead_profiled, args)
+    _record_analytics(args, result)
+    headers = await asyncio.to_thread(attach_profile, result, report, profile_mode,
+                                      profile_context(route, request_data))
+    return JSONResponse(result, headers=headers)
+
+
+async def evaluate_lead(request: Request):
+    """
+    Async counterpart of POST /api/evaluate-lead.
+    """
+    request_data = await _json_body(request)
+    try:
+        # Resolving a registered prompt may read the prompt database
+        args, error = await asyncio.to_thread(parse_evaluate_lead_request, request_data)
+        if error:
+            return JSONResponse(error[0], status_code=error[1])
+        return await _evaluate_response(request, args, request_data, "/api/evaluate-lead")
+    except Exception as e:
+        return JSONResponse(_error_result(str(e), f"Error: {str(e)}"), status_code=500)
+
+
+async def evaluate_lead_from_data(request: Request):
+    """
+    Async counterpart of POST /api/evaluate-lead-from-data.
+    """
+    request_data = await _json_body(request)
+    try:
+        args, error = await asyncio.to_thread(parse_evaluate_lead_from_data_request, request_data)
+        if error:
+            return JSONResponse(error[0], status_code=error[1])
+        return await _evaluate_response(request, args, request_data, "/api/evaluate-lead-from-data")
+    except Exception as e:
+        return JSONResponse(_error_result(str(e), f"Error: {str(e)}"), status_code=500)
+
+
+async def _iter_batch_ndjson(args):
+    """
+    Evaluate the leads of a batch in the process pool, yielding the NDJSON lines in
+    lead order as chunks of leads finish.
+
+    The transcripts are written once to shared memory and the workers send back
+    array-packed results (see parallel.py), so the cost of handing transcripts to
+    the pool does not grow with their size. At most LEAD_ASGI_BATCH_WINDOW chunks
+    (default: twice the pool size) are in flight, so a large batch does not hold
+    all its pending results in memory.
+    """
+    loop = asyncio.get_running_loop()
+    pool = get_process_pool()
+    workers = _process_workers()
+    window = int(os.getenv("LEAD_ASGI_BATCH_WINDOW", str(2 * workers)))
+    criteria, prompt_info, result_format = args['criteria'], args['prompt_info'], args['result_format']
+    header = batch_header(args)
+    if header is not None:
+        yield ndjson_line(header)
+
+    leads = args['leads']
+    transcripts = [lead_transcript(lead_data) for lead_data in leads]
+    # Index in the shared block of each lead with a transcript
+    positions = [index for index, transcript in enumerate(transcripts) if transcript is not None]
+    chunks = chunk_ranges(len(positions), workers)
+
+    shared = await asyncio.to_thread(SharedTranscripts, [transcripts[index] for index in positions])
+    pending = collections.deque()
+    next_lead = 0
+    try:
+        submitted = iter(chunks)
+        while True:
+            for start, end in submitted:
+                pending.append((start, end, loop.run_in_executor(pool, evaluate_shared, shared.name, start, end,
+                                                                 criteria, _evaluate_result)))
+                if len(pending) >= window:
+                    break
+            if not pending:
+                break
+            start, end, future = pending.popleft()
+            try:
+                results = (await future).unpack(criteria)
+            except Exception as e:
+                results = [e] * (end - start)
+            else:
+                # Workers store the criterion outcomes, the leads of the chunk are recorded here
+                await asyncio.to_thread(record_evaluated_leads, [
+                    (leads[position], transcripts[position], result)
+                    for position, result in zip(positions[start:end], results)])
+            for position, result in zip(positions[start:end], results):
+                # Leads without a transcript before this one get their error line in order
+                for lead_data in leads[next_lead:position]:
+                    yield ndjson_line(batch_lead_result(lead_data))
+                lead_data = leads[position]
+                next_lead = position + 1
+                if isinstance(result, Exception):
+                    yield ndjson_line({**_error_result(str(result), f"Error: {str(result)}"),
+                                       "lead_id": _oid(lead_data, "_id")})
+                else:
+                    yield ndjson_line(batch_lead_result(lead_data, result, prompt_info, result_format))
+        for lead_data in leads[next_lead:]:
+            yield ndjson_line(batch_lead_result(lead_data))
+    finally:
+        # The client went away, drop the chunks that have not started and wait for the others
+        for _, _, future in pending:
+            future.cancel()
+        for _, _, future in pending:
+            with contextlib.suppress(BaseException):
+                await future
+        shared.close()
+
+
+async def evaluate_lead_batch(request: Request):
+    """
+    Async counterpart of POST /api/evaluate-lead-batch, streaming NDJSON lines as leads finish.
+    """
+    request_data = await _json_body(request)
+    args, error = await asyncio.to_thread(parse_evaluate_lead_batch_request, request_data)
+    if error:
+        return JSONResponse(error[0], status_code=error[1])
+    return StreamingResponse(_iter_batch_ndjson(args), media_type="application/x-ndjson")
+
+
+async def submit_job(request: Request):
+    """
+    Async counterpart of POST /api/jobs. Jobs (including crew runs) execute on
+    the job manager's worker threads.
+    """
+    request_data = await _json_body(request)
+    # Submitting writes to the SQLite job store, keep it off the event loop
+    body, status, headers = await asyncio.to_thread(submit_job_request, request_data)
+    return JSONResponse(body, status_code=status, headers=headers)
+
+
+async def get_job(request: Request):
+    """
+    Async counterpart of GET /api/jobs/<job_id>.
+    """
+    body, status = await asyncio.to_thread(get_job_response, request.path_params["job_id"])
+    return JSONResponse(body, status_code=status)
+
+
+async def register_prompt(request: Request):
+    """
+    Async counterpart of POST /api/prompts.
+    """
+    body, status = await asyncio.to_thread(register_prompt_request, await _json_body(request))
+    return JSONResponse(body, status_code=status)
+
+
+async def prompt_detail(request: Request):
+    """
+    Async counterpart of GET/PUT /api/prompts/<prompt_id>.
+    """
+    prompt_id = request.path_params["prompt_id"]
+    if request.method == "PUT":
+        body, status = await asyncio.to_thread(register_prompt_request, await _json_body(request), prompt_id)
+    else:
+        body, status = await asyncio.to_thread(get_prompt_response, prompt_id, request.query_params.get("version"))
+    return JSONResponse(body, status_code=status)
+
+
+async def query_leads(request: Request):
+    """
+    Async counterpart of POST /api/leads/query.
+    """
+    body, status = await asyncio.to_thread(query_leads_request, await _json_body(request))
+    return JSONResponse(body, status_code=status)
+
+
+async def analytics(request: Request):
+    """
+    Async counterpart of GET /api/analytics.
+    """
+    params = request.query_params
+    body, status = get_analytics_response(params.get("flow_id"), params.get("user_id"), params.get("window"))
+    return JSONResponse(body, status_code=status)
+
+
+async def engines(request: Request):
+    """
+    Async counterpart of GET /api/engines.
+    """
+    return JSONResponse({"engines": [get_engine(name).describe() for name in available_engines()]})
+
+
+async def metrics(request: Request):
+    """
+    Async counterpart of GET /api/metrics.
+    """
+    return JSONResponse(registry.snapshot())
+
+
+async def healthz(request: Request):
+    """
+    Liveness probe.
+    """
+    body, status = liveness()
+    return JSONResponse(body, status_code=status)
+
+
+async def readyz(request: Request):
+    """
+    Readiness probe, green once warm-up has completed.
+    """
+    body, status = readiness()
+    return JSONResponse(body, status_code=status)
+
+
+async def unsupported_encoding(request: Request, exc: UnsupportedEncoding):
+    return JSONResponse({"error": str(exc)}, status_code=415)
+
+
+async def body_too_large(request: Request, exc: BodyTooLarge):
+    return JSONResponse({"error": str(exc)}, status_code=413)
+
+
+async def invalid_body(request: Request, exc: InvalidBody):
+    return JSONResponse({"error": str(exc)}, status_code=400)
+
+
+class CompressionMiddleware:
+    """
+    ASGI middleware compressing responses with the best encoding of the request's
+    Accept-Encoding. Complete bodies under MIN_COMPRESS_SIZE are sent as is;
+    streamed bodies are compressed and flushed message by message.
+    """
+
+    def __init__(self, app):
+        self.app = app
+
+    async def __call__(self, scope, receive, send):
+        if scope["type"] != "http":
+            await self.app(scope, receive, send)
+            return
+        encoding = choose_encoding(Headers(scope=scope).get("accept-encoding"))
+        if encoding is None:
+            await self.app(scope, receive, send)
+            return
+
+        start_message = None
+        compressor = None
+
+        async def send_compressed(message):
+            nonlocal start_message, compressor
+            if message["type"] == "http.response.start":
+                # Hold the headers until the first body message tells whether to compress
+                start_message = message
+                return
+            if message["type"] != "http.response.body" or start_message is None:
+                await send(message)
+                return
+
+            body = message.get("body", b"")
+            more_body = message.get("more_body", False)
+            if compressor is None:
+                headers = MutableHeaders(raw=start_message["headers"])
+                if "content-encoding" in headers or (not more_body and len(body) < MIN_COMPRESS_SIZE):
+                    await send(start_message)
+                    start_message = None
+                    await send(message)
+                    return
+                compressor = StreamCompressor(encoding)
+                headers["Content-Encoding"] = encoding
+                headers.add_vary_header("Accept-Encoding")
+                if "content-length" in headers:
+                    del headers["content-length"]
+                await send(start_message)
+
+            if more_body:
+                body = compressor.compress(body, flush=True)
+            else:
+                body = compressor.compress(body) + compressor.finish()
+            await send({"type": "http.response.body", "body": body, "more_body": more_body})
+
+        await self.app(scope, receive, send_compressed)
+
+
+@contextlib.asynccontextmanager
+async def lifespan(app):
+    # Warm up before the process pool forks so its workers inherit the compiled tables
+    await asyncio.to_thread(warm_up)
+    yield
+    global _process_pool
+    if _process_pool is not None:
+        _process_pool.shutdown(wait=False, cancel_futures=True)
+        _process_pool = None
+    # Queued results go to the outbox, which the next process delivers from
+    delivery = get_result_delivery()
+    if delivery is not None:
+        await asyncio.to_thread(delivery.stop, 5)
+    # Counts recorded since the last flush go to the shared analytics store
+    analytics = get_analytics()
+    if analytics is not None:
+        await asyncio.to_thread(analytics.stop)
+
+
+app = Starlette(
+    routes=[
+        Route("/api/evaluate-lead", evaluate_lead, methods=["POST"]),
+        Route("/api/evaluate-lead-from-data", evaluate_lead_from_data, methods=["POST"]),
+        Route("/api/evaluate-lead-batch", evaluate_lead_batch, methods=["POST"]),
+        Route("/api/jobs", submit_job, methods=["POST"]),
+        Route("/api/jobs/{job_id}", get_job, methods=["GET"]),
+        Route("/api/prompts", register_prompt, methods=["POST"]),
+        Route("/api/prompts/{prompt_id}", prompt_detail, methods=["GET", "PUT"]),
+        Route("/api/leads/query", query_leads, methods=["POST"]),
+        Route("/api/analytics", analytics, methods=["GET"]),
+        Route("/api/engines", engines, methods=["GET"]),
+        Route("/api/metrics", metrics, methods=["GET"]),
+        Route("/healthz", healthz, methods=["GET"]),
+        Route("/readyz", readyz, methods=["GET"]),
+    ],
+    middleware=[Middleware(CompressionMiddleware)],
+    exception_handlers={UnsupportedEncoding: unsupported_encoding, BodyTooLarge: body_too_large,
+                        InvalidBody: invalid_body},
+    lifespan=lifespan,
+)
@@ -0,0 +1,71 @@
+#!/usr/bin/env python
+"""
+Keyword-based BANT scoring of Vietnamese conversations.
+
+Each factor (needs, budget, authority, timeline, interest) scores 1.5 points
+per keyword of its table found in the normalised transcript, up to 10; the
+qualification score is their weighted sum and a lead passes from 7. Used by
+the LeadConversationAnalyzer crew tool and by the "bant" evaluator engine,
+without depending on crewai.
+"""
+from typing import Dict
+
+from .text_normalization import KeywordTable, NormalizedText
+
+# Bảng từ khóa, được chuẩn hóa (NFC, casefold, bỏ dấu) một lần khi import
+NEEDS_KEYWORDS = KeywordTable(["tìm kiếm", "cần", "giải quyết", "vấn đề", "thách thức", "khó khăn"])
+BUDGET_KEYWORDS = KeywordTable(["ngân sách", "chi phí", "đầu tư", "giá", "tiền", "USD", "VND"])
+AUTHORITY_KEYWORDS = KeywordTable(["quyết định", "phê duyệt", "giám đốc", "quản lý", "CEO", "CFO", "CTO"])
+TIMELINE_KEYWORDS = KeywordTable(["khi nào", "thời gian", "triển khai", "tháng", "quý", "năm", "lịch trình"])
+INTEREST_KEYWORDS = KeywordTable(["quan tâm", "thích", "ưu tiên", "muốn", "cần", "sẵn sàng"])
+
+# Factor of the analysis -> keyword table
+FACTOR_KEYWORDS = {
+    "needs_identified": NEEDS_KEYWORDS,
+    "budget_discussed": BUDGET_KEYWORDS,
+    "decision_maker": AUTHORITY_KEYWORDS,
+    "timeline_defined": TIMELINE_KEYWORDS,
+    "interest_level": INTEREST_KEYWORDS,
+}
+FACTOR_WEIGHTS = {
+    "needs_identified": 0.25,
+    "budget_discussed": 0.25,
+    "decision_maker": 0.2,
+    "timeline_defined": 0.15,
+    "interest_level": 0.15,
+}
+PASS_SCORE = 7
+
+
+def keyword_score(text: NormalizedText, table: KeywordTable) -> float:
+    """
+    Score 1.5 points per keyword of the table found in a normalised text, at most 10.
+    """
+    count = table.count(text)
+    return min(count * 1.5, 10) if count else 0
+
+
+def analyze(text: NormalizedText) -> Dict[str, float]:
+    """
+    Return the score of every BANT factor in a normalised transcript.
+    """
+    return {factor: keyword_score(text, table) for factor, table in FACTOR_KEYWORDS.items()}
+
+
+def qualification_score(analysis: Dict[str, float]) -> float:
+    """
+    Return the weighted score (0-10) of an analysis.
+    """
+    return round(sum(analysis[factor] * weight for factor, weight in FACTOR_WEIGHTS.items()), 1)
+
+
+def recommendation(score: float) -> str:
+    """
+    Return the follow-up recommendation for a qualification score.
+    """
+    if score >= PASS_SCORE:
+        return "Nên tiếp tục tương tác với lead này. Có cơ hội cao để chuyển đổi thành khách hàng."
+    elif score >= 5:
+        return "Lead có tiềm năng nhưng cần thêm thông tin. Đề xuất một cuộc gọi theo dõi để làm rõ các điểm chưa rõ."
+    else:
+        return "Lead chưa sẵn sàng hoặc không phù hợp. Nên chuyển sang nurturing hoặc xem xét lại sau."
@@ -4,7 +4,94 @@ Module for lead qualification evaluation based on system prompt and transcript.
 """
 import json
 import re
-from typing import Dict, List, Any, Tuple
+from functools import lru_cache
+from typing import Dict, List, Any, Optional, Tuple
+
+from .criteria_parser import parse_criteria
+from .entities import EntityIndex, check_requirement, criterion_requirements
+from .features import TranscriptFeatures
+from .fuzzy import IndexCache, SymmetricDeleteIndex, allowed_distance, fuzzy_keywords_from_env
+from .results import CriterionResult, CriterionStatus, EvaluationResult
+from .text_normalization import normalize_keyword, normalize_text
+
+# Rule tables. They are compiled once at import time so that a preforking server
+# can build them in the master process and share them with its workers.
+
+STOP_WORDS = frozenset(['a', 'an', 'the', 'and', 'or', 'is', 'has', 'of', 'in', 'about',
+                        'with', 'to', 'from', 'including', 'content', 'after', 'ensure',
+                        'for', 'that', 'this', 'these', 'those', 'be', 'as', 'by', 'at', 'on'])
+
+# Keywords added when a criterion is about a BANT topic
+BUDGET_KEYWORDS = ("budget", "cost", "price", "payment", "afford", "spend", "spending", "money",
+                   "dollars", "usd", "$", "financial", "invest", "investment", "fund", "funding")
+AUTHORITY_KEYWORDS = ("decide", "decision", "authority", "approve", "approval", "authorized", "power",
+                      "sign off", "green light", "go ahead", "permission", "authorize", "final", "say")
+NEED_KEYWORDS = ("need", "require", "want", "must", "should", "requirement", "problem", "solution",
+                 "issue", "challenge", "difficulty", "pain point", "necessity", "essential", "important")
+TIMELINE_KEYWORDS = ("when", "timeline", "deadline", "schedule", "month", "year", "date", "time",
+                     "quarter", "q1", "q2", "q3", "q4", "soon", "asap", "immediate", "urgency", "week")
+
+BUDGET_PATTERNS = (
+    (re.compile(r"(budget|cost|price|payment|afford|spend|spending).{0,30}([\d,.]+\s*(usd|dollars|k)|\$\s*[\d,.]+)"), "specific budget discussion"),
+    (re.compile(r"(how much).{0,20}(cost|price|pay)"), "asking about cost"),
+    (re.compile(r"([\d,.]+\s*(dollars|usd)|\$\s*[\d,.]+)"), "mentioned specific amount"),
+)
+AUTHORITY_PATTERNS = (
+    (re.compile(r"(i|we).{0,15}(decide|approval|decision|authority|authorized|sign off)"), "has decision-making authority"),
+    (re.compile(r"(i am|i'm|i have).{0,15}(authority|authorized|decision maker|final say)"), "has decision-making authority"),
+    (re.compile(r"(my|the).{0,10}(decision|approval|authorization)"), "has decision-making authority"),
+    (re.compile(r"(yes).{0,30}(decision|authority|authorized|approve|sign)"), "confirmed decision authority"),
+    # Negative patterns
+    (re.compile(r"(talk|speak|discuss|consult|need).{0,20}(manager|boss|director|team|board|approval)"), "needs to consult others"),
+)
+NEED_PATTERNS = (
+    (re.compile(r"(need|require|want|must|have to|looking for).{0,30}(solution|product|service|software|system|platform|tool)"), "specific need identified"),
+    (re.compile(r"(need|want|looking for).{0,5}(a|an).{0,20}(system|solution|product)"), "expressed need for product"),
+    (re.compile(r"(facing|having|experiencing).{0,20}(issue|problem|challenge|difficulty)"), "has problem that needs solving"),
+)
+TIMELINE_PATTERNS = (
+    # Specific date mentions
+    (re.compile(r"(by|before|within|until).{0,15}(january|february|march|april|may|june|july|august|september|october|november|december|jan|feb|mar|apr|may|jun|jul|aug|sep|oct|nov|dec)"), "specific timeframe mentioned"),
+    # General timeline
+    (re.compile(r"(need|want|require|implement|start|begin|launch).{0,15}(asap|immediately|urgently|soon|quickly)"), "needs urgent implementation"),
+    (re.compile(r"(next|coming|this).{0,10}(week|month|quarter|year)"), "planned for upcoming period"),
+    (re.compile(r"(within|in).{0,5}(\d+).{0,5}(days|weeks|months)"), "specific timeline mentioned"),
+)
+
+_WORD_RE = re.compile(r'\b\w+\b')
+_NUMBER_RE = re.compile(r'\d[\d,.]*')
+
+# Symmetric-delete index of the BANT keyword tables for fuzzy matching, built
+# once and never changed; the other words of a criteria set get their own
+# index in CRITERIA_INDEXES
+KEYWORD_INDEX = SymmetricDeleteIndex(
+    keyword for table in (BUDGET_KEYWORDS, AUTHORITY_KEYWORDS, NEED_KEYWORDS, TIMELINE_KEYWORDS) for keyword in table
+)
+CRITERIA_INDEXES = IndexCache()
+
+
+@lru_cache(maxsize=4096)
+def _keyword_pattern(keyword: str) -> re.Pattern:
+    """
+    Return the compiled word-boundary pattern of a keyword.
+    """
+    return re.compile(r'\b' + re.escape(keyword) + r'\b')
+
+
+def precompile_rule_tables() -> int:
+    """
+    Compile the keyword patterns of every built-in keyword table.
+
+    The pattern tables are compiled at import time; this fills the keyword
+    pattern cache so the first requests do not pay for it.
+
+    Returns:
+        int: Number of compiled keyword patterns
+    """
+    for table in (BUDGET_KEYWORDS, AUTHORITY_KEYWORDS, NEED_KEYWORDS, TIMELINE_KEYWORDS):
+        for keyword in table:
+            _keyword_pattern(keyword)
+    return _keyword_pattern.cache_info().currsize
 
 class LeadQualificationEvaluator:
     """
@@ -44,11 +131,15 @@ class LeadQualificationEvaluator:
     4. Analysis should be objective, detailed but concise
     """
     
-    def __init__(self):
+    def __init__(self, fuzzy_keywords: Optional[bool] = None):
         """
         Initialize the lead qualification evaluation object.
+        
+        Args:
+            fuzzy_keywords (Optional[bool]): Also match keywords misspelled by speech recognition
+                ("budjet"); defaults to the LEAD_FUZZY_KEYWORDS environment variable
         """
-        pass
+        self.fuzzy_keywords = fuzzy_keywords_from_env() if fuzzy_keywords is None else fuzzy_keywords
     
     def extract_criteria_from_prompt(self, prompt: str) -> List[str]:
         """
@@ -60,61 +151,57 @@ class LeadQualificationEvaluator:
         Returns:
             List[str]: List of criteria
         """
-        # Analyze prompt to extract criteria
-        criteria = []
-        
-        # Find bullet points or numbered lists more precisely with better handling of multiline text
-        bullet_points = re.findall(r'[-•*]\s*(.*?)(?=\s*\n\s*[-•*]|\s*\n\s*\n|\s*\Z)', prompt, re.DOTALL)
-        numbered_points = re.findall(r'\d+\.\s*(.*?)(?=\s*\n\s*\d+\.|\s*\n\s*\n|\s*\Z)', prompt, re.DOTALL)
-        
-        # Combine the found points and clean them (remove extra whitespace and newlines)
-        for point in bullet_points:
-            clean_point = re.sub(r'\s+', ' ', point).strip()
-            if clean_point:
-                criteria.append(clean_point)
-                
-        for point in numbered_points:
-            clean_point = re.sub(r'\s+', ' ', point).strip()
-            if clean_point:
-                criteria.append(clean_point)
-        
-        # If no lists are found using the above methods, try a simpler approach
-        if not criteria:
-            # Try to split by common bullet point markers
-            lines = prompt.split('\n')
-            for line in lines:
-                line = line.strip()
-                # Check if line starts with a bullet point or number
-                if re.match(r'^[-•*]\s+\w+', line) or re.match(r'^\d+\.\s+\w+', line):
-                    # Remove the bullet point or number
-                    clean_line = re.sub(r'^[-•*]\d+\.\s+', '', line).strip()
-                    if clean_line:
-                        criteria.append(clean_line)
-        
-        # If still no criteria found, split by sentences
-        if not criteria:
-            sentences = re.split(r'[.!?]\s+', prompt)
-            for sentence in sentences:
-                clean_sentence = sentence.strip()
-                if clean_sentence and len(clean_sentence) > 10:  # Avoid short fragments
-                    criteria.append(clean_sentence)
+        # Single pass over the lines of the prompt: bullet and numbered lists
+        # (including nested ones), falling back to sentences
+        criteria = parse_criteria(prompt)
         
         # For debugging, print how many criteria were found
         print(f"Criteria extraction found {len(criteria)} items")
         
         return criteria
     
-    def evaluate_criterion(self, criterion: str, transcript: str) -> Tuple[str, str]:
+    def evaluate_criterion(self, criterion: str, transcript: str,
+                           entities: Optional[EntityIndex] = None) -> Tuple[str, str]:
         """
         Evaluate a specific criterion based on the transcript.
         
         Args:
             criterion (str): Criterion to evaluate
             transcript (str): Conversation transcript to evaluate
+            entities (Optional[EntityIndex]): Entities of the transcript, built here when not given
             
         Returns:
             Tuple[str, str]: (Evaluation status, Explanation)
         """
+        transcript_lower = normalize_text(transcript).text
+        fuzzy = self._fuzzy_matches([criterion], transcript_lower)
+        status, explanation, _, _ = self._score_criterion(criterion, transcript, transcript_lower, entities, fuzzy)
+        return status.label, explanation
+    
+    def _fuzzy_matches(self, criteria: List[str], transcript_lower: str) -> Optional[Dict[str, Tuple[int, int]]]:
+        """
+        Return the span of every keyword of the criteria found misspelled in the
+        normalised transcript, or None when fuzzy matching is disabled.
+        """
+        if not self.fuzzy_keywords:
+            return None
+        spans = KEYWORD_INDEX.match_text(transcript_lower)
+        words = {keyword for criterion in criteria for keyword in self._extract_keywords(criterion)
+                 if keyword not in KEYWORD_INDEX and allowed_distance(keyword)}
+        if words:
+            for keyword, span in CRITERIA_INDEXES.get(words).match_text(transcript_lower).items():
+                spans.setdefault(keyword, span)
+        return spans
+    
+    def _score_criterion(self, criterion: str, transcript: str, transcript_lower: str,
+                         entities: Optional[EntityIndex],
+                         fuzzy: Optional[Dict[str, Tuple[int, int]]] = None
+                         ) -> Tuple[CriterionStatus, str, int, List[Tuple[int, int]]]:
+        """
+        Evaluate a criterion and return (status, explanation, score 0-100, evidence
+        offsets into the normalised transcript). Keywords without an exact match
+        count when found misspelled (fuzzy: keyword -> span of the misspelled word).
+        """
         # Create keywords and patterns
         keywords = self._extract_keywords(criterion)
         patterns = self._create_patterns(criterion)
@@ -124,43 +211,65 @@ class LeadQualificationEvaluator:
         total_keywords = len(keywords)
         
         if total_keywords == 0:
-            return "Unclear", "Cannot determine criterion"
-            
+            return CriterionStatus.UNCLEAR, "Cannot determine criterion", 0, []
+        
+        evidence = []
         for keyword in keywords:
             # Use word boundary to find exact matches
-            pattern = r'\b' + re.escape(keyword) + r'\b'
-            if re.search(pattern, transcript.lower()):
+            match = _keyword_pattern(keyword).search(transcript_lower)
+            if match:
                 matches += 1
+                evidence.append(match.span())
+            elif fuzzy and keyword in fuzzy:
+                matches += 1
+                evidence.append(fuzzy[keyword])
         
         # Check specific pattern matches
         pattern_matches = 0
         pattern_explanations = []
         
         for pattern, expected_text in patterns:
-            if pattern.search(transcript.lower()):
+            match = pattern.search(transcript_lower)
+            if match:
+                evidence.append(match.span())
                 pattern_matches += 1
                 pattern_explanations.append(expected_text)
                 # When a pattern matches, increase matches more significantly
                 matches += 3  # Increased from 2 to 3 to give patterns more weight
         
+        # Numeric requirements ("minimum budget of $10,000", "within 3 months") are
+        # compared with the amounts and timeframes mentioned in the transcript
+        requirements = criterion_requirements(criterion)
+        if requirements:
+            if entities is None:
+                entities = EntityIndex.build(transcript_lower)
+            for requirement in requirements:
+                satisfied, requirement_explanation = check_requirement(requirement, entities)
+                if satisfied is False:
+                    return CriterionStatus.NOT_MET, f"Found: {requirement_explanation}", 0, evidence
+                if satisfied:
+                    pattern_matches += 1
+                    pattern_explanations.append(requirement_explanation)
+                    matches += 3
+        
         # Evaluate match level - lowered thresholds for better matching
         match_ratio = matches / max(total_keywords, 1)
         
         # If we have pattern matches, it should heavily influence the result
         if pattern_matches > 0:
-            status = "Met"
+            status = CriterionStatus.MET
             explanation = f"Found: {', '.join(pattern_explanations)}"
         elif match_ratio > 0.4:  # Lowered from 0.6 to 0.4
-            status = "Met"
+            status = CriterionStatus.MET
             explanation = f"Found {matches}/{total_keywords} keywords"
         elif match_ratio > 0.2:  # Lowered from 0.3 to 0.2
-            status = "Unclear"
+            status = CriterionStatus.UNCLEAR
             explanation = "Some information found but not sufficient"
         else:
-            status = "Not Met"
+            status = CriterionStatus.NOT_MET
             explanation = "Not enough relevant information found"
             
-        return status, explanation
+        return status, explanation, int(min(match_ratio, 1.0) * 100), evidence
     
     def _extract_keywords(self, criterion: str) -> List[str]:
         """
@@ -172,36 +281,29 @@ class LeadQualificationEvaluator:
         Returns:
             List[str]: List of keywords
         """
-        # Remove stop words - expanded list
-        stop_words = ['a', 'an', 'the', 'and', 'or', 'is', 'has', 'of', 'in', 'about', 
-                      'with', 'to', 'from', 'including', 'content', 'after', 'ensure',
-                      'for', 'that', 'this', 'these', 'those', 'be', 'as', 'by', 'at', 'on']
+        criterion_lower = normalize_keyword(criterion)
         
         # Split into words
-        words = re.findall(r'\b\w+\b', criterion.lower())
+        words = _WORD_RE.findall(criterion_lower)
         
         # Remove stop words and words that are too short
-        keywords = [word for word in words if word not in stop_words and len(word) > 2]  # Changed from 1 to 2
+        keywords = [word for word in words if word not in STOP_WORDS and len(word) > 2]  # Changed from 1 to 2
         
         # Add specific keywords based on the context of the criterion
-        if "budget" in criterion.lower() or "cost" in criterion.lower() or "price" in criterion.lower() or "$" in criterion:
-            keywords.extend(["budget", "cost", "price", "payment", "afford", "spend", "spending", "money", 
-                           "dollars", "usd", "$", "financial", "invest", "investment", "fund", "funding"])
+        if "budget" in criterion_lower or "cost" in criterion_lower or "price" in criterion_lower or "$" in criterion:
+            keywords.extend(BUDGET_KEYWORDS)
             
-        if "decision" in criterion.lower() or "authority" in criterion.lower():
-            keywords.extend(["decide", "decision", "authority", "approve", "approval", "authorized", "power",
-                           "sign off", "green light", "go ahead", "permission", "authorize", "final", "say"])
+        if "decision" in criterion_lower or "authority" in criterion_lower:
+            keywords.extend(AUTHORITY_KEYWORDS)
             
-        if "need" in criterion.lower() or "requirement" in criterion.lower() or "problem" in criterion.lower():
-            keywords.extend(["need", "require", "want", "must", "should", "requirement", "problem", "solution",
-                           "issue", "challenge", "difficulty", "pain point", "necessity", "essential", "important"])
+        if "need" in criterion_lower or "requirement" in criterion_lower or "problem" in criterion_lower:
+            keywords.extend(NEED_KEYWORDS)
             
-        if "time" in criterion.lower() or "timeline" in criterion.lower() or "month" in criterion.lower():
-            keywords.extend(["when", "timeline", "deadline", "schedule", "month", "year", "date", "time",
-                           "quarter", "q1", "q2", "q3", "q4", "soon", "asap", "immediate", "urgency", "week"])
+        if "time" in criterion_lower or "timeline" in criterion_lower or "month" in criterion_lower:
+            keywords.extend(TIMELINE_KEYWORDS)
         
         # Look for numeric values in criterion (e.g., "10,000")
-        numbers = re.findall(r'\d[\d,.]*', criterion)
+        numbers = _NUMBER_RE.findall(criterion)
         if numbers:
             for number in numbers:
                 # Clean number and add to keywords
@@ -221,66 +323,23 @@ class LeadQualificationEvaluator:
             List[Tuple[re.Pattern, str]]: List of (pattern, description)
         """
         patterns = []
-        
-        # Extract numbers from criterion for more specific matching
-        amount_matches = re.findall(r'(\$?\s*\d[\d,.]*\s*k?\s*(?:thousand|million|dollars|usd)?)', criterion.lower())
-        amount_value = None
-        if amount_matches:
-            for amount in amount_matches:
-                # Clean and store the amount for comparison
-                cleaned = re.sub(r'[^\d.]', '', amount)
-                if cleaned:
-                    try:
-                        amount_value = float(cleaned)
-                        # If "k" or "thousand" in the amount, multiply by 1000
-                        if 'k' in amount or 'thousand' in amount:
-                            amount_value *= 1000
-                    except ValueError:
-                        pass
+        criterion_lower = normalize_keyword(criterion)
         
         # Budget
-        if "budget" in criterion.lower() or "cost" in criterion.lower() or "price" in criterion.lower() or "$" in criterion:
-            # Generic budget patterns
-            patterns.append((re.compile(r"(budget|cost|price|payment|afford|spend|spending).{0,30}([\d,.]+\s*(usd|dollars|k)|\$\s*[\d,.]+)"), "specific budget discussion"))
-            patterns.append((re.compile(r"(how much).{0,20}(cost|price|pay)"), "asking about cost"))
-            patterns.append((re.compile(r"([\d,.]+\s*(dollars|usd)|\$\s*[\d,.]+)"), "mentioned specific amount"))
+        if "budget" in criterion_lower or "cost" in criterion_lower or "price" in criterion_lower or "$" in criterion:
+            patterns.extend(BUDGET_PATTERNS)
             
-            # If we found a specific amount in the criterion, create a pattern to match amounts that exceed it
-            if amount_value:
-                # Pattern to match numbers in the transcript
-                patterns.append((re.compile(r"([\d,.]+\s*(k|thousand|dollars|usd)|\$\s*[\d,.]+)"), "mentioned budget amount"))
-                
         # Authority
-        if "decision" in criterion.lower() or "authority" in criterion.lower():
-            patterns.append((re.compile(r"(i|we).{0,15}(decide|approval|decision|authority|authorized|sign off)"), "has decision-making authority"))
-            patterns.append((re.compile(r"(i am|i'm|i have).{0,15}(authority|authorized|decision maker|final say)"), "has decision-making authority"))
-            patterns.append((re.compile(r"(my|the).{0,10}(decision|approval|authorization)"), "has decision-making authority"))
-            patterns.append((re.compile(r"(yes).{0,30}(decision|authority|authorized|approve|sign)"), "confirmed decision authority"))
-            # Negative patterns
-            patterns.append((re.compile(r"(talk|speak|discuss|consult|need).{0,20}(manager|boss|director|team|board|approval)"), "needs to consult others"))
+        if "decision" in criterion_lower or "authority" in criterion_lower:
+            patterns.extend(AUTHORITY_PATTERNS)
             
         # Need
-        if "need" in criterion.lower() or "requirement" in criterion.lower():
-            patterns.append((re.compile(r"(need|require|want|must|have to|looking for).{0,30}(solution|product|service|software|system|platform|tool)"), "specific need identified"))
-            patterns.append((re.compile(r"(need|want|looking for).{0,5}(a|an).{0,20}(system|solution|product)"), "expressed need for product"))
-            patterns.append((re.compile(r"(facing|having|experiencing).{0,20}(issue|problem|challenge|difficulty)"), "has problem that needs solving"))
+        if "need" in criterion_lower or "requirement" in criterion_lower:
+            patterns.extend(NEED_PATTERNS)
             
         # Timeline
-        if "time" in criterion.lower() or "timeline" in criterion.lower() or "month" in criterion.lower():
-            # Specific date mentions
-            patterns.append((re.compile(r"(by|before|within|until).{0,15}(january|february|march|april|may|june|july|august|september|october|november|december|jan|feb|mar|apr|may|jun|jul|aug|sep|oct|nov|dec)"), "specific timeframe mentioned"))
-            # General timeline
-            patterns.append((re.compile(r"(need|want|require|implement|start|begin|launch).{0,15}(asap|immediately|urgently|soon|quickly)"), "needs urgent implementation"))
-            patterns.append((re.compile(r"(next|coming|this).{0,10}(week|month|quarter|year)"), "planned for upcoming period"))
-            patterns.append((re.compile(r"(within|in).{0,5}(\d+).{0,5}(days|weeks|months)"), "specific timeline mentioned"))
-            
-            # If the criterion specifies a number of months, create a specific pattern
-            month_match = re.search(r'(\d+)\s*months?', criterion.lower())
-            if month_match:
-                month_value = int(month_match.group(1))
-                # Create patterns to look for dates within that timeframe
-                patterns.append((re.compile(r"(next|this|coming|within).{0,5}(\d+).{0,5}(month|months)"), "timeline specified in months"))
-                patterns.append((re.compile(r"(next|this|coming).{0,5}(month|week|few weeks)"), "near-term implementation planned"))
+        if "time" in criterion_lower or "timeline" in criterion_lower or "month" in criterion_lower:
+            patterns.extend(TIMELINE_PATTERNS)
         
         return patterns
         
@@ -301,60 +360,70 @@ class LeadQualificationEvaluator:
         # Debug print
         print(f"Extracted {len(criteria)} criteria: {criteria}")
         
-        # Evaluate each criterion
-        criteria_evaluation = {}
-        met_count = 0
-        unclear_count = 0
-        not_met_count = 0
+        return self.evaluate_criteria(criteria, transcript)
+    
+    def evaluate_criteria(self, criteria: List[str], transcript: str) -> Dict[str, Any]:
+        """
+        Evaluate lead qualification against criteria that were already extracted,
+        e.g. those of a registered prompt.
         
-        for criterion in criteria:
-            status, explanation = self.evaluate_criterion(criterion, transcript)
-            criteria_evaluation[criterion] = f"{status} - {explanation}"
-            
-            print(f"Criterion: '{criterion}' -> {status} - {explanation}")
+        Args:
+            criteria (List[str]): Evaluation criteria
+            transcript (str): Conversation transcript to evaluate
             
-            if status == "Met":
-                met_count += 1
-            elif status == "Unclear":
-                unclear_count += 1
-            else:  # Not Met
-                not_met_count += 1
-        
-        # Calculate confidence and status
-        total_criteria = len(criteria)
+        Returns:
+            Dict[str, Any]: Evaluation result in JSON format
+        """
+        return self.evaluate_result(criteria, transcript).to_verbose()
+    
+    def evaluate_result(self, criteria: List[str], transcript: str,
+                        known: Optional[Dict[int, CriterionResult]] = None,
+                        features: Optional[TranscriptFeatures] = None) -> EvaluationResult:
+        """
+        Evaluate lead qualification and return the compact result model, which
+        renders to the verbose (default) or compact response format.
         
-        if total_criteria > 0:
-            # Modified scoring formula that gives more weight to "Met" criteria
-            # and partial credit for "Unclear" criteria
-            confidence_score = int(((met_count + (unclear_count * 0.5)) / total_criteria) * 100)
+        Args:
+            criteria (List[str]): Evaluation criteria
+            transcript (str): Conversation transcript to evaluate
+            known (Optional[Dict[int, CriterionResult]]): Outcomes already known for some
+                criteria (by index), used as is instead of scoring those criteria
+            features (Optional[TranscriptFeatures]): Preprocessed features of the transcript
+                shared with other engines; the normalised text and entities are read from it
             
-            # Determine qualification status
-            if met_count == total_criteria:
-                qualification_status = "Qualified"
-            elif not_met_count > 0:
-                qualification_status = "Disqualified"
-            else:
-                qualification_status = "Needs More Info"
-        else:
-            confidence_score = 0
-            qualification_status = "Needs More Info"
-        
-        # Create notes
-        notes = []
-        if unclear_count > 0:
-            notes.append(f"There are {unclear_count} unclear criteria that need more information.")
-        if not_met_count > 0:
-            notes.append(f"There are {not_met_count} criteria that are not met.")
-        
-        # Create result with new structure
-        result = {
-            "qualification_status": qualification_status,
-            "confidence_score": confidence_score,
-            "criteria_evaluation": criteria_evaluation,
-            "notes": ". ".join(notes) if notes else "No additional notes."
-        }
+        Returns:
+            EvaluationResult: Per-criterion statuses, scores and evidence, and the overall outcome
+        """
+        known = known or {}
+        result = EvaluationResult(criteria)
+        result.reused = tuple(sorted(known))
+        if len(known) < len(criteria):
+            # Normalise (NFC, case folding) once for all criteria, and extract amounts,
+            # dates and durations when a criterion to score compares numbers
+            features = features or TranscriptFeatures(transcript)
+            normalized = features.normalized
+            transcript_lower = normalized.text
+            entities = None
+            if any(criterion_requirements(criterion) for index, criterion in enumerate(criteria) if index not in known):
+                entities = features.entities
+            # Misspelled keywords are looked up once per distinct word of the transcript
+            fuzzy = self._fuzzy_matches([criterion for index, criterion in enumerate(criteria) if index not in known],
+                                        transcript_lower)
+        
+        for index, criterion in enumerate(criteria):
+            if index in known:
+                outcome = known[index]
+                result.add(outcome.status, outcome.score, outcome.explanation, outcome.evidence)
+                continue
+            status, explanation, score, evidence = self._score_criterion(criterion, transcript, transcript_lower,
+                                                                         entities, fuzzy)
+            # Evidence is reported as offsets into the transcript as it was sent
+            result.add(status, score, explanation, [normalized.original_span(*span) for span in evidence])
+            
+            print(f"Criterion: '{criterion}' -> {status.label} - {explanation}")
         
-        return result
+        # Calculate confidence, status and notes
+        return result.finish()
 
 def evaluate_lead_qualification(prompt: str, transcript: str) -> str:
     """
@@ -0,0 +1,201 @@
+#!/usr/bin/env python
+"""
+Compressed request and response bodies.
+
+Request bodies may be sent with Content-Encoding gzip (or zstd when the
+optional zstandard package is installed); they are decompressed with a cap on
+the decompressed size. Responses are compressed with the best encoding the
+client accepts, chunk by chunk for streamed responses, so NDJSON results are
+sent compressed as they are produced.
+"""
+import os
+import zlib
+from typing import Iterable, Iterator, Optional
+
+try:
+    import zstandard
+except ImportError:  # zstd is optional
+    zstandard = None
+
+GZIP = "gzip"
+ZSTD = "zstd"
+IDENTITY = "identity"
+
+# Encodings in order of preference for responses
+SUPPORTED_ENCODINGS = ((ZSTD,) if zstandard is not None else ()) + (GZIP,)
+
+# Responses smaller than this are not worth compressing
+MIN_COMPRESS_SIZE = 1024
+
+_CHUNK_SIZE = 1 << 20
+
+
+class UnsupportedEncoding(Exception):
+    """
+    Raised for a request Content-Encoding the server cannot decode (HTTP 415).
+    """
+
+
+class BodyTooLarge(Exception):
+    """
+    Raised when a decompressed request body exceeds the size limit (HTTP 413).
+    """
+
+
+class InvalidBody(Exception):
+    """
+    Raised for a request body that is corrupt or truncated for its Content-Encoding (HTTP 400).
+    """
+
+
+def max_body_size() -> int:
+    """
+    Return the maximum decompressed request body size, LEAD_MAX_BODY_BYTES (default 512 MiB).
+    """
+    return int(os.getenv("LEAD_MAX_BODY_BYTES", str(512 * 1024 * 1024)))
+
+
+def decode_body(data: bytes, content_encoding: Optional[str], limit: Optional[int] = None) -> bytes:
+    """
+    Decompress a request body according to its Content-Encoding.
+
+    Args:
+        data (bytes): Raw request body
+        content_encoding (Optional[str]): Value of the Content-Encoding header
+        limit (Optional[int]): Maximum decompressed size, max_body_size() by default
+
+    Returns:
+        bytes: Decompressed body
+
+    Raises:
+        UnsupportedEncoding: When the encoding is not supported
+        BodyTooLarge: When the decompressed body exceeds the limit
+        InvalidBody: When the body is corrupt or truncated
+    """
+    encoding = (content_encoding or IDENTITY).strip().lower()
+    if encoding == IDENTITY or not data:
+        return data
+    limit = max_body_size() if limit is None else limit
+
+    if encoding in (GZIP, "x-gzip"):
+        # Decompress in bounded steps so a small compressed body cannot expand without limit
+        decompressor = zlib.decompressobj(wbits=zlib.MAX_WBITS | 16)
+        parts = []
+        size = 0
+        try:
+            chunk = decompressor.decompress(data, _CHUNK_SIZE)
+            while True:
+                size += len(chunk)
+                if size > limit:
+                    raise BodyTooLarge(f"Decompressed request body exceeds {limit} bytes")
+                parts.append(chunk)
+                if not decompressor.unconsumed_tail:
+                    break
+                chunk = decompressor.decompress(decompressor.unconsumed_tail, _CHUNK_SIZE)
+            parts.append(decompressor.flush())
+        except zlib.error as e:
+            raise InvalidBody(f"Invalid gzip request body: {e}") from e
+        if not decompressor.eof:
+            raise InvalidBody("Invalid gzip request body: truncated data")
+        if decompressor.unused_data:
+            raise InvalidBody("Invalid gzip request body: unexpected data after the gzip member")
+        return b"".join(parts)
+
+    if encoding == ZSTD and zstandard is not None:
+        reader = zstandard.ZstdDecompressor().stream_reader(data)
+        parts = []
+        size = 0
+        try:
+            while True:
+                chunk = reader.read(_CHUNK_SIZE)
+                if not chunk:
+                    break
+                size += len(chunk)
+                if size > limit:
+                    raise BodyTooLarge(f"Decompressed request body exceeds {limit} bytes")
+                parts.append(chunk)
+        except zstandard.ZstdError as e:
+            raise InvalidBody(f"Invalid zstd request body: {e}") from e
+        return b"".join(parts)
+
+    raise UnsupportedEncoding(
+        f"Unsupported Content-Encoding '{content_encoding}', expected one of: {', '.join(SUPPORTED_ENCODINGS)}"
+    )
+
+
+def choose_encoding(accept_encoding: Optional[str]) -> Optional[str]:
+    """
+    Return the preferred supported encoding of an Accept-Encoding header, or None.
+    """
+    if not accept_encoding:
+        return None
+    accepted = {}
+    for item in accept_encoding.split(","):
+        name, _, params = item.strip().partition(";")
+        quality = 1.0
+        params = params.strip()
+        if params.startswith("q="):
+            try:
+                quality = float(params[2:])
+            except ValueError:
+                quality = 0.0
+        accepted[name.strip().lower()] = quality
+    candidates = [encoding for encoding in SUPPORTED_ENCODINGS
+                  if accepted.get(encoding, accepted.get("*", 0.0)) > 0]
+    if not candidates:
+        return None
+    # Highest quality first, server preference on ties
+    return max(candidates, key=lambda encoding: (accepted.get(encoding, accepted.get("*", 0.0)),
+                                                -SUPPORTED_ENCODINGS.index(encoding)))
+
+
+class StreamCompressor:
+    """
+    Incremental compressor of one response body.
+    """
+
+    def __init__(self, encoding: str):
+        self.encoding = encoding
+        if encoding == ZSTD:
+            self._compressor = zstandard.ZstdCompressor().compressobj()
+        else:
+            self._compressor = zlib.compressobj(6, zlib.DEFLATED, zlib.MAX_WBITS | 16)
+
+    def compress(self, data: bytes, flush: bool = False) -> bytes:
+        """
+        Compress a chunk; with flush=True the output so far is made decodable
+        by the client (used between streamed records).
+        """
+        output = self._compressor.compress(data)
+        if flush:
+            if self.encoding == ZSTD:
+                output += self._compressor.flush(zstandard.COMPRESSOBJ_FLUSH_BLOCK)
+            else:
+                output += self._compressor.flush(zlib.Z_SYNC_FLUSH)
+        return output
+
+    def finish(self) -> bytes:
+        return self._compressor.flush()
+
+
+def compress_body(data: bytes, encoding: str) -> bytes:
+    """
+    Compress a complete response body.
+    """
+    compressor = StreamCompressor(encoding)
+    return compressor.compress(data) + compressor.finish()
+
+
+def compress_stream(chunks: Iterable[bytes], encoding: str) -> Iterator[bytes]:
+    """
+    Compress a streamed response body, flushing after every chunk so each
+    record reaches the client as soon as it is produced.
+    """
+    compressor = StreamCompressor(encoding)
+    for chunk in chunks:
+        if isinstance(chunk, str):
+            chunk = chunk.encode("utf-8")
+        output = compressor.compress(chunk, flush=True)
+        if output:
+            yield output
+    yield compressor.finish()
@@ -1,9 +1,12 @@
 from crewai import Agent, Crew, Process, Task
 from crewai.project import CrewBase, agent, crew, task
 from crewai.agents.agent_builder.base_agent import BaseAgent
-from typing import List
+from typing import Any, Dict, List, Optional
 from dotenv import load_dotenv
-from src.argent_qualify_lead6.tools import LeadConversationAnalyzer
+from src.argent_qualify_lead6.tools import KnowledgeSearchTool, LeadConversationAnalyzer
+from src.argent_qualify_lead6.knowledge_index import KnowledgeIndex, knowledge_index_from_env
+from src.argent_qualify_lead6.task_cache import TaskOutputCache
+from src.argent_qualify_lead6.instrumentation import agent_token_usage, install_crewai_hooks, span
 
 load_dotenv()
 # If you want to run a snippet of code before or after the crew starts,
@@ -39,12 +42,23 @@ class ArgentQualifyLead6():
     
     @agent
     def lead_qualifier(self) -> Agent:
+        tools = [LeadConversationAnalyzer()]
+        # Knowledge files are searched through the precomputed index instead of crewai
+        # knowledge sources, which would re-chunk and re-embed them on every run
+        if len(self.knowledge_index()):
+            tools.append(KnowledgeSearchTool())
         return Agent(
             config=self.agents_config['lead_qualifier'], # type: ignore[index]
-            tools=[LeadConversationAnalyzer()],
+            tools=tools,
             verbose=True
         )
 
+    def knowledge_index(self) -> KnowledgeIndex:
+        """
+        Return the index of the knowledge/ directory, updated for changed files once per process.
+        """
+        return knowledge_index_from_env()
+
     # To learn more about structured task outputs,
     # task dependencies, and task callbacks, check out the documentation:
     # https://docs.crewai.com/concepts/tasks#overview-of-a-task
@@ -71,8 +85,7 @@ class ArgentQualifyLead6():
     @crew
     def crew(self) -> Crew:
         """Creates the ArgentQualifyLead6 crew"""
-        # To learn how to add knowledge sources to your crew, check out the documentation:
-        # https://docs.crewai.com/concepts/knowledge#what-is-knowledge
+        # Knowledge files are served by the KnowledgeSearchTool of the lead qualifier (see knowledge_index.py)
 
         return Crew(
             agents=self.agents, # Automatically created by the @agent decorator
@@ -81,3 +94,77 @@ class ArgentQualifyLead6():
             verbose=True,
             # process=Process.hierarchical, # In case you wanna use that instead https://docs.crewai.com/how-to/Hierarchical/
         )
+
+    def kickoff_cached(self, inputs: Optional[Dict[str, Any]] = None,
+                       replay_from: Optional[str] = None,
+                       cache: Optional[TaskOutputCache] = None) -> List[str]:
+        """
+        Run the crew sequentially, reusing cached outputs of unchanged tasks.
+
+        Args:
+            inputs (Dict[str, Any], optional): Crew inputs. When replaying, defaults
+                to the inputs of the latest run.
+            replay_from (str, optional): Name of the task to resume from. Tasks before
+                it are taken from the cache, it and the following tasks are re-executed.
+            cache (TaskOutputCache, optional): Cache to use
+
+        Returns:
+            List[str]: Raw output of each task, in execution order
+        """
+        cache = cache or TaskOutputCache()
+        if inputs is None:
+            last_run = cache.load_last_run()
+            if last_run is None:
+                raise ValueError("No previous run found in the cache, run the crew first")
+            inputs = last_run["inputs"]
+
+        crew = self.crew()
+        task_names = [task.name for task in crew.tasks]
+        if replay_from is not None and replay_from not in task_names:
+            raise ValueError(f"Unknown task '{replay_from}', expected one of: {', '.join(task_names)}")
+        start_index = task_names.index(replay_from) if replay_from else len(task_names)
+
+        # Capture the templates before interpolation so keys do not depend on the inputs twice.
+        # Agents searching the knowledge files depend on their content as well.
+        knowledge = self.knowledge_index().fingerprint
+        templates = [
+            (
+                {"name": task.name, "description": task.description, "expected_output": task.expected_output},
+                {"role": task.agent.role, "goal": task.agent.goal, "backstory": task.agent.backstory,
+                 **({"knowledge": knowledge}
+                    if any(isinstance(tool, KnowledgeSearchTool) for tool in task.agent.tools or ()) else {})},
+            )
+            for task in crew.tasks
+        ]
+        crew._interpolate_inputs(inputs)
+
+        install_crewai_hooks()
+        raw_outputs: List[str] = []
+        task_keys = []
+        with span("kickoff", type(self).__name__, replay_from=replay_from):
+            for index, task in enumerate(crew.tasks):
+                # Sequential process: each task receives the raw output of all previous tasks
+                context = "\n\n----------\n\n".join(raw_outputs)
+                task_config, agent_config = templates[index]
+                key = cache.make_key(task_config, agent_config, inputs, context)
+                task_keys.append({"task": task.name, "key": key})
+
+                cached = cache.get(key) if index < start_index else None
+                with span("task", task.name, agent=task.agent.role.strip(), cached=cached is not None) as task_span:
+                    if cached is not None:
+                        print(f"Using cached output for task '{task.name}'")
+                        raw = cached["raw"]
+                        if task.output_file:
+                            with open(task.output_file, "w", encoding="utf-8") as f:
+                                f.write(raw)
+                    elif replay_from is not None and index < start_index:
+                        raise ValueError(f"No cached output for task '{task.name}', cannot replay from '{replay_from}'")
+                    else:
+                        usage_before = agent_token_usage(task.agent)
+                        raw = task.execute_sync(agent=task.agent, context=context or None).raw
+                        task_span.add_usage(agent_token_usage(task.agent), usage_before)
+                        cache.set(key, task.name, raw)
+                raw_outputs.append(raw)
+
+        cache.save_last_run(inputs, task_keys)
+        return raw_outputs
@@ -0,0 +1,125 @@
+#!/usr/bin/env python
+"""
+Single-pass, line-oriented extraction of evaluation criteria from a business prompt.
+
+The prompt is scanned once, line by line, and every operation on a line is
+proportional to its length, so parsing time is linear in the prompt size
+even for pasted playbooks of hundreds of KB.
+
+Rules:
+- A list item is a line starting (after indentation) with a bullet marker
+  (-, *, +, •) or a number marker (1. 1) 2.3.) followed by whitespace.
+- Non-blank lines following an item that are not items themselves continue it.
+  A blank line ends the current item.
+- Nested items are criteria of their own. An item ending with ":" that has
+  nested items is a heading and is not a criterion itself.
+- When the prompt has no list items, criteria are the sentences of the prompt.
+"""
+import re
+from typing import List, Optional
+
+BULLET_MARKERS = "-*+•"
+_SEPARATOR_CHARS = BULLET_MARKERS + "=_ \t"
+
+# Number markers such as "1.", "2)", "3.1." or "3.1)"
+_NUMBER_MARKER_RE = re.compile(r"\d{1,9}(?:\.\d{1,9})*[.)]")
+_SENTENCE_SPLIT_RE = re.compile(r"[.!?]\s+")
+
+# Sentences shorter than this are fragments rather than criteria
+MIN_SENTENCE_LENGTH = 11
+
+
+class _Item:
+    __slots__ = ("indent", "parts", "has_children")
+
+    def __init__(self, indent: int, text: str):
+        self.indent = indent
+        self.parts = [text]
+        self.has_children = False
+
+    def text(self) -> str:
+        # Collapse internal whitespace and newlines
+        return " ".join(" ".join(self.parts).split())
+
+
+def _list_item(line: str) -> Optional[tuple]:
+    """
+    Return (indent, text) when the line is a list item, None otherwise.
+    """
+    stripped = line.lstrip()
+    if not stripped:
+        return None
+    indent = len(line) - len(stripped)
+
+    if stripped[0] in BULLET_MARKERS:
+        rest = stripped[1:]
+        # A marker must be followed by whitespace ("-5%" or "**bold**" are not items),
+        # except for "•" which is never used for anything else
+        if stripped[0] != "•" and (not rest or not rest[0].isspace()):
+            return None
+        text = rest.strip()
+    else:
+        match = _NUMBER_MARKER_RE.match(stripped)
+        if match is None:
+            return None
+        rest = stripped[match.end():]
+        if not rest or not rest[0].isspace():
+            return None
+        text = rest.strip()
+
+    return indent, text
+
+
+def parse_criteria(prompt: str) -> List[str]:
+    """
+    Extract criteria from a business prompt in a single linear pass.
+
+    Args:
+        prompt (str): Prompt containing the evaluation criteria
+
+    Returns:
+        List[str]: Criteria in prompt order, each one counted once
+    """
+    items: List[_Item] = []
+    # Items whose nesting is still open, outermost first
+    stack: List[_Item] = []
+    current: Optional[_Item] = None
+
+    for line in prompt.splitlines():
+        if not line.strip(_SEPARATOR_CHARS):
+            # A blank or separator line ("- - -", "***") ends the current item,
+            # but not the list nesting
+            current = None
+            continue
+
+        parsed = _list_item(line)
+        if parsed is None:
+            if current is not None:
+                current.parts.append(line)
+            continue
+
+        indent, text = parsed
+        while stack and stack[-1].indent >= indent:
+            stack.pop()
+        if stack:
+            stack[-1].has_children = True
+        current = _Item(indent, text)
+        items.append(current)
+        stack.append(current)
+
+    criteria = []
+    for item in items:
+        text = item.text()
+        if item.has_children and text.endswith(":"):
+            continue
+        if text:
+            criteria.append(text)
+    if criteria:
+        return criteria
+
+    # No list found, split by sentences
+    for sentence in _SENTENCE_SPLIT_RE.split(prompt):
+        clean_sentence = sentence.strip()
+        if len(clean_sentence) >= MIN_SENTENCE_LENGTH:
+            criteria.append(clean_sentence)
+    return criteria
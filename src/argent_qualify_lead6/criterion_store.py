@@ -0,0 +1,264 @@
+#!/usr/bin/env python
+"""
+Persistent per-criterion results, for re-scoring leads when a prompt changes.
+
+The outcome of a criterion depends only on the criterion and the transcript,
+so outcomes are stored keyed by (normalised criterion text, transcript hash).
+The transcripts of evaluated leads are stored once per flow. When a tenant
+edits their business prompt, re-scoring diffs the criteria of the two prompt
+versions, scores only the added or changed criteria against the stored
+transcripts, and recomputes the confidence score and qualification status
+from the stored outcomes of the unchanged ones.
+"""
+import hashlib
+import os
+import re
+import sqlite3
+import threading
+import time
+import zlib
+from array import array
+from typing import Any, Dict, Iterator, List, Optional, Sequence, Tuple
+
+from .fuzzy import keyword_matcher
+from .results import CriterionResult, CriterionStatus, EvaluationResult
+from .text_normalization import normalize_keyword
+
+_SPACE_RE = re.compile(r"\s+")
+
+
+def criterion_key(criterion: str, matcher: str = "") -> str:
+    """
+    Return the key of a criterion: a hash of its text normalised (NFC, case folding,
+    whitespace and trailing punctuation), so cosmetic edits keep their results.
+
+    Args:
+        criterion (str): Criterion text
+        matcher (str): Keyword matching mode the outcome was scored with (see keyword_matcher),
+            so outcomes of another mode are not reused
+    """
+    text = _SPACE_RE.sub(" ", normalize_keyword(criterion)).strip().rstrip(".;:,")
+    if matcher:
+        text = f"{text}\0{matcher}"
+    return hashlib.sha1(text.encode("utf-8")).hexdigest()
+
+
+def transcript_hash(transcript: str) -> str:
+    """
+    Return the hash identifying a transcript (evidence offsets depend on the exact text).
+    """
+    return hashlib.sha256(transcript.encode("utf-8")).hexdigest()
+
+
+def diff_criteria(old: Sequence[str], new: Sequence[str]) -> Dict[str, List[str]]:
+    """
+    Compare the criteria of two prompt versions by normalised text.
+
+    Returns:
+        Dict[str, List[str]]: "added" (new or edited criteria of the new version),
+            "removed" (criteria of the old version that are gone) and "unchanged"
+    """
+    old_keys = {criterion_key(criterion) for criterion in old}
+    new_keys = {criterion_key(criterion) for criterion in new}
+    return {
+        "added": [criterion for criterion in new if criterion_key(criterion) not in old_keys],
+        "removed": [criterion for criterion in old if criterion_key(criterion) not in new_keys],
+        "unchanged": [criterion for criterion in new if criterion_key(criterion) in old_keys],
+    }
+
+
+def _oid(document: Dict[str, Any], field: str) -> str:
+    value = document.get(field, "") if isinstance(document, dict) else ""
+    return value.get("$oid", "") if isinstance(value, dict) else str(value)
+
+
+class CriterionStore:
+    """
+    SQLite store of per-criterion outcomes and of the transcripts of evaluated leads.
+    """
+
+    def __init__(self, db_path: str, matcher: Optional[str] = None):
+        """
+        Open (and create if needed) the store.
+
+        Args:
+            db_path (str): Path of the SQLite database file
+            matcher (Optional[str]): Keyword matching mode of the stored outcomes,
+                keyword_matcher() (from LEAD_FUZZY_KEYWORDS) by default
+        """
+        self.db_path = db_path
+        self.matcher = keyword_matcher() if matcher is None else matcher
+        self._lock = threading.Lock()
+        self._conn = sqlite3.connect(db_path, check_same_thread=False, timeout=30)
+        with self._lock, self._conn:
+            self._conn.execute("PRAGMA journal_mode=WAL")
+            self._conn.execute("PRAGMA synchronous=NORMAL")
+            self._conn.execute("""
+                CREATE TABLE IF NOT EXISTS criterion_results (
+                    criterion_key TEXT NOT NULL,
+                    transcript_hash TEXT NOT NULL,
+                    status INTEGER NOT NULL,
+                    score INTEGER NOT NULL,
+                    explanation TEXT NOT NULL,
+                    evidence BLOB NOT NULL,
+                    created_at REAL NOT NULL,
+                    PRIMARY KEY (transcript_hash, criterion_key)
+                ) WITHOUT ROWID
+            """)
+            self._conn.execute("""
+                CREATE TABLE IF NOT EXISTS transcripts (
+                    transcript_hash TEXT PRIMARY KEY,
+                    transcript BLOB NOT NULL
+                )
+            """)
+            # One row per lead of a flow; lead_key is the lead id, or the transcript hash for leads without id
+            self._conn.execute("""
+                CREATE TABLE IF NOT EXISTS leads (
+                    flow_id TEXT NOT NULL,
+                    lead_key TEXT NOT NULL,
+                    lead_id TEXT NOT NULL,
+                    user_id TEXT NOT NULL,
+                    transcript_hash TEXT NOT NULL,
+                    evaluated_at REAL NOT NULL,
+                    PRIMARY KEY (flow_id, lead_key)
+                )
+            """)
+
+    def known(self, criteria: Sequence[str], digest: str) -> Dict[int, CriterionResult]:
+        """
+        Return the stored outcomes of criteria for a transcript, by criterion index.
+
+        Args:
+            criteria (Sequence[str]): Evaluation criteria
+            digest (str): transcript_hash() of the transcript
+        """
+        indices: Dict[str, List[int]] = {}
+        for index, criterion in enumerate(criteria):
+            indices.setdefault(criterion_key(criterion, self.matcher), []).append(index)
+        if not indices:
+            return {}
+        placeholders = ", ".join("?" * len(indices))
+        with self._lock:
+            rows = self._conn.execute(
+                "SELECT criterion_key, status, score, explanation, evidence FROM criterion_results"
+                f" WHERE transcript_hash = ? AND criterion_key IN ({placeholders})",
+                (digest, *indices),
+            ).fetchall()
+        known = {}
+        for key, status, score, explanation, evidence in rows:
+            flat = array("I")
+            flat.frombytes(evidence)
+            outcome = CriterionResult(CriterionStatus(status), score, explanation, list(zip(flat[::2], flat[1::2])))
+            for index in indices[key]:
+                known[index] = outcome
+        return known
+
+    def save(self, result: EvaluationResult, digest: str) -> int:
+        """
+        Store the outcomes of the criteria a result scored itself (not the reused ones).
+
+        Returns:
+            int: Number of outcomes stored
+        """
+        reused = set(result.reused)
+        now = time.time()
+        rows = []
+        for index, criterion in enumerate(result.criteria):
+            if index in reused:
+                continue
+            start, end = result.evidence_bounds[index], result.evidence_bounds[index + 1]
+            rows.append((criterion_key(criterion, self.matcher), digest, result.statuses[index], result.scores[index],
+                         result.explanations[index], result.evidence[start:end].tobytes(), now))
+        if rows:
+            with self._lock, self._conn:
+                self._conn.executemany(
+                    "INSERT OR REPLACE INTO criterion_results (criterion_key, transcript_hash, status, score,"
+                    " explanation, evidence, created_at) VALUES (?, ?, ?, ?, ?, ?, ?)", rows)
+        return len(rows)
+
+    def remember_leads(self, leads: Sequence[Tuple[Dict[str, Any], str]]) -> int:
+        """
+        Store the transcripts of evaluated leads that belong to a flow, so they can be re-scored.
+
+        Args:
+            leads (Sequence[Tuple[Dict[str, Any], str]]): (lead document, transcript) pairs
+
+        Returns:
+            int: Number of leads stored (leads without flowId are skipped)
+        """
+        now = time.time()
+        transcripts = {}
+        rows = []
+        for lead_data, transcript in leads:
+            flow_id = _oid(lead_data, "flowId")
+            if not flow_id:
+                continue
+            digest = transcript_hash(transcript)
+            transcripts[digest] = transcript
+            lead_id = _oid(lead_data, "_id")
+            rows.append((flow_id, lead_id or digest, lead_id, _oid(lead_data, "userId"), digest, now))
+        if rows:
+            with self._lock, self._conn:
+                self._conn.executemany(
+                    "INSERT OR IGNORE INTO transcripts (transcript_hash, transcript) VALUES (?, ?)",
+                    [(digest, zlib.compress(text.encode("utf-8"))) for digest, text in transcripts.items()])
+                self._conn.executemany(
+                    "INSERT OR REPLACE INTO leads (flow_id, lead_key, lead_id, user_id, transcript_hash, evaluated_at)"
+                    " VALUES (?, ?, ?, ?, ?, ?)", rows)
+        return len(rows)
+
+    def leads(self, flow_id: str) -> List[Dict[str, Any]]:
+        """
+        Return the stored leads of a flow: lead_id, user_id and transcript_hash.
+        """
+        with self._lock:
+            rows = self._conn.execute(
+                "SELECT lead_id, user_id, transcript_hash FROM leads WHERE flow_id = ? ORDER BY evaluated_at, lead_key",
+                (flow_id,),
+            ).fetchall()
+        return [{"lead_id": lead_id, "user_id": user_id, "transcript_hash": digest}
+                for lead_id, user_id, digest in rows]
+
+    def transcript(self, digest: str) -> Optional[str]:
+        """
+        Return a stored transcript by hash, or None.
+        """
+        with self._lock:
+            row = self._conn.execute("SELECT transcript FROM transcripts WHERE transcript_hash = ?",
+                                     (digest,)).fetchone()
+        return zlib.decompress(row[0]).decode("utf-8") if row else None
+
+    def rescore(self, evaluator, criteria: List[str], flow_id: str) -> Iterator[Tuple[Dict[str, Any], EvaluationResult]]:
+        """
+        Re-score the stored leads of a flow against criteria, scoring only the criteria
+        without a stored outcome; the overall outcome is recomputed from all outcomes.
+
+        Args:
+            evaluator (LeadQualificationEvaluator): Evaluator scoring the missing criteria
+            criteria (List[str]): Criteria of the new prompt version
+            flow_id (str): Flow whose leads are re-scored
+
+        Returns:
+            Iterator[Tuple[Dict[str, Any], EvaluationResult]]: (lead, result) pairs
+        """
+        for lead in self.leads(flow_id):
+            digest = lead["transcript_hash"]
+            known = self.known(criteria, digest)
+            # Transcripts are only read when a criterion has to be scored
+            transcript = "" if len(known) == len(criteria) else self.transcript(digest)
+            if transcript is None:
+                continue
+            result = evaluator.evaluate_result(criteria, transcript, known=known)
+            self.save(result, digest)
+            yield lead, result
+
+    def close(self) -> None:
+        self._conn.close()
+
+
+def criterion_store_from_env() -> Optional[CriterionStore]:
+    """
+    Open the store at LEAD_CRITERIA_DB, or return None when it is not set (storing outcomes is opt-in).
+    """
+    db_path = os.getenv("LEAD_CRITERIA_DB", "")
+    return CriterionStore(db_path) if db_path else None
@@ -0,0 +1,251 @@
+#!/usr/bin/env python
+"""
+Reuse of evaluations for duplicate and near-duplicate transcripts.
+
+Calls made by AI agents follow a script and often differ only in a name or a
+number. The reuse index keeps a MinHash sketch (the bottom-k hashes of the
+word shingles of the normalised transcript, with digits masked) of every
+transcript it evaluated, per criteria list. A transcript whose estimated
+Jaccard similarity to an indexed one reaches the threshold reuses its
+per-criterion outcomes, except for criteria that compare numbers (amounts,
+timeframes, numeric keywords), which are scored against the new transcript.
+Identical transcripts reuse the whole result.
+
+Reuse is opt-in (LEAD_DEDUP=1) and local to a process; the reuse rate is
+reported by the metrics registry.
+"""
+import hashlib
+import heapq
+import os
+import re
+import threading
+import zlib
+from collections import Counter, OrderedDict
+from typing import Dict, List, Optional, Sequence, Tuple
+
+from .call_quality_evaluator import LeadQualificationEvaluator
+from .entities import criterion_requirements
+from .features import TranscriptFeatures
+from .fuzzy import keyword_matcher
+from .metrics import registry
+from .results import EvaluationResult
+from .text_normalization import normalize_text
+
+MATCH_EXACT = "exact"
+MATCH_NEAR = "near"
+
+_TOKEN_RE = re.compile(r"\w+")
+_DIGIT_RE = re.compile(r"\d+")
+
+
+def transcript_sketch(transcript: str, sketch_size: int = 64, shingle_size: int = 5) -> Tuple[int, ...]:
+    """
+    Return the MinHash sketch of a transcript: the sketch_size smallest hashes of
+    its word shingles, after normalisation, diacritic folding and digit masking.
+
+    Args:
+        transcript (str): Transcript to sketch
+        sketch_size (int): Number of hashes kept
+        shingle_size (int): Words per shingle
+
+    Returns:
+        Tuple[int, ...]: Sorted hashes
+    """
+    text = _DIGIT_RE.sub("0", normalize_text(transcript, fold_diacritics=True).text)
+    tokens = _TOKEN_RE.findall(text)
+    if len(tokens) < shingle_size:
+        shingles = {" ".join(tokens)} if tokens else set()
+    else:
+        shingles = {" ".join(tokens[i:i + shingle_size]) for i in range(len(tokens) - shingle_size + 1)}
+    # crc32 rather than hash(), which differs between processes
+    return tuple(heapq.nsmallest(sketch_size, {zlib.crc32(shingle.encode("utf-8")) for shingle in shingles}))
+
+
+def estimate_similarity(first: Sequence[int], second: Sequence[int], sketch_size: int = 64) -> float:
+    """
+    Estimate the Jaccard similarity of two transcripts from their bottom-k sketches.
+    """
+    union = heapq.nsmallest(sketch_size, set(first) | set(second))
+    if not union:
+        return 1.0
+    both = set(first) & set(second)
+    return sum(1 for value in union if value in both) / len(union)
+
+
+def _compares_numbers(criterion: str) -> bool:
+    """
+    Return True when the outcome of a criterion depends on numbers in the transcript,
+    which differ between near-duplicates.
+    """
+    return bool(criterion_requirements(criterion)) or any(char.isdigit() for char in criterion)
+
+
+class _Entry:
+    __slots__ = ("scope", "digest", "sketch", "result")
+
+    def __init__(self, scope: str, digest: str, sketch: Tuple[int, ...], result: EvaluationResult):
+        self.scope = scope
+        self.digest = digest
+        self.sketch = sketch
+        self.result = result
+
+
+class ReuseIndex:
+    """
+    Bounded index of evaluated transcripts, looked up before evaluating a new one.
+    """
+
+    def __init__(self, threshold: float = 0.9, capacity: int = 10000, sketch_size: int = 64,
+                 shingle_size: int = 5):
+        """
+        Args:
+            threshold (float): Minimum estimated Jaccard similarity to reuse outcomes
+            capacity (int): Maximum number of indexed transcripts, least recently used are evicted
+            sketch_size (int): Hashes per MinHash sketch
+            shingle_size (int): Words per shingle
+        """
+        self.threshold = threshold
+        self.capacity = capacity
+        self.sketch_size = sketch_size
+        self.shingle_size = shingle_size
+        self._lock = threading.Lock()
+        self._entries: "OrderedDict[int, _Entry]" = OrderedDict()
+        self._next_id = 0
+        # (scope, transcript digest) -> entry id, and (scope, sketch hash) -> entry ids
+        self._exact: Dict[Tuple[str, str], int] = {}
+        self._postings: Dict[Tuple[str, int], set] = {}
+        self._lookups = 0
+        self._reused = {MATCH_EXACT: 0, MATCH_NEAR: 0}
+
+    @staticmethod
+    def scope_key(criteria: Sequence[str], matcher: str = "") -> str:
+        """
+        Return the key of a criteria list and keyword matching mode (see keyword_matcher);
+        outcomes are only reused under the same criteria and mode.
+        """
+        text = "\n".join(criteria)
+        if matcher:
+            text = f"{text}\0{matcher}"
+        return hashlib.sha1(text.encode("utf-8")).hexdigest()
+
+    def _find_exact(self, scope: str, digest: str) -> Optional[_Entry]:
+        entry_id = self._exact.get((scope, digest))
+        if entry_id is None:
+            return None
+        self._entries.move_to_end(entry_id)
+        return self._entries[entry_id]
+
+    def _find_near(self, scope: str, sketch: Tuple[int, ...]) -> Optional[_Entry]:
+        # Candidates share sketch hashes with the transcript; check the best few
+        shared = Counter()
+        for value in sketch:
+            shared.update(self._postings.get((scope, value), ()))
+        minimum_shared = self.threshold * len(sketch) / 2
+        for entry_id, count in shared.most_common(5):
+            if count < minimum_shared:
+                break
+            entry = self._entries[entry_id]
+            if estimate_similarity(sketch, entry.sketch, self.sketch_size) >= self.threshold:
+                self._entries.move_to_end(entry_id)
+                return entry
+        return None
+
+    def _add(self, scope: str, digest: str, sketch: Tuple[int, ...], result: EvaluationResult) -> None:
+        if (scope, digest) in self._exact:
+            return
+        entry_id = self._next_id
+        self._next_id += 1
+        self._entries[entry_id] = _Entry(scope, digest, sketch, result)
+        self._exact[(scope, digest)] = entry_id
+        for value in sketch:
+            self._postings.setdefault((scope, value), set()).add(entry_id)
+        while len(self._entries) > self.capacity:
+            evicted_id, evicted = self._entries.popitem(last=False)
+            del self._exact[(evicted.scope, evicted.digest)]
+            for value in evicted.sketch:
+                ids = self._postings[(evicted.scope, value)]
+                ids.discard(evicted_id)
+                if not ids:
+                    del self._postings[(evicted.scope, value)]
+
+    def evaluate(self, evaluator: LeadQualificationEvaluator, criteria: List[str], transcript: str,
+                 features: Optional[TranscriptFeatures] = None) -> EvaluationResult:
+        """
+        Evaluate a transcript, reusing the outcomes of an indexed duplicate or near-duplicate.
+
+        Args:
+            evaluator (LeadQualificationEvaluator): Evaluator scoring the criteria that are not reused
+            criteria (List[str]): Evaluation criteria
+            transcript (str): Conversation transcript to evaluate
+            features (Optional[TranscriptFeatures]): Preprocessed features of the transcript, passed to the evaluator
+
+        Returns:
+            EvaluationResult: Result of the transcript
+        """
+        scope = self.scope_key(criteria, keyword_matcher(evaluator.fuzzy_keywords))
+        digest = hashlib.sha1(transcript.encode("utf-8")).hexdigest()
+        with self._lock:
+            entry = self._find_exact(scope, digest)
+        match = MATCH_EXACT if entry is not None else None
+        if entry is None:
+            sketch = transcript_sketch(transcript, self.sketch_size, self.shingle_size)
+            with self._lock:
+                entry = self._find_near(scope, sketch)
+            match = MATCH_NEAR if entry is not None else None
+        with self._lock:
+            self._lookups += 1
+            if match:
+                self._reused[match] += 1
+            reuse_rate = sum(self._reused.values()) / self._lookups
+        registry.inc("dedup.lookups")
+        registry.set_gauge("dedup.reuse_rate", round(reuse_rate, 4))
+
+        if match == MATCH_EXACT:
+            registry.inc("dedup.reused", labels={"match": MATCH_EXACT})
+            registry.inc("dedup.criteria_reused", len(criteria))
+            return evaluator.evaluate_result(criteria, transcript,
+                                             known={i: entry.result.criterion(i) for i in range(len(criteria))},
+                                             features=features)
+
+        if match == MATCH_NEAR:
+            # Evidence offsets belong to the other transcript and are not carried over
+            known = {}
+            for index, criterion in enumerate(criteria):
+                if not _compares_numbers(criterion):
+                    outcome = entry.result.criterion(index)
+                    outcome.evidence = ()
+                    known[index] = outcome
+            registry.inc("dedup.reused", labels={"match": MATCH_NEAR})
+            registry.inc("dedup.criteria_reused", len(known))
+            return evaluator.evaluate_result(criteria, transcript, known=known, features=features)
+
+        result = evaluator.evaluate_result(criteria, transcript, features=features)
+        with self._lock:
+            # Only fully scored results are indexed, so reuse never chains approximations
+            self._add(scope, digest, sketch, result)
+        return result
+
+    def stats(self) -> Dict[str, float]:
+        """
+        Return the number of lookups, of exact and near-duplicate reuses, and the reuse rate.
+        """
+        with self._lock:
+            reused = sum(self._reused.values())
+            return {
+                "lookups": self._lookups,
+                "exact": self._reused[MATCH_EXACT],
+                "near": self._reused[MATCH_NEAR],
+                "reuse_rate": reused / self._lookups if self._lookups else 0.0,
+                "indexed": len(self._entries),
+            }
+
+
+def reuse_index_from_env() -> Optional[ReuseIndex]:
+    """
+    Build the reuse index configured by LEAD_DEDUP (disabled unless "1"), LEAD_DEDUP_THRESHOLD
+    (default 0.9) and LEAD_DEDUP_CAPACITY (default 10000), or return None when disabled.
+    """
+    if os.getenv("LEAD_DEDUP", "").lower() not in ("1", "true", "yes"):
+        return None
+    return ReuseIndex(threshold=float(os.getenv("LEAD_DEDUP_THRESHOLD", "0.9")),
+                      capacity=int(os.getenv("LEAD_DEDUP_CAPACITY", "10000")))
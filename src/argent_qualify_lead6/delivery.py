@@ -0,0 +1,465 @@
+#!/usr/bin/env python
+"""
+Batched webhook delivery of evaluation results, e.g. to a CRM.
+
+Evaluations only append their result to an in-memory queue per destination
+and never wait on the network. A sender thread per destination gathers the
+queued results into batches (batch_size results or flush_interval seconds),
+stores each batch in a local SQLite outbox and POSTs it as
+{"results": [...]} over a pooled keep-alive session. A batch is removed
+from the outbox once the destination answers 2xx; connection errors,
+timeouts, 429 and 5xx answers are retried with exponential backoff (and
+Retry-After), other answers and batches out of attempts are kept in the
+outbox as dead. Each process holds a lease on its stored batches, renewed by
+its sender threads; batches whose lease expired (their process exited) are
+taken over and sent by another process using the outbox.
+
+Each batch is sent with an Idempotency-Key header, the same on every
+attempt, so the receiver can ignore a batch it already processed.
+"""
+import atexit
+import json
+import os
+import random
+import sqlite3
+import threading
+import time
+import uuid
+import zlib
+from collections import deque
+from typing import Any, Dict, List, Optional, Sequence
+
+import requests
+from requests.adapters import HTTPAdapter
+
+from .metrics import registry
+from .results import EvaluationResult
+
+BATCH_PENDING = "pending"
+BATCH_DEAD = "dead"
+
+# Answers worth retrying; other non-2xx answers will not succeed later
+RETRY_STATUS_CODES = frozenset((408, 425, 429, 500, 502, 503, 504))
+
+
+class Outbox:
+    """
+    SQLite persistence of undelivered batches.
+    """
+
+    def __init__(self, db_path: str, lease_seconds: float = 60):
+        """
+        Args:
+            db_path (str): Path of the SQLite database file
+            lease_seconds (float): Time after which the batches of a process that stopped
+                renewing its lease are taken over
+        """
+        self.db_path = db_path
+        self.lease_seconds = lease_seconds
+        # Identifies this process among the processes sharing the outbox (PIDs get reused)
+        self.owner = uuid.uuid4().hex
+        self._lock = threading.Lock()
+        self._conn = sqlite3.connect(db_path, check_same_thread=False)
+        self._conn.row_factory = sqlite3.Row
+        with self._lock, self._conn:
+            self._conn.execute("PRAGMA journal_mode=WAL")
+            self._conn.execute("""
+                CREATE TABLE IF NOT EXISTS outbox (
+                    id TEXT PRIMARY KEY,
+                    destination TEXT NOT NULL,
+                    payload BLOB NOT NULL,
+                    size INTEGER NOT NULL,
+                    status TEXT NOT NULL,
+                    attempts INTEGER NOT NULL DEFAULT 0,
+                    next_attempt_at REAL NOT NULL,
+                    created_at REAL NOT NULL,
+                    last_error TEXT,
+                    owner TEXT NOT NULL,
+                    lease_expires REAL NOT NULL
+                )
+            """)
+            # Outboxes created before leases were added identify owners by PID
+            columns = {row["name"] for row in self._conn.execute("PRAGMA table_info(outbox)")}
+            if "owner" not in columns:
+                self._conn.execute("ALTER TABLE outbox ADD COLUMN owner TEXT NOT NULL DEFAULT ''")
+                self._conn.execute("ALTER TABLE outbox ADD COLUMN lease_expires REAL NOT NULL DEFAULT 0")
+            self._owner_pid_column = "owner_pid" in columns
+            self._conn.execute("CREATE INDEX IF NOT EXISTS outbox_due ON outbox (destination, status, next_attempt_at)")
+
+    def add(self, destination: str, results: List[Dict[str, Any]]) -> str:
+        """
+        Store a batch for a destination.
+
+        Returns:
+            str: Batch id
+        """
+        batch_id = uuid.uuid4().hex
+        now = time.time()
+        payload = zlib.compress(json.dumps(results, ensure_ascii=False).encode("utf-8"))
+        columns = "id, destination, payload, size, status, next_attempt_at, created_at, owner, lease_expires"
+        values = [batch_id, destination, payload, len(results), BATCH_PENDING, now, now, self.owner,
+                  now + self.lease_seconds]
+        if self._owner_pid_column:
+            columns += ", owner_pid"
+            values.append(0)
+        with self._lock, self._conn:
+            self._conn.execute(
+                f"INSERT INTO outbox ({columns}) VALUES ({', '.join('?' * len(values))})", values)
+        return batch_id
+
+    def due(self, destination: str, limit: int = 10) -> List[sqlite3.Row]:
+        """
+        Return the batches of this process for a destination whose next attempt is due, oldest first.
+        """
+        with self._lock:
+            return self._conn.execute(
+                "SELECT * FROM outbox WHERE destination = ? AND status = ? AND owner = ? AND next_attempt_at <= ?"
+                " ORDER BY created_at LIMIT ?",
+                (destination, BATCH_PENDING, self.owner, time.time(), limit),
+            ).fetchall()
+
+    def next_attempt_at(self, destination: str) -> Optional[float]:
+        """
+        Return when the next pending batch of this process for a destination is due.
+        """
+        with self._lock:
+            row = self._conn.execute(
+                "SELECT MIN(next_attempt_at) FROM outbox WHERE destination = ? AND status = ? AND owner = ?",
+                (destination, BATCH_PENDING, self.owner),
+            ).fetchone()
+        return row[0]
+
+    def delivered(self, batch_id: str) -> None:
+        with self._lock, self._conn:
+            self._conn.execute("DELETE FROM outbox WHERE id = ?", (batch_id,))
+
+    def retry(self, batch_id: str, next_attempt_at: float, error: str) -> None:
+        with self._lock, self._conn:
+            self._conn.execute(
+                "UPDATE outbox SET attempts = attempts + 1, next_attempt_at = ?, last_error = ? WHERE id = ?",
+                (next_attempt_at, error, batch_id),
+            )
+
+    def dead(self, batch_id: str, error: str) -> None:
+        with self._lock, self._conn:
+            self._conn.execute(
+                "UPDATE outbox SET attempts = attempts + 1, status = ?, last_error = ? WHERE id = ?",
+                (BATCH_DEAD, error, batch_id),
+            )
+
+    def renew_lease(self) -> int:
+        """
+        Extend the lease of the pending batches of this process.
+
+        Returns:
+            int: Number of renewed batches
+        """
+        with self._lock, self._conn:
+            cursor = self._conn.execute(
+                "UPDATE outbox SET lease_expires = ? WHERE owner = ? AND status = ?",
+                (time.time() + self.lease_seconds, self.owner, BATCH_PENDING),
+            )
+            return cursor.rowcount
+
+    def release_lease(self) -> None:
+        """
+        Let other processes take over the pending batches of this process right away (on shutdown).
+        """
+        with self._lock, self._conn:
+            self._conn.execute("UPDATE outbox SET lease_expires = 0 WHERE owner = ? AND status = ?",
+                               (self.owner, BATCH_PENDING))
+
+    def claim_orphaned(self, now: Optional[float] = None) -> int:
+        """
+        Take over the pending batches whose lease expired.
+
+        Several server processes may share the outbox (e.g. gunicorn workers),
+        so only batches no live process renews are claimed, each by a single process.
+
+        Returns:
+            int: Number of claimed batches
+        """
+        now = time.time() if now is None else now
+        with self._lock, self._conn:
+            cursor = self._conn.execute(
+                "UPDATE outbox SET owner = ?, lease_expires = ? WHERE status = ? AND owner != ? AND lease_expires < ?",
+                (self.owner, now + self.lease_seconds, BATCH_PENDING, self.owner, now),
+            )
+            return cursor.rowcount
+
+    def counts(self) -> Dict[str, Dict[str, int]]:
+        """
+        Return the number of pending and dead results by destination.
+        """
+        counts: Dict[str, Dict[str, int]] = {}
+        with self._lock:
+            for row in self._conn.execute(
+                "SELECT destination, status, SUM(size) FROM outbox GROUP BY destination, status"
+            ):
+                counts.setdefault(row[0], {BATCH_PENDING: 0, BATCH_DEAD: 0})[row[1]] = row[2]
+        return counts
+
+    def close(self) -> None:
+        with self._lock:
+            self._conn.close()
+
+
+def _render(message: Dict[str, Any]) -> Dict[str, Any]:
+    """
+    Render the EvaluationResult of a queued message, on the sender thread rather than
+    on the evaluation path.
+    """
+    result = message.get("result")
+    if isinstance(result, EvaluationResult):
+        message = dict(message, result=result.to_verbose())
+    return message
+
+
+class _Destination:
+    """
+    Queue and sender thread of one webhook URL.
+    """
+
+    def __init__(self, delivery: "WebhookDelivery", url: str):
+        self.delivery = delivery
+        self.url = url
+        # deque.append is atomic, so submitting never takes a lock
+        self.queue: deque = deque()
+        self.wake = threading.Event()
+        # While the destination fails, no batch is sent before the retry time of the failed one
+        self.resume_at = 0.0
+        self.thread = threading.Thread(target=self._run, name=f"webhook-{url}", daemon=True)
+
+    def _run(self) -> None:
+        delivery = self.delivery
+        next_flush = time.monotonic() + delivery.flush_interval
+        while True:
+            stopping = delivery._stop.is_set()
+            delivery._keep_lease()
+            if stopping or len(self.queue) >= delivery.batch_size or time.monotonic() >= next_flush:
+                self._batch()
+                next_flush = time.monotonic() + delivery.flush_interval
+            if stopping or time.time() >= self.resume_at:
+                self._send_due(stopping)
+            if stopping:
+                return
+            wait = next_flush - time.monotonic()
+            retry_at = max(delivery.outbox.next_attempt_at(self.url) or float("inf"), self.resume_at)
+            wait = min(wait, retry_at - time.time(), delivery.outbox.lease_seconds / 3)
+            self.wake.wait(max(wait, 0.01))
+            self.wake.clear()
+
+    def _batch(self) -> None:
+        """
+        Move the queued results to the outbox, in batches.
+        """
+        registry.set_gauge("delivery.queued", len(self.queue), {"destination": self.url})
+        while self.queue:
+            results = []
+            while self.queue and len(results) < self.delivery.batch_size:
+                results.append(_render(self.queue.popleft()))
+            self.delivery.outbox.add(self.url, results)
+
+    def _send_due(self, stopping: bool) -> None:
+        """
+        Send the due batches; when stopping, make a single attempt at each.
+        """
+        while True:
+            rows = self.delivery.outbox.due(self.url)
+            if not rows:
+                return
+            for row in rows:
+                retry_at = self.delivery._send(self.url, row)
+                if retry_at is not None and not stopping:
+                    # The destination is failing, wait for the backoff before the next batch
+                    self.resume_at = retry_at
+                    return
+            if stopping:
+                return
+
+
+class WebhookDelivery:
+    """
+    Delivers evaluation results to webhook URLs in batches, off the evaluation path.
+    """
+
+    def __init__(self, urls: Sequence[str], outbox: Outbox, batch_size: int = 100, flush_interval: float = 2.0,
+                 max_attempts: int = 8, backoff: float = 1.0, max_backoff: float = 300.0, timeout: float = 10.0,
+                 max_queued: int = 100000, headers: Optional[Dict[str, str]] = None,
+                 session: Optional[requests.Session] = None):
+        """
+        Args:
+            urls (Sequence[str]): Webhook URLs; every result is delivered to each
+            outbox (Outbox): Persistence of the batches until they are delivered
+            batch_size (int): Maximum results per batch
+            flush_interval (float): Maximum seconds a result waits for its batch to fill
+            max_attempts (int): Attempts of a batch before it is kept as dead
+            backoff (float): Seconds before the first retry, doubled at every attempt
+            max_backoff (float): Maximum seconds between two attempts
+            timeout (float): Seconds to wait for a destination to answer
+            max_queued (int): Results queued in memory per destination; further results are dropped
+                (and counted) rather than slowing down evaluations
+            headers (Dict[str, str], optional): Extra request headers, e.g. Authorization
+            session (requests.Session, optional): HTTP session, a pooled keep-alive session by default
+        """
+        self.urls = list(dict.fromkeys(urls))
+        self.outbox = outbox
+        self.batch_size = batch_size
+        self.flush_interval = flush_interval
+        self.max_attempts = max_attempts
+        self.backoff = backoff
+        self.max_backoff = max_backoff
+        self.timeout = timeout
+        self.max_queued = max_queued
+        if session is None:
+            session = requests.Session()
+            adapter = HTTPAdapter(pool_connections=len(self.urls), pool_maxsize=2)
+            session.mount("http://", adapter)
+            session.mount("https://", adapter)
+        session.headers.update({"Content-Type": "application/json", **(headers or {})})
+        self.session = session
+        self._stop = threading.Event()
+        self._destinations = [_Destination(self, url) for url in self.urls]
+        self._started = False
+        self._start_lock = threading.Lock()
+        self._lease_lock = threading.Lock()
+        self._lease_renewed_at = float("-inf")
+
+    def start(self) -> None:
+        """
+        Take over the batches left by exited processes and start the sender threads.
+        """
+        with self._start_lock:
+            if self._started:
+                return
+            self._started = True
+        self._keep_lease()
+        for destination in self._destinations:
+            destination.thread.start()
+
+    def _keep_lease(self) -> None:
+        """
+        Renew the lease of the batches of this process and take over the batches whose
+        lease expired, at most every third of the lease (called by the sender threads).
+        """
+        with self._lease_lock:
+            now = time.monotonic()
+            if now - self._lease_renewed_at < self.outbox.lease_seconds / 3:
+                return
+            self._lease_renewed_at = now
+        self.outbox.renew_lease()
+        claimed = self.outbox.claim_orphaned()
+        if claimed:
+            print(f"Recovered {claimed} undelivered result batches")
+            for destination in self._destinations:
+                destination.wake.set()
+
+    def submit(self, result: Dict[str, Any]) -> bool:
+        """
+        Queue a result for every destination, without waiting. Its "result" may be an
+        EvaluationResult, rendered in the verbose format when batched.
+
+        Returns:
+            bool: False when a destination queue was full and the result was dropped for it
+        """
+        queued = True
+        for destination in self._destinations:
+            if len(destination.queue) >= self.max_queued:
+                registry.inc("delivery.dropped", 1, {"destination": destination.url})
+                queued = False
+                continue
+            destination.queue.append(result)
+            if len(destination.queue) >= self.batch_size:
+                destination.wake.set()
+        return queued
+
+    def _send(self, url: str, row: sqlite3.Row) -> Optional[float]:
+        """
+        POST a stored batch and record the outcome.
+
+        Returns:
+            Optional[float]: Time of the next attempt when the batch is to be retried,
+                None when it was delivered or is kept as dead
+        """
+        body = b'{"results": ' + zlib.decompress(row["payload"]) + b'}'
+        start = time.perf_counter()
+        retry_after = None
+        try:
+            response = self.session.post(url, data=body, timeout=self.timeout,
+                                         headers={"Idempotency-Key": row["id"]})
+        except requests.RequestException as e:
+            error, retryable = f"{type(e).__name__}: {e}", True
+        else:
+            if 200 <= response.status_code < 300:
+                self.outbox.delivered(row["id"])
+                registry.inc("delivery.delivered", row["size"], {"destination": url})
+                registry.observe("delivery.request_seconds", time.perf_counter() - start, {"destination": url})
+                return None
+            error, retryable = f"HTTP {response.status_code}", response.status_code in RETRY_STATUS_CODES
+            retry_after = response.headers.get("Retry-After")
+        registry.inc("delivery.failed_attempts", 1, {"destination": url})
+        if not retryable or row["attempts"] + 1 >= self.max_attempts:
+            self.outbox.dead(row["id"], error)
+            registry.inc("delivery.dead", row["size"], {"destination": url})
+            return None
+        delay = min(self.max_backoff, self.backoff * 2 ** row["attempts"]) * random.uniform(0.5, 1.0)
+        if retry_after is not None and retry_after.isdigit():
+            delay = max(delay, float(retry_after))
+        retry_at = time.time() + delay
+        self.outbox.retry(row["id"], retry_at, error)
+        return retry_at
+
+    def status(self) -> Dict[str, Any]:
+        """
+        Return the queued, pending (in the outbox) and dead results of every destination.
+        """
+        counts = self.outbox.counts()
+        return {
+            destination.url: {
+                "queued": len(destination.queue),
+                "pending": counts.get(destination.url, {}).get(BATCH_PENDING, 0),
+                "dead": counts.get(destination.url, {}).get(BATCH_DEAD, 0),
+            }
+            for destination in self._destinations
+        }
+
+    def stop(self, timeout: Optional[float] = None) -> None:
+        """
+        Batch the queued results, make one more attempt at the due batches and stop
+        the sender threads. Undelivered batches stay in the outbox.
+        """
+        self._stop.set()
+        for destination in self._destinations:
+            destination.wake.set()
+        for destination in self._destinations:
+            if destination.thread.is_alive():
+                destination.thread.join(timeout)
+        if not any(destination.thread.is_alive() for destination in self._destinations):
+            # The next process using the outbox takes over the undelivered batches without waiting
+            self.outbox.release_lease()
+
+
+def delivery_from_env() -> Optional[WebhookDelivery]:
+    """
+    Build the webhook delivery configured by LEAD_WEBHOOK_URLS (comma-separated URLs, none by
+    default), LEAD_WEBHOOK_OUTBOX (default "outbox.db"), LEAD_WEBHOOK_LEASE (60 seconds), LEAD_WEBHOOK_BATCH_SIZE (100),
+    LEAD_WEBHOOK_FLUSH_INTERVAL (2 seconds), LEAD_WEBHOOK_MAX_ATTEMPTS (8), LEAD_WEBHOOK_TIMEOUT
+    (10 seconds) and LEAD_WEBHOOK_AUTHORIZATION (Authorization header), or return None without URLs.
+    """
+    urls = [url.strip() for url in os.getenv("LEAD_WEBHOOK_URLS", "").split(",") if url.strip()]
+    if not urls:
+        return None
+    authorization = os.getenv("LEAD_WEBHOOK_AUTHORIZATION", "")
+    delivery = WebhookDelivery(
+        urls,
+        Outbox(os.getenv("LEAD_WEBHOOK_OUTBOX", "outbox.db"), float(os.getenv("LEAD_WEBHOOK_LEASE", "60"))),
+        batch_size=int(os.getenv("LEAD_WEBHOOK_BATCH_SIZE", "100")),
+        flush_interval=float(os.getenv("LEAD_WEBHOOK_FLUSH_INTERVAL", "2")),
+        max_attempts=int(os.getenv("LEAD_WEBHOOK_MAX_ATTEMPTS", "8")),
+        timeout=float(os.getenv("LEAD_WEBHOOK_TIMEOUT", "10")),
+        headers={"Authorization": authorization} if authorization else None,
+    )
+    delivery.start()
+    # Queued results are moved to the outbox on exit, for the next process to deliver
+    atexit.register(delivery.stop, 5)
+    return delivery
@@ -0,0 +1,208 @@
+#!/usr/bin/env python
+"""
+Registry of evaluator engines fed from one shared preprocessing pass.
+
+An engine scores a transcript in its own way and declares the preprocessed
+features it reads (normalised text, diacritic-folded text, entities; see
+features.py). A request selects one or several engines by name; the features
+needed by all of them are computed once, then every engine runs on the same
+TranscriptFeatures and the results are combined by engine name.
+
+Built-in engines:
+
+- "criteria": LeadQualificationEvaluator, scores the criteria of the business prompt
+- "bant": keyword-based BANT analysis of Vietnamese conversations (bant.py),
+  the scoring of the LeadConversationAnalyzer crew tool
+
+Other engines are added with register_engine().
+"""
+import threading
+from abc import ABC, abstractmethod
+from typing import Any, Callable, Dict, List, Optional, Sequence, Tuple
+
+from . import bant
+from .call_quality_evaluator import LeadQualificationEvaluator
+from .entities import criterion_requirements
+from .features import FEATURE_ENTITIES, FEATURE_FOLDED, FEATURE_HAS_DIACRITICS, FEATURE_NORMALIZED, TranscriptFeatures
+from .results import EvaluationResult
+
+ENGINE_CRITERIA = "criteria"
+ENGINE_BANT = "bant"
+
+
+class UnknownEngine(ValueError):
+    """
+    Raised when a request selects an engine that is not registered.
+    """
+
+
+class EvaluatorEngine(ABC):
+    """
+    Base class of evaluator engines; an engine must at least implement evaluate.
+    """
+    name = ""
+    description = ""
+    # Whether the engine scores the criteria of a business prompt (a prompt is then required)
+    uses_criteria = False
+
+    def required_features(self, criteria: Optional[Sequence[str]] = None) -> Tuple[str, ...]:
+        """
+        Return the features the engine reads for these criteria, computed before it runs.
+        """
+        return ()
+
+    @abstractmethod
+    def evaluate(self, features: TranscriptFeatures, criteria: Optional[List[str]] = None) -> Any:
+        """
+        Evaluate the transcript of features and return the engine's result.
+        """
+
+    def render(self, result: Any, result_format: Optional[str] = None,
+               include_criteria: bool = False) -> Dict[str, Any]:
+        """
+        Render a result of the engine as a JSON object.
+        """
+        return result
+
+    def describe(self) -> Dict[str, Any]:
+        return {"name": self.name, "description": self.description, "uses_criteria": self.uses_criteria,
+                "features": list(self.required_features())}
+
+
+# Evaluation function of the criteria engine: (criteria, features) -> EvaluationResult
+CriteriaEvaluateFunction = Callable[[List[str], TranscriptFeatures], EvaluationResult]
+
+
+class CriteriaEngine(EvaluatorEngine):
+    """
+    Scores the criteria of the business prompt with LeadQualificationEvaluator.
+    """
+    name = ENGINE_CRITERIA
+    description = "Scores each criterion of the business prompt as Met, Unclear or Not Met"
+    uses_criteria = True
+
+    def __init__(self, evaluate_result: Optional[CriteriaEvaluateFunction] = None):
+        """
+        Args:
+            evaluate_result (CriteriaEvaluateFunction, optional): Evaluation function, e.g. one
+                that reuses stored outcomes; LeadQualificationEvaluator.evaluate_result by default
+        """
+        self._evaluate_result = evaluate_result
+
+    def required_features(self, criteria: Optional[Sequence[str]] = None) -> Tuple[str, ...]:
+        if criteria is not None and any(criterion_requirements(criterion) for criterion in criteria):
+            return (FEATURE_NORMALIZED, FEATURE_ENTITIES)
+        return (FEATURE_NORMALIZED,)
+
+    def evaluate(self, features: TranscriptFeatures, criteria: Optional[List[str]] = None) -> EvaluationResult:
+        if criteria is None:
+            raise ValueError("The criteria engine requires the criteria of a business prompt")
+        if self._evaluate_result is not None:
+            return self._evaluate_result(criteria, features)
+        return LeadQualificationEvaluator().evaluate_result(criteria, features.transcript, features=features)
+
+    def render(self, result: EvaluationResult, result_format: Optional[str] = None,
+               include_criteria: bool = False) -> Dict[str, Any]:
+        return result.to_dict(result_format, include_criteria)
+
+
+class BantEngine(EvaluatorEngine):
+    """
+    Keyword-based BANT analysis of Vietnamese conversations.
+    """
+    name = ENGINE_BANT
+    description = "Scores needs, budget, authority, timeline and interest (0-10) from Vietnamese keywords"
+
+    def __init__(self, fold_diacritics: Optional[bool] = False):
+        """
+        Args:
+            fold_diacritics (Optional[bool]): Match keywords without diacritics (for ASR output
+                that lost them): True, False, or None to fold when the transcript has none
+        """
+        self.fold_diacritics = fold_diacritics
+
+    def required_features(self, criteria: Optional[Sequence[str]] = None) -> Tuple[str, ...]:
+        if self.fold_diacritics is None:
+            return (FEATURE_NORMALIZED, FEATURE_HAS_DIACRITICS)
+        return (FEATURE_FOLDED,) if self.fold_diacritics else (FEATURE_NORMALIZED,)
+
+    def evaluate(self, features: TranscriptFeatures, criteria: Optional[List[str]] = None) -> Dict[str, Any]:
+        fold = self.fold_diacritics
+        if fold is None:
+            fold = not features.get(FEATURE_HAS_DIACRITICS)
+        analysis = bant.analyze(features.folded if fold else features.normalized)
+        score = bant.qualification_score(analysis)
+        return {
+            "analysis": analysis,
+            "score": score,
+            "qualification_status": "Pass" if score >= bant.PASS_SCORE else "Not Pass",
+            "recommendation": bant.recommendation(score),
+        }
+
+
+_engines: Dict[str, EvaluatorEngine] = {}
+_engines_lock = threading.Lock()
+
+
+def register_engine(engine: EvaluatorEngine) -> EvaluatorEngine:
+    """
+    Register an engine under its name, replacing an engine of the same name.
+    """
+    if not engine.name:
+        raise ValueError("Engines must have a name")
+    with _engines_lock:
+        _engines[engine.name] = engine
+    return engine
+
+
+def get_engine(name: str) -> EvaluatorEngine:
+    """
+    Return a registered engine.
+
+    Raises:
+        UnknownEngine: When no engine has this name
+    """
+    with _engines_lock:
+        engine = _engines.get(name)
+    if engine is None:
+        raise UnknownEngine(f"Unknown engine '{name}', expected one of: {', '.join(available_engines())}")
+    return engine
+
+
+def available_engines() -> List[str]:
+    """
+    Return the names of the registered engines.
+    """
+    with _engines_lock:
+        return list(_engines)
+
+
+def run_engines(names: Sequence[str], features: TranscriptFeatures, criteria: Optional[List[str]] = None,
+                result_format: Optional[str] = None, include_criteria: bool = False) -> Dict[str, Dict[str, Any]]:
+    """
+    Run the selected engines on one transcript: compute the features they need in one
+    pass, then evaluate with each engine in turn.
+
+    Args:
+        names (Sequence[str]): Names of the engines, in the order of the results
+        features (TranscriptFeatures): Transcript to evaluate, with its shared features
+        criteria (Optional[List[str]]): Criteria of the business prompt, for the engines that use them
+        result_format (Optional[str]): Response format of the engines that have several
+        include_criteria (bool): Add the criteria texts to compact criteria results
+
+    Returns:
+        Dict[str, Dict[str, Any]]: Rendered result by engine name
+
+    Raises:
+        UnknownEngine: When an engine is not registered
+    """
+    engines = [get_engine(name) for name in dict.fromkeys(names)]
+    features.prepare({feature for engine in engines for feature in engine.required_features(criteria)})
+    return {
+        engine.name: engine.render(engine.evaluate(features, criteria), result_format, include_criteria)
+        for engine in engines
+    }
+
+
+register_engine(CriteriaEngine())
+register_engine(BantEngine())
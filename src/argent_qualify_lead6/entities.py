@@ -0,0 +1,296 @@
+#!/usr/bin/env python
+"""
+Entity extraction for call transcripts: money amounts, dates and durations.
+
+The transcript is scanned once and the normalised values are kept in an
+EntityIndex, so that criteria with a numeric requirement ("minimum budget of
+$10,000", "within 3 months") are resolved by numeric comparison against the
+index instead of re-scanning the transcript for every criterion.
+"""
+import re
+from datetime import date
+from functools import lru_cache
+from typing import List, NamedTuple, Optional, Tuple
+
+CURRENCY_USD = "USD"
+CURRENCY_VND = "VND"
+
+# Multipliers written after a number ("15k", "2 million", "500 triệu")
+MULTIPLIERS = {
+    "k": 1e3, "thousand": 1e3, "nghìn": 1e3, "ngàn": 1e3,
+    "m": 1e6, "mil": 1e6, "million": 1e6, "triệu": 1e6,
+    "b": 1e9, "billion": 1e9, "tỷ": 1e9, "tỉ": 1e9,
+}
+CURRENCIES = {
+    "$": CURRENCY_USD, "usd": CURRENCY_USD, "dollar": CURRENCY_USD, "dollars": CURRENCY_USD,
+    "vnd": CURRENCY_VND, "vnđ": CURRENCY_VND, "đồng": CURRENCY_VND, "đ": CURRENCY_VND,
+}
+# Duration units in days
+DURATION_UNITS = {
+    "day": 1, "days": 1, "week": 7, "weeks": 7, "month": 30, "months": 30,
+    "quarter": 91, "quarters": 91, "year": 365, "years": 365,
+}
+MONTH_NAMES = {
+    "january": 1, "february": 2, "march": 3, "april": 4, "may": 5, "june": 6, "july": 7,
+    "august": 8, "september": 9, "october": 10, "november": 11, "december": 12,
+    "jan": 1, "feb": 2, "mar": 3, "apr": 4, "jun": 6, "jul": 7, "aug": 8,
+    "sep": 9, "sept": 9, "oct": 10, "nov": 11, "dec": 12,
+}
+NUMBER_WORDS = {
+    "a": 1, "an": 1, "one": 1, "two": 2, "three": 3, "four": 4, "five": 5, "six": 6,
+    "seven": 7, "eight": 8, "nine": 9, "ten": 10, "twelve": 12,
+    "few": 3, "a few": 3, "couple of": 2, "a couple of": 2,
+}
+
+_MULTIPLIER_RE = "|".join(sorted((re.escape(key) for key in MULTIPLIERS), key=len, reverse=True))
+_CURRENCY_RE = "|".join(sorted((re.escape(key) for key in CURRENCIES if key != "$"), key=len, reverse=True))
+_UNIT_RE = "|".join(sorted(DURATION_UNITS, key=len, reverse=True))
+_COUNT_RE = r"\d+(?:\.\d+)?|" + "|".join(sorted(NUMBER_WORDS, key=len, reverse=True))
+_MONTH_RE = "|".join(sorted(MONTH_NAMES, key=len, reverse=True))
+
+# A money amount needs a currency or a multiplier, so "50 employees" or "21" are not money
+_MONEY_RE = re.compile(
+    r"(?P<dollar>\$)\s*(?P<number>\d[\d,.]*)(?:\s*(?P<mult1>" + _MULTIPLIER_RE + r")\b)?"
+    r"|(?P<number2>\d[\d,.]*)\s*(?P<mult2>" + _MULTIPLIER_RE + r")?\s*(?P<currency>" + _CURRENCY_RE + r")?(?!\w)"
+)
+# Forward-looking durations: "in 2 weeks", "within 3 months", "next month", "over the next year"
+_DURATION_RE = re.compile(
+    r"\b(?:in|within|next|coming|this|over the next|the next)\s+(?:(?P<count>" + _COUNT_RE + r")\s+)?"
+    r"(?P<unit>" + _UNIT_RE + r")\b"
+    r"|\b(?P<now>asap|immediately|right away|urgently)\b"
+)
+_DATE_RE = re.compile(
+    r"\b(?P<month>" + _MONTH_RE + r")\b(?:\s+(?P<day>\d{1,2})(?:st|nd|rd|th)?\b)?(?:,?\s+(?P<year>\d{4})\b)?"
+)
+# Requirement direction in a criterion
+_MAX_WORDS_RE = re.compile(r"\b(maximum|max|at most|under|below|less than|no more than|up to)\b")
+_MIN_WORDS_RE = re.compile(r"\b(minimum|min|at least|over|above|more than|greater than|no less than)\b")
+
+
+class MoneyAmount(NamedTuple):
+    value: float
+    currency: Optional[str]
+    start: int
+    end: int
+
+
+class Duration(NamedTuple):
+    days: float
+    start: int
+    end: int
+
+
+class DateMention(NamedTuple):
+    month: int
+    day: Optional[int]
+    year: Optional[int]
+    start: int
+    end: int
+
+
+def _parse_number(text: str) -> Optional[float]:
+    """
+    Parse "10,000", "10.000" (VND thousands separator), "1.5" or "15,5" into a float.
+    """
+    text = text.rstrip(".,")
+    if not text:
+        return None
+    separators = [char for char in text if char in ",."]
+    if separators:
+        last = text.rfind(separators[-1])
+        decimals = len(text) - last - 1
+        if len(set(separators)) == 1 and (len(separators) > 1 or decimals == 3):
+            # Only thousands separators: "10,000", "1.000.000"
+            text = text.replace(separators[0], "")
+        else:
+            integer = text[:last].replace(",", "").replace(".", "")
+            text = f"{integer}.{text[last + 1:]}"
+    try:
+        return float(text)
+    except ValueError:
+        return None
+
+
+def _count_value(text: Optional[str]) -> float:
+    if not text:
+        return 1.0
+    if text in NUMBER_WORDS:
+        return float(NUMBER_WORDS[text])
+    return float(text)
+
+
+class EntityIndex:
+    """
+    Normalised money amounts, durations and dates of one transcript.
+    """
+
+    def __init__(self, amounts: List[MoneyAmount], durations: List[Duration], dates: List[DateMention],
+                 reference_date: Optional[date] = None):
+        self.amounts = amounts
+        self.durations = durations
+        self.dates = dates
+        self.reference_date = reference_date
+
+    @classmethod
+    def build(cls, transcript: str, reference_date: Optional[date] = None) -> "EntityIndex":
+        """
+        Extract the entities of a transcript.
+
+        Args:
+            transcript (str): Conversation transcript
+            reference_date (Optional[date]): Date of the call, used to turn dates into durations
+
+        Returns:
+            EntityIndex: Entities in transcript order
+        """
+        text = transcript.lower()
+
+        amounts = []
+        for match in _MONEY_RE.finditer(text):
+            if match.group("dollar"):
+                number, multiplier, currency = match.group("number"), match.group("mult1"), CURRENCY_USD
+            else:
+                number, multiplier = match.group("number2"), match.group("mult2")
+                currency = CURRENCIES.get(match.group("currency") or "")
+                if not multiplier and not currency:
+                    continue
+            value = _parse_number(number)
+            if value is None:
+                continue
+            if multiplier:
+                value *= MULTIPLIERS[multiplier]
+            amounts.append(MoneyAmount(value, currency, match.start(), match.end()))
+
+        durations = []
+        for match in _DURATION_RE.finditer(text):
+            if match.group("now"):
+                days = 0.0
+            else:
+                days = _count_value(match.group("count")) * DURATION_UNITS[match.group("unit")]
+            durations.append(Duration(days, match.start(), match.end()))
+
+        dates = []
+        for match in _DATE_RE.finditer(text):
+            name = match.group("month")
+            # "may" and "mar" are ordinary words unless followed by a day or a year
+            if name in ("may", "mar") and not (match.group("day") or match.group("year")):
+                continue
+            day = int(match.group("day")) if match.group("day") else None
+            year = int(match.group("year")) if match.group("year") else None
+            dates.append(DateMention(MONTH_NAMES[name], day, year, match.start(), match.end()))
+
+        return cls(amounts, durations, dates, reference_date)
+
+    def days_ahead(self) -> List[float]:
+        """
+        Return every forward-looking timeframe in days: the durations, plus the
+        dates when a reference date is known.
+        """
+        days = [duration.days for duration in self.durations]
+        if self.reference_date is not None:
+            for mention in self.dates:
+                year = mention.year or self.reference_date.year
+                try:
+                    target = date(year, mention.month, mention.day or 1)
+                except ValueError:
+                    continue
+                if target < self.reference_date and mention.year is None:
+                    target = target.replace(year=year + 1)
+                days.append(float((target - self.reference_date).days))
+        return days
+
+
+class Requirement(NamedTuple):
+    kind: str  # "amount" or "duration"
+    value: float
+    currency: Optional[str]
+    at_most: bool
+
+    def satisfied_by(self, value: float) -> bool:
+        return value <= self.value if self.at_most else value >= self.value
+
+    def describe(self) -> str:
+        bound = "at most" if self.at_most else "at least"
+        if self.kind == "amount":
+            return f"{bound} {format_amount(self.value, self.currency)}"
+        return f"{bound} {format_days(self.value)}"
+
+
+def format_amount(value: float, currency: Optional[str]) -> str:
+    if currency == CURRENCY_USD:
+        return f"${value:,.0f}"
+    return f"{value:,.0f} {currency}" if currency else f"{value:,.0f}"
+
+
+def format_days(days: float) -> str:
+    return f"{days:g} days"
+
+
+@lru_cache(maxsize=4096)
+def criterion_requirements(criterion: str) -> Tuple[Requirement, ...]:
+    """
+    Return the numeric requirements of a criterion, e.g. a minimum amount or a maximum timeframe.
+
+    Amounts default to a minimum ("budget of $10,000") and durations to a
+    maximum ("implementation within 3 months") unless the criterion says otherwise.
+
+    Args:
+        criterion (str): Criterion text
+
+    Returns:
+        Tuple[Requirement, ...]: Requirements found in the criterion
+    """
+    index = EntityIndex.build(criterion)
+    text = criterion.lower()
+    requirements = []
+    for amount in index.amounts:
+        at_most = bool(_MAX_WORDS_RE.search(text[:amount.start])) and not _MIN_WORDS_RE.search(text[:amount.start])
+        requirements.append(Requirement("amount", amount.value, amount.currency, at_most))
+    for duration in index.durations:
+        at_most = not _MIN_WORDS_RE.search(text[:duration.start])
+        requirements.append(Requirement("duration", duration.days, None, at_most))
+    if not index.durations:
+        # "3 months" without a leading preposition, e.g. "Timeline: 3 months"
+        match = re.search(r"\b(" + _COUNT_RE + r")\s+(" + _UNIT_RE + r")\b", text)
+        if match and match.group(2).startswith(("week", "month", "quarter", "year")):
+            at_most = not _MIN_WORDS_RE.search(text[:match.start()])
+            days = _count_value(match.group(1)) * DURATION_UNITS[match.group(2)]
+            requirements.append(Requirement("duration", days, None, at_most))
+    return tuple(requirements)
+
+
+def check_requirement(requirement: Requirement, index: EntityIndex) -> Tuple[Optional[bool], str]:
+    """
+    Compare a requirement with the entities of a transcript.
+
+    Args:
+        requirement (Requirement): Numeric requirement of a criterion
+        index (EntityIndex): Entities of the transcript
+
+    Returns:
+        Tuple[Optional[bool], str]: (True/False, explanation), or (None, "") when
+            the transcript has no comparable value
+    """
+    if requirement.kind == "amount":
+        candidates = [amount for amount in index.amounts
+                      if amount.currency is None or requirement.currency is None
+                      or amount.currency == requirement.currency]
+        if not candidates:
+            return None, ""
+        for amount in candidates:
+            if requirement.satisfied_by(amount.value):
+                return True, (f"amount {format_amount(amount.value, amount.currency or requirement.currency)} "
+                              f"meets {requirement.describe()}")
+        best = max(candidates, key=lambda amount: amount.value) if not requirement.at_most \
+            else min(candidates, key=lambda amount: amount.value)
+        return False, (f"amount {format_amount(best.value, best.currency or requirement.currency)} "
+                       f"does not meet {requirement.describe()}")
+
+    days = index.days_ahead()
+    if not days:
+        return None, ""
+    for value in days:
+        if requirement.satisfied_by(value):
+            return True, f"timeframe of {format_days(value)} meets {requirement.describe()}"
+    best = min(days) if requirement.at_most else max(days)
+    return False, f"timeframe of {format_days(best)} does not meet {requirement.describe()}"
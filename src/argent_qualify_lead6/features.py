@@ -0,0 +1,94 @@
+#!/usr/bin/env python
+"""
+Preprocessed features of one transcript, computed once and shared by the evaluator engines.
+
+Each engine declares the features it reads (see engines.py); the features
+requested by all the selected engines are computed in one pass before any
+engine runs, and a feature an engine reads without declaring it is computed
+on first access and cached as well.
+"""
+from typing import Any, Dict, Iterable, Optional
+
+from .entities import EntityIndex
+from .text_normalization import NormalizedText, has_diacritics, normalize_text
+
+FEATURE_NORMALIZED = "normalized"
+FEATURE_FOLDED = "folded"
+FEATURE_HAS_DIACRITICS = "has_diacritics"
+FEATURE_ENTITIES = "entities"
+FEATURES = (FEATURE_NORMALIZED, FEATURE_FOLDED, FEATURE_HAS_DIACRITICS, FEATURE_ENTITIES)
+
+
+class TranscriptFeatures:
+    """
+    A transcript (and its lead document, when known) with lazily computed, cached features:
+
+    - normalized: NFC, case-folded NormalizedText
+    - folded: the same with diacritics removed
+    - has_diacritics: whether the transcript has Vietnamese diacritics
+    - entities: money amounts, dates and durations (EntityIndex of the normalised text)
+    """
+    __slots__ = ("transcript", "lead_data", "_values")
+
+    def __init__(self, transcript: str, lead_data: Optional[Dict[str, Any]] = None):
+        """
+        Args:
+            transcript (str): Conversation transcript
+            lead_data (Optional[Dict[str, Any]]): Lead document the transcript belongs to
+        """
+        self.transcript = transcript
+        self.lead_data = lead_data
+        self._values: Dict[str, Any] = {}
+
+    def prepare(self, names: Iterable[str]) -> "TranscriptFeatures":
+        """
+        Compute the given features (in dependency order) and return self.
+
+        Raises:
+            ValueError: When a feature is unknown
+        """
+        names = set(names)
+        unknown = names.difference(FEATURES)
+        if unknown:
+            raise ValueError(f"Unknown features: {', '.join(sorted(unknown))}")
+        for name in FEATURES:
+            if name in names:
+                self.get(name)
+        return self
+
+    def get(self, name: str) -> Any:
+        """
+        Return a feature, computing it on first access.
+        """
+        if name in self._values:
+            return self._values[name]
+        if name == FEATURE_NORMALIZED:
+            value = normalize_text(self.transcript)
+        elif name == FEATURE_FOLDED:
+            value = normalize_text(self.normalized, fold_diacritics=True)
+        elif name == FEATURE_HAS_DIACRITICS:
+            value = has_diacritics(self.normalized)
+        elif name == FEATURE_ENTITIES:
+            value = EntityIndex.build(self.normalized.text)
+        else:
+            raise ValueError(f"Unknown feature '{name}'")
+        self._values[name] = value
+        return value
+
+    @property
+    def normalized(self) -> NormalizedText:
+        return self.get(FEATURE_NORMALIZED)
+
+    @property
+    def folded(self) -> NormalizedText:
+        return self.get(FEATURE_FOLDED)
+
+    @property
+    def entities(self) -> EntityIndex:
+        return self.get(FEATURE_ENTITIES)
+
+    def computed(self) -> tuple:
+        """
+        Return the names of the features computed so far.
+        """
+        return tuple(name for name in FEATURES if name in self._values)
@@ -0,0 +1,236 @@
+#!/usr/bin/env python
+"""
+Fuzzy keyword matching for speech recognition errors ("budjet", "desicion").
+
+The keyword vocabulary is indexed as a symmetric-delete dictionary: every
+keyword is stored under each string obtained by deleting up to two of its
+characters. Two words are within edit distance k of each other only if such
+delete variants of both meet, so a transcript token is matched by generating
+its own delete variants and looking them up, then verifying the few
+candidates with the real (optimal string alignment) distance. The cost per
+token depends on its length, not on the size of the vocabulary, and the
+lookup of each distinct token is cached until the vocabulary changes.
+
+The tolerated distance grows with the keyword length: short keywords
+("month", "cost", "q1") are only matched exactly, keywords of 6-7 letters
+tolerate one edit and longer ones two. The first letter, which speech
+recognition rarely gets wrong, must match.
+"""
+import os
+import re
+import threading
+from collections import OrderedDict
+from typing import Dict, FrozenSet, Iterable, List, Optional, Set, Tuple
+
+MAX_DISTANCE = 2
+# Version of the fuzzy matching rules, part of the keys of stored outcomes; bump
+# it when a change of the rules can change outcomes
+FUZZY_MATCHER_VERSION = 1
+# Minimum keyword length for a distance of 1, and of 2
+MIN_LENGTH_DISTANCE_1 = 6
+MIN_LENGTH_DISTANCE_2 = 8
+
+_TOKEN_RE = re.compile(r'\b[^\W\d_]+\b')
+
+
+def allowed_distance(word: str) -> int:
+    """
+    Return the edit distance tolerated for a keyword.
+    """
+    if len(word) >= MIN_LENGTH_DISTANCE_2:
+        return min(2, MAX_DISTANCE)
+    if len(word) >= MIN_LENGTH_DISTANCE_1:
+        return min(1, MAX_DISTANCE)
+    return 0
+
+
+def _deletes(word: str, distance: int) -> Set[str]:
+    """
+    Return the strings obtained by deleting up to `distance` characters of a word.
+    """
+    variants = {word}
+    frontier = {word}
+    for _ in range(distance):
+        frontier = {variant[:index] + variant[index + 1:] for variant in frontier for index in range(len(variant))}
+        variants |= frontier
+    return variants
+
+
+def edit_distance(a: str, b: str, limit: int = MAX_DISTANCE) -> int:
+    """
+    Return the optimal string alignment distance (insertions, deletions,
+    substitutions and adjacent transpositions) of two words, or limit + 1
+    when it exceeds the limit.
+    """
+    if abs(len(a) - len(b)) > limit:
+        return limit + 1
+    previous2: List[int] = []
+    previous = list(range(len(b) + 1))
+    for i in range(1, len(a) + 1):
+        current = [i] + [0] * len(b)
+        for j in range(1, len(b) + 1):
+            cost = 0 if a[i - 1] == b[j - 1] else 1
+            current[j] = min(previous[j] + 1, current[j - 1] + 1, previous[j - 1] + cost)
+            if i > 1 and j > 1 and a[i - 1] == b[j - 2] and a[i - 2] == b[j - 1]:
+                current[j] = min(current[j], previous2[j - 2] + 1)
+        if min(current) > limit:
+            return limit + 1
+        previous2, previous = previous, current
+    return previous[-1] if previous[-1] <= limit else limit + 1
+
+
+class SymmetricDeleteIndex:
+    """
+    Symmetric-delete dictionary of a keyword vocabulary.
+    """
+
+    def __init__(self, words: Iterable[str] = (), max_words: int = 50000, cache_size: int = 100000):
+        """
+        Args:
+            words (Iterable[str]): Initial vocabulary (normalised keywords)
+            max_words (int): Maximum size of the vocabulary; further words are only matched exactly
+            cache_size (int): Maximum number of cached token lookups
+        """
+        self.max_words = max_words
+        self.cache_size = cache_size
+        self._words: Set[str] = set()
+        # Delete variant -> keywords it was derived from
+        self._variants: Dict[str, Set[str]] = {}
+        # Token -> [(keyword, distance)], cleared when the vocabulary changes
+        self._lookups: Dict[str, List[Tuple[str, int]]] = {}
+        self._lock = threading.Lock()
+        self.update(words)
+
+    def __len__(self) -> int:
+        return len(self._words)
+
+    def __contains__(self, word: str) -> bool:
+        return word in self._words
+
+    def update(self, words: Iterable[str]) -> int:
+        """
+        Add keywords to the vocabulary. Keywords that are too short for fuzzy
+        matching, or that are not a single word, are skipped.
+
+        Returns:
+            int: Number of keywords added
+        """
+        words = [word for word in words if word not in self._words]
+        if not words:
+            return 0
+        added = 0
+        with self._lock:
+            for word in words:
+                distance = allowed_distance(word)
+                if (not distance or word in self._words or len(self._words) >= self.max_words
+                        or not _TOKEN_RE.fullmatch(word)):
+                    continue
+                self._words.add(word)
+                for variant in _deletes(word, distance):
+                    self._variants.setdefault(variant, set()).add(word)
+                added += 1
+            if added:
+                self._lookups = {}
+        return added
+
+    def lookup(self, token: str) -> List[Tuple[str, int]]:
+        """
+        Return the keywords within their tolerated distance of a token, with the distance.
+        """
+        lookups = self._lookups
+        cached = lookups.get(token)
+        if cached is not None:
+            return cached
+        matches = []
+        if len(token) >= MIN_LENGTH_DISTANCE_1 - 1:
+            candidates = set()
+            for variant in _deletes(token, MAX_DISTANCE):
+                candidates.update(self._variants.get(variant, ()))
+            for word in candidates:
+                if word[0] != token[0]:
+                    continue
+                limit = allowed_distance(word)
+                distance = edit_distance(token, word, limit)
+                if distance <= limit:
+                    matches.append((word, distance))
+            matches.sort(key=lambda match: (match[1], match[0]))
+        if len(lookups) < self.cache_size:
+            lookups[token] = matches
+        return matches
+
+    def match_text(self, text: str) -> Dict[str, Tuple[int, int]]:
+        """
+        Find the keywords of the vocabulary that occur, possibly misspelled, in a normalised text.
+
+        Args:
+            text (str): Normalised (NFC, case-folded) text
+
+        Returns:
+            Dict[str, Tuple[int, int]]: Span of the first occurrence of every matched keyword
+        """
+        spans: Dict[str, Tuple[int, int]] = {}
+        seen = set()
+        for match in _TOKEN_RE.finditer(text):
+            token = match.group()
+            if token in seen:
+                continue
+            seen.add(token)
+            for word, _ in self.lookup(token):
+                spans.setdefault(word, match.span())
+        return spans
+
+
+class IndexCache:
+    """
+    Least recently used cache of small indexes, one per keyword set (e.g. the
+    keywords of a tenant's criteria), so no request changes another's vocabulary.
+    """
+
+    def __init__(self, capacity: int = 256, cache_size: int = 10000):
+        """
+        Args:
+            capacity (int): Maximum number of cached indexes
+            cache_size (int): Maximum number of cached token lookups per index
+        """
+        self.capacity = capacity
+        self.cache_size = cache_size
+        self._indexes: "OrderedDict[FrozenSet[str], SymmetricDeleteIndex]" = OrderedDict()
+        self._lock = threading.Lock()
+
+    def get(self, words: Iterable[str]) -> SymmetricDeleteIndex:
+        """
+        Return the index of a keyword set, building it on first use.
+        """
+        key = frozenset(words)
+        with self._lock:
+            index = self._indexes.get(key)
+            if index is not None:
+                self._indexes.move_to_end(key)
+                return index
+        index = SymmetricDeleteIndex(key, cache_size=self.cache_size)
+        with self._lock:
+            index = self._indexes.setdefault(key, index)
+            self._indexes.move_to_end(key)
+            while len(self._indexes) > self.capacity:
+                self._indexes.popitem(last=False)
+        return index
+
+
+def fuzzy_keywords_from_env() -> bool:
+    """
+    Return whether fuzzy keyword matching is enabled by the LEAD_FUZZY_KEYWORDS
+    environment variable (1/true/yes/on; disabled by default).
+    """
+    return os.environ.get("LEAD_FUZZY_KEYWORDS", "").strip().lower() in ("1", "true", "yes", "on")
+
+
+def keyword_matcher(fuzzy: Optional[bool] = None) -> str:
+    """
+    Return the keyword matching mode, "" for exact matching or "fuzzy-v<version>",
+    which stored and reused outcomes are keyed under.
+
+    Args:
+        fuzzy (Optional[bool]): Whether fuzzy matching is on, fuzzy_keywords_from_env() by default
+    """
+    enabled = fuzzy_keywords_from_env() if fuzzy is None else fuzzy
+    return f"fuzzy-v{FUZZY_MATCHER_VERSION}" if enabled else ""
@@ -0,0 +1,228 @@
+#!/usr/bin/env python
+"""
+Timing and token instrumentation for crew runs.
+
+A kickoff is recorded as a tree of spans (kickoff -> task -> tool). Each span
+captures wall time, LLM call count, prompt/completion tokens and retries.
+Finished spans are aggregated into the metrics registry and every kickoff is
+appended as one JSON line to the trace file.
+"""
+import contextvars
+import json
+import os
+import threading
+import time
+import uuid
+from contextlib import contextmanager
+from typing import Any, Dict, Iterator, List, Optional
+
+from .metrics import registry
+
+DEFAULT_TRACE_FILE = "crew_traces.jsonl"
+
+_current_span: contextvars.ContextVar[Optional["Span"]] = contextvars.ContextVar("current_span", default=None)
+_trace_file_lock = threading.Lock()
+_hooks_installed = False
+
+
+class Span:
+    """
+    A timed unit of work inside a kickoff.
+    """
+
+    def __init__(self, kind: str, name: str, attributes: Optional[Dict[str, Any]] = None):
+        self.kind = kind
+        self.name = name
+        self.attributes = attributes or {}
+        self.started_at = time.time()
+        self.wall_time = 0.0
+        self.llm_calls = 0
+        self.prompt_tokens = 0
+        self.completion_tokens = 0
+        self.retries = 0
+        self.error: Optional[str] = None
+        self.children: List["Span"] = []
+
+    def add_usage(self, after: Dict[str, int], before: Dict[str, int]) -> None:
+        """
+        Add the token usage accumulated between two usage snapshots.
+        """
+        self.prompt_tokens += after["prompt_tokens"] - before["prompt_tokens"]
+        self.completion_tokens += after["completion_tokens"] - before["completion_tokens"]
+
+    def totals(self) -> Dict[str, int]:
+        """
+        Return the counters of this span summed with those of its children.
+        """
+        totals = {
+            "llm_calls": self.llm_calls,
+            "prompt_tokens": self.prompt_tokens,
+            "completion_tokens": self.completion_tokens,
+            "retries": self.retries,
+        }
+        for child in self.children:
+            for key, value in child.totals().items():
+                totals[key] += value
+        return totals
+
+    def to_dict(self) -> Dict[str, Any]:
+        """
+        Convert the span and its children to a JSON-serialisable dict.
+        """
+        return {
+            "kind": self.kind,
+            "name": self.name,
+            "attributes": self.attributes,
+            "started_at": self.started_at,
+            "wall_time": round(self.wall_time, 6),
+            "llm_calls": self.llm_calls,
+            "prompt_tokens": self.prompt_tokens,
+            "completion_tokens": self.completion_tokens,
+            "retries": self.retries,
+            "error": self.error,
+            "totals": self.totals(),
+            "children": [child.to_dict() for child in self.children],
+        }
+
+
+def current_span() -> Optional[Span]:
+    """
+    Return the innermost active span of the current context, if any.
+    """
+    return _current_span.get()
+
+
+@contextmanager
+def span(kind: str, name: str, **attributes: Any) -> Iterator[Span]:
+    """
+    Record a span around a block of code.
+
+    Args:
+        kind (str): Span kind ("kickoff", "task", "tool", ...)
+        name (str): Name of the task, tool or crew
+        **attributes: Extra attributes stored on the span
+
+    Yields:
+        Span: The active span
+    """
+    parent = _current_span.get()
+    active = Span(kind, name, attributes)
+    token = _current_span.set(active)
+    start = time.perf_counter()
+    try:
+        yield active
+    except Exception as e:
+        active.error = str(e)
+        raise
+    finally:
+        active.wall_time = time.perf_counter() - start
+        _current_span.reset(token)
+        if parent is not None:
+            parent.children.append(active)
+        _record_metrics(active)
+        if parent is None and kind == "kickoff":
+            emit_trace(active)
+
+
+def record_llm_call() -> None:
+    """
+    Count an LLM call on the active span.
+    """
+    active = _current_span.get()
+    if active is not None:
+        active.llm_calls += 1
+
+
+def record_retry() -> None:
+    """
+    Count a failed attempt that will be retried on the active span.
+    """
+    active = _current_span.get()
+    if active is not None:
+        active.retries += 1
+
+
+def agent_token_usage(agent: Any) -> Dict[str, int]:
+    """
+    Snapshot the token counters accumulated by a crewai agent.
+
+    Args:
+        agent: crewai agent
+
+    Returns:
+        Dict[str, int]: prompt_tokens, completion_tokens and successful_requests
+    """
+    token_process = getattr(agent, "_token_process", None)
+    if token_process is None:
+        return {"prompt_tokens": 0, "completion_tokens": 0, "successful_requests": 0}
+    summary = token_process.get_summary()
+    return {
+        "prompt_tokens": summary.prompt_tokens,
+        "completion_tokens": summary.completion_tokens,
+        "successful_requests": summary.successful_requests,
+    }
+
+
+def emit_trace(root: Span, path: Optional[str] = None) -> None:
+    """
+    Append a kickoff trace as one JSON line to the trace file.
+
+    Args:
+        root (Span): Root span of the kickoff
+        path (str, optional): Trace file. Defaults to the CREW_TRACE_FILE environment
+            variable or "crew_traces.jsonl"; an empty value disables the file.
+    """
+    path = os.getenv("CREW_TRACE_FILE", DEFAULT_TRACE_FILE) if path is None else path
+    if not path:
+        return
+    record = {"trace_id": uuid.uuid4().hex, **root.to_dict()}
+    with _trace_file_lock:
+        with open(path, "a", encoding="utf-8") as f:
+            f.write(json.dumps(record, ensure_ascii=False, default=str) + "\n")
+
+
+def install_crewai_hooks() -> None:
+    """
+    Subscribe to the crewai event bus to count LLM calls and retries.
+
+    Handlers run synchronously in the thread making the call, so the counts
+    land on the span active in that context. Safe to call several times.
+    """
+    global _hooks_installed
+    if _hooks_installed:
+        return
+    try:
+        from crewai.events import (
+            crewai_event_bus,
+            LLMCallStartedEvent,
+            LLMCallFailedEvent,
+            ToolUsageErrorEvent,
+        )
+    except ImportError:
+        # Older crewai releases expose the event bus under crewai.utilities.events
+        from crewai.utilities.events import (
+            crewai_event_bus,
+            LLMCallStartedEvent,
+            LLMCallFailedEvent,
+            ToolUsageErrorEvent,
+        )
+
+    crewai_event_bus.register_handler(LLMCallStartedEvent, lambda source, event: record_llm_call())
+    crewai_event_bus.register_handler(LLMCallFailedEvent, lambda source, event: record_retry())
+    crewai_event_bus.register_handler(ToolUsageErrorEvent, lambda source, event: record_retry())
+    _hooks_installed = True
+
+
+def _record_metrics(finished: Span) -> None:
+    labels = {"name": finished.name}
+    if "agent" in finished.attributes:
+        labels["agent"] = finished.attributes["agent"]
+    prefix = f"crew.{finished.kind}"
+    registry.observe(f"{prefix}.wall_time_seconds", finished.wall_time, labels)
+    registry.inc(f"{prefix}.runs", 1, labels)
+    registry.inc(f"{prefix}.llm_calls", finished.llm_calls, labels)
+    registry.inc(f"{prefix}.prompt_tokens", finished.prompt_tokens, labels)
+    registry.inc(f"{prefix}.completion_tokens", finished.completion_tokens, labels)
+    registry.inc(f"{prefix}.retries", finished.retries, labels)
+    if finished.error is not None:
+        registry.inc(f"{prefix}.errors", 1, labels)
@@ -0,0 +1,374 @@
+#!/usr/bin/env python
+"""
+Asynchronous evaluation jobs backed by a bounded in-process worker pool.
+
+Jobs are persisted in a local SQLite database so that queued work is picked
+up again and finished results stay available after a restart. Finished jobs
+expire after a configurable time to live. Queued jobs are dispatched by a
+FairScheduler (priority lanes, fair share across userId/flowId).
+
+Unfinished jobs are leased by the process that runs them: each process has its
+own owner id and renews the lease of its jobs while it lives. Jobs whose lease
+expired (their process died) are taken over by another process, or by the
+next one started, whatever its PID.
+"""
+import json
+import os
+import queue
+import sqlite3
+import threading
+import time
+import uuid
+from typing import Any, Callable, Dict, List, Optional
+
+from .metrics import registry
+from .scheduling import LANE_BATCH, FairScheduler
+
+JOB_QUEUED = "queued"
+JOB_RUNNING = "running"
+JOB_SUCCEEDED = "succeeded"
+JOB_FAILED = "failed"
+
+
+class JobQueueFull(Exception):
+    """
+    Raised when a job is submitted while the queue is at capacity.
+    """
+
+
+class JobStore:
+    """
+    SQLite persistence of jobs.
+    """
+
+    def __init__(self, db_path: str, lease_seconds: float = 60):
+        """
+        Open (and create if needed) the job database.
+
+        Args:
+            db_path (str): Path of the SQLite database file
+            lease_seconds (float): Time after which the unfinished jobs of a process
+                that stopped renewing its leases are taken over
+        """
+        self.db_path = db_path
+        self.lease_seconds = lease_seconds
+        # Identifies this process among the processes sharing the database (PIDs get reused)
+        self.owner = uuid.uuid4().hex
+        self._lock = threading.Lock()
+        self._conn = sqlite3.connect(db_path, check_same_thread=False)
+        self._conn.row_factory = sqlite3.Row
+        with self._lock, self._conn:
+            self._conn.execute("PRAGMA journal_mode=WAL")
+            self._conn.execute("""
+                CREATE TABLE IF NOT EXISTS jobs (
+                    id TEXT PRIMARY KEY,
+                    kind TEXT NOT NULL,
+                    status TEXT NOT NULL,
+                    payload TEXT NOT NULL,
+                    result TEXT,
+                    error TEXT,
+                    created_at REAL NOT NULL,
+                    started_at REAL,
+                    finished_at REAL,
+                    expires_at REAL NOT NULL,
+                    lane TEXT NOT NULL DEFAULT 'batch',
+                    user_id TEXT NOT NULL DEFAULT '',
+                    flow_id TEXT NOT NULL DEFAULT '',
+                    cost REAL NOT NULL DEFAULT 1,
+                    owner TEXT NOT NULL DEFAULT '',
+                    lease_expires REAL NOT NULL DEFAULT 0
+                )
+            """)
+            # Databases created before scheduling was added lack the scheduling columns
+            columns = {row["name"] for row in self._conn.execute("PRAGMA table_info(jobs)")}
+            for column, definition in (("lane", "TEXT NOT NULL DEFAULT 'batch'"),
+                                       ("user_id", "TEXT NOT NULL DEFAULT ''"),
+                                       ("flow_id", "TEXT NOT NULL DEFAULT ''"),
+                                       ("cost", "REAL NOT NULL DEFAULT 1"),
+                                       ("owner", "TEXT NOT NULL DEFAULT ''"),
+                                       ("lease_expires", "REAL NOT NULL DEFAULT 0")):
+                if column not in columns:
+                    self._conn.execute(f"ALTER TABLE jobs ADD COLUMN {column} {definition}")
+            self._conn.execute("CREATE INDEX IF NOT EXISTS jobs_status ON jobs (status)")
+            self._conn.execute("CREATE INDEX IF NOT EXISTS jobs_expires_at ON jobs (expires_at)")
+
+    def create(self, job_id: str, kind: str, payload: Dict[str, Any], expires_at: float,
+               lane: str = LANE_BATCH, user_id: str = "", flow_id: str = "", cost: float = 1) -> None:
+        with self._lock, self._conn:
+            self._conn.execute(
+                "INSERT INTO jobs (id, kind, status, payload, created_at, expires_at, lane, user_id, flow_id, cost,"
+                " owner, lease_expires) VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?)",
+                (job_id, kind, JOB_QUEUED, json.dumps(payload, ensure_ascii=False), time.time(), expires_at,
+                 lane, user_id, flow_id, cost, self.owner, time.time() + self.lease_seconds),
+            )
+
+    def mark_running(self, job_id: str) -> None:
+        with self._lock, self._conn:
+            self._conn.execute(
+                "UPDATE jobs SET status = ?, started_at = ? WHERE id = ?",
+                (JOB_RUNNING, time.time(), job_id),
+            )
+
+    def mark_finished(self, job_id: str, status: str, expires_at: float,
+                      result: Any = None, error: Optional[str] = None) -> None:
+        with self._lock, self._conn:
+            self._conn.execute(
+                "UPDATE jobs SET status = ?, result = ?, error = ?, finished_at = ?, expires_at = ? WHERE id = ?",
+                (status, json.dumps(result, ensure_ascii=False) if result is not None else None,
+                 error, time.time(), expires_at, job_id),
+            )
+
+    def get(self, job_id: str) -> Optional[sqlite3.Row]:
+        with self._lock:
+            return self._conn.execute("SELECT * FROM jobs WHERE id = ?", (job_id,)).fetchone()
+
+    def renew_leases(self) -> int:
+        """
+        Extend the lease of the unfinished jobs of this process.
+
+        Returns:
+            int: Number of renewed jobs
+        """
+        with self._lock, self._conn:
+            cursor = self._conn.execute(
+                "UPDATE jobs SET lease_expires = ? WHERE owner = ? AND status IN (?, ?)",
+                (time.time() + self.lease_seconds, self.owner, JOB_QUEUED, JOB_RUNNING),
+            )
+            return cursor.rowcount
+
+    def claim_orphaned(self, now: Optional[float] = None) -> List[sqlite3.Row]:
+        """
+        Take over the queued and running jobs whose lease expired, oldest first.
+
+        Several server processes may share the database (e.g. gunicorn workers),
+        so only jobs no live process renews are claimed, each by a single process.
+        """
+        now = time.time() if now is None else now
+        claimed = []
+        with self._lock:
+            rows = self._conn.execute(
+                "SELECT * FROM jobs WHERE status IN (?, ?) AND lease_expires < ? AND owner != ? ORDER BY created_at",
+                (JOB_QUEUED, JOB_RUNNING, now, self.owner),
+            ).fetchall()
+            for row in rows:
+                with self._conn:
+                    # Another process may have claimed the job since it was read
+                    cursor = self._conn.execute(
+                        "UPDATE jobs SET owner = ?, lease_expires = ? WHERE id = ? AND owner = ? AND lease_expires = ?",
+                        (self.owner, now + self.lease_seconds, row["id"], row["owner"], row["lease_expires"]),
+                    )
+                if cursor.rowcount:
+                    claimed.append(row)
+        return claimed
+
+    def purge_expired(self, now: Optional[float] = None) -> int:
+        """
+        Delete finished jobs past their expiry time.
+
+        Returns:
+            int: Number of deleted jobs
+        """
+        with self._lock, self._conn:
+            cursor = self._conn.execute(
+                "DELETE FROM jobs WHERE status IN (?, ?) AND expires_at < ?",
+                (JOB_SUCCEEDED, JOB_FAILED, now if now is not None else time.time()),
+            )
+            return cursor.rowcount
+
+
+class JobManager:
+    """
+    Runs submitted jobs on a fixed number of worker threads fed by a bounded fair scheduler.
+    """
+
+    def __init__(self, handlers: Dict[str, Callable[[Dict[str, Any]], Any]], store: JobStore,
+                 max_workers: int = 4, max_queue: int = 100, ttl: float = 3600,
+                 purge_interval: float = 60, scheduler: Optional[FairScheduler] = None):
+        """
+        Initialize the job manager.
+
+        Args:
+            handlers (Dict[str, Callable]): Job kind -> function turning a payload into a result
+            store (JobStore): Job persistence
+            max_workers (int): Number of worker threads
+            max_queue (int): Maximum number of jobs waiting for a worker
+            ttl (float): Seconds a job is kept after it finished
+            purge_interval (float): Seconds between two purges of expired jobs
+            scheduler (FairScheduler, optional): Queue of waiting jobs. Defaults to a
+                scheduler bounded by max_queue.
+        """
+        self.handlers = handlers
+        self.store = store
+        self.max_workers = max_workers
+        self.ttl = ttl
+        self.purge_interval = purge_interval
+        self._queue = scheduler or FairScheduler(max_size=max_queue)
+        self._stop = threading.Event()
+        self._threads: List[threading.Thread] = []
+
+    def start(self) -> None:
+        """
+        Start the workers and re-queue jobs left unfinished by a previous process.
+        """
+        for index in range(self.max_workers):
+            thread = threading.Thread(target=self._work, name=f"job-worker-{index}", daemon=True)
+            thread.start()
+            self._threads.append(thread)
+        purger = threading.Thread(target=self._purge_loop, name="job-purger", daemon=True)
+        purger.start()
+        self._threads.append(purger)
+        heartbeat = threading.Thread(target=self._heartbeat_loop, name="job-heartbeat", daemon=True)
+        heartbeat.start()
+        self._threads.append(heartbeat)
+        # Recovery may wait on the bounded queue, so it must not hold up the caller
+        threading.Thread(target=self._recover_loop, name="job-recovery", daemon=True).start()
+
+    def stop(self, timeout: Optional[float] = None) -> None:
+        """
+        Stop the workers once their current job is done.
+        """
+        self._stop.set()
+        for thread in self._threads:
+            thread.join(timeout)
+
+    def submit(self, kind: str, payload: Dict[str, Any], lane: str = LANE_BATCH,
+               user_id: str = "", flow_id: str = "", cost: float = 1) -> str:
+        """
+        Persist and enqueue a job.
+
+        Args:
+            kind (str): Job kind, must have a handler
+            payload (Dict[str, Any]): Handler input
+            lane (str): "realtime" or "batch"
+            user_id (str): Tenant the job is accounted to
+            flow_id (str): Flow the job is accounted to
+            cost (float): Relative amount of work, e.g. the number of leads
+
+        Returns:
+            str: Job id
+
+        Raises:
+            ValueError: Unknown job kind
+            JobQueueFull: All queue slots, or all the slots of the tenant, are taken
+        """
+        if kind not in self.handlers:
+            raise ValueError(f"Unknown job type '{kind}'")
+        if self._queue.full():
+            registry.inc("jobs.rejected", 1, {"type": kind})
+            raise JobQueueFull("Job queue is full")
+
+        job_id = uuid.uuid4().hex
+        self.store.create(job_id, kind, payload, time.time() + self.ttl, lane, user_id, flow_id, cost)
+        try:
+            self._queue.put_nowait(job_id, lane=lane, user_id=user_id, flow_id=flow_id, cost=cost)
+        except queue.Full:
+            self.store.mark_finished(job_id, JOB_FAILED, time.time() + self.ttl, error="Job queue is full")
+            registry.inc("jobs.rejected", 1, {"type": kind})
+            raise JobQueueFull("Job queue is full")
+        registry.inc("jobs.submitted", 1, {"type": kind})
+        registry.set_gauge("jobs.queue_depth", self._queue.qsize())
+        return job_id
+
+    def get(self, job_id: str) -> Optional[Dict[str, Any]]:
+        """
+        Return the public view of a job, or None if unknown or expired.
+        """
+        row = self.store.get(job_id)
+        if row is None or (row["status"] in (JOB_SUCCEEDED, JOB_FAILED) and row["expires_at"] < time.time()):
+            return None
+        job = {
+            "job_id": row["id"],
+            "type": row["kind"],
+            "status": row["status"],
+            "priority": row["lane"],
+            "created_at": row["created_at"],
+            "started_at": row["started_at"],
+            "finished_at": row["finished_at"],
+        }
+        if row["status"] == JOB_SUCCEEDED:
+            job["result"] = json.loads(row["result"]) if row["result"] is not None else None
+            job["expires_at"] = row["expires_at"]
+        elif row["status"] == JOB_FAILED:
+            job["error"] = row["error"]
+            job["expires_at"] = row["expires_at"]
+        return job
+
+    def _recover_loop(self) -> None:
+        # Leases of a process that just died are still valid for a while, so look again periodically
+        self._recover()
+        while not self._stop.wait(self.store.lease_seconds / 2):
+            self._recover()
+
+    def _heartbeat_loop(self) -> None:
+        while not self._stop.wait(self.store.lease_seconds / 3):
+            self.store.renew_leases()
+
+    def _recover(self) -> None:
+        recovered = self.store.claim_orphaned()
+        for row in recovered:
+            # Jobs interrupted mid-run are executed again from their stored payload
+            self._queue.put(row["id"], lane=row["lane"], user_id=row["user_id"],
+                            flow_id=row["flow_id"], cost=row["cost"])
+        if recovered:
+            print(f"Recovered {len(recovered)} unfinished jobs")
+
+    def _work(self) -> None:
+        while not self._stop.is_set():
+            try:
+                job_id = self._queue.get(timeout=0.5)
+            except queue.Empty:
+                continue
+            try:
+                self._run(job_id)
+            finally:
+                registry.set_gauge("jobs.queue_depth", self._queue.qsize())
+
+    def _run(self, job_id: str) -> None:
+        row = self.store.get(job_id)
+        if row is None or row["status"] not in (JOB_QUEUED, JOB_RUNNING):
+            return
+        kind = row["kind"]
+        self.store.mark_running(job_id)
+        start = time.perf_counter()
+        try:
+            result = self.handlers[kind](json.loads(row["payload"]))
+        except Exception as e:
+            self.store.mark_finished(job_id, JOB_FAILED, time.time() + self.ttl, error=str(e))
+            registry.inc("jobs.failed", 1, {"type": kind})
+        else:
+            self.store.mark_finished(job_id, JOB_SUCCEEDED, time.time() + self.ttl, result=result)
+            registry.inc("jobs.succeeded", 1, {"type": kind})
+        registry.observe("jobs.run_seconds", time.perf_counter() - start, {"type": kind})
+
+    def _purge_loop(self) -> None:
+        while not self._stop.wait(self.purge_interval):
+            purged = self.store.purge_expired()
+            if purged:
+                registry.inc("jobs.expired", purged)
+
+
+def job_manager_from_env(handlers: Dict[str, Callable[[Dict[str, Any]], Any]]) -> JobManager:
+    """
+    Build a job manager configured from environment variables.
+
+    LEAD_JOBS_DB (default "jobs.db"), LEAD_JOBS_WORKERS (4), LEAD_JOBS_QUEUE_SIZE (100),
+    LEAD_JOBS_TTL in seconds (3600), LEAD_JOBS_LEASE in seconds (60), LEAD_JOBS_MAX_PER_TENANT (unlimited),
+    LEAD_JOBS_BATCH_SHARE (10) and LEAD_TENANT_WEIGHTS, a JSON object of userId -> weight.
+    """
+    store = JobStore(os.getenv("LEAD_JOBS_DB", "jobs.db"), float(os.getenv("LEAD_JOBS_LEASE", "60")))
+    max_queue = int(os.getenv("LEAD_JOBS_QUEUE_SIZE", "100"))
+    max_per_tenant = os.getenv("LEAD_JOBS_MAX_PER_TENANT")
+    scheduler = FairScheduler(
+        max_size=max_queue,
+        max_per_tenant=int(max_per_tenant) if max_per_tenant else None,
+        tenant_weights=json.loads(os.getenv("LEAD_TENANT_WEIGHTS", "{}")),
+        batch_share=int(os.getenv("LEAD_JOBS_BATCH_SHARE", "10")),
+    )
+    return JobManager(
+        handlers,
+        store,
+        max_workers=int(os.getenv("LEAD_JOBS_WORKERS", "4")),
+        max_queue=max_queue,
+        ttl=float(os.getenv("LEAD_JOBS_TTL", "3600")),
+        scheduler=scheduler,
+    )
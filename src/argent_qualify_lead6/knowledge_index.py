@@ -0,0 +1,384 @@
+#!/usr/bin/env python
+"""
+Precomputed vector index of the crew's knowledge files.
+
+The text files under knowledge/ (product sheets, objection handling, ...)
+are split into overlapping chunks and embedded once; the vectors are kept
+in a .npy file that searches open memory-mapped, so a run neither re-chunks
+nor re-embeds anything and only pages in what it reads. Each update stats
+the files and only re-embeds those whose content changed; the vectors of
+the others are copied over from the previous index.
+
+An update writes a new generation of the vector and chunk files and then
+replaces the manifest, which names the current generation, so a run never
+sees a half-written index. Updates take a file lock in the index directory,
+so concurrent crew processes update one after the other.
+
+Embedders:
+
+- "hashing" (default): offline feature hashing of the words and word pairs
+  of the text, diacritics folded; needs no model or network access
+- "sentence-transformers:<model>": a local sentence-transformers model
+  (requires the optional sentence-transformers package)
+"""
+import hashlib
+import json
+import math
+import os
+import re
+import tempfile
+import threading
+import uuid
+import zlib
+from collections import Counter
+from typing import Any, Dict, List, Optional, Sequence, Tuple
+
+import numpy as np
+
+from .task_cache import DEFAULT_CACHE_DIR
+from .text_normalization import normalize_keyword
+
+try:
+    import sentence_transformers
+except ImportError:  # Model embeddings are optional
+    sentence_transformers = None
+
+try:
+    import fcntl
+except ImportError:  # Not available on Windows, where updates are only serialised within a process
+    fcntl = None
+
+DEFAULT_KNOWLEDGE_DIR = "knowledge"
+TEXT_EXTENSIONS = (".txt", ".md", ".markdown", ".rst", ".json", ".jsonl", ".csv", ".yaml", ".yml")
+
+_WORD_RE = re.compile(r'\w+')
+
+
+class HashingEmbedder:
+    """
+    Offline embedder hashing words and word pairs into a fixed number of dimensions.
+    """
+
+    def __init__(self, dimensions: int = 512):
+        """
+        Args:
+            dimensions (int): Size of the vectors
+        """
+        self.dimensions = dimensions
+        self.identity = f"hashing-{dimensions}-v1"
+
+    def embed(self, texts: Sequence[str]) -> np.ndarray:
+        """
+        Return the L2-normalised float32 vectors of texts, one row per text.
+        """
+        vectors = np.zeros((len(texts), self.dimensions), dtype=np.float32)
+        for row, text in enumerate(texts):
+            words = _WORD_RE.findall(normalize_keyword(text, fold_diacritics=True))
+            features = Counter(words)
+            features.update(f"{first} {second}" for first, second in zip(words, words[1:]))
+            for feature, count in features.items():
+                # crc32 is stable across processes, unlike hash()
+                digest = zlib.crc32(feature.encode("utf-8"))
+                sign = 1.0 if digest & 0x80000000 else -1.0
+                vectors[row, digest % self.dimensions] += sign * (1.0 + math.log(count))
+        norms = np.linalg.norm(vectors, axis=1, keepdims=True)
+        return vectors / np.where(norms > 0, norms, 1.0)
+
+
+class SentenceTransformerEmbedder:
+    """
+    Embedder running a local sentence-transformers model.
+    """
+
+    def __init__(self, model_name: str):
+        """
+        Args:
+            model_name (str): Model name or path, e.g. "paraphrase-multilingual-MiniLM-L12-v2"
+
+        Raises:
+            RuntimeError: When sentence-transformers is not installed
+        """
+        if sentence_transformers is None:
+            raise RuntimeError("Model embeddings require the sentence-transformers package "
+                               "(pip install sentence-transformers)")
+        self.model = sentence_transformers.SentenceTransformer(model_name)
+        self.dimensions = self.model.get_sentence_embedding_dimension()
+        self.identity = f"sentence-transformers-{model_name}"
+
+    def embed(self, texts: Sequence[str]) -> np.ndarray:
+        return np.asarray(self.model.encode(list(texts), normalize_embeddings=True), dtype=np.float32)
+
+
+def make_embedder(spec: str = "hashing"):
+    """
+    Build an embedder from "hashing", "hashing:<dimensions>" or "sentence-transformers:<model>".
+    """
+    kind, _, argument = spec.partition(":")
+    if kind == "hashing":
+        return HashingEmbedder(int(argument) if argument else 512)
+    if kind == "sentence-transformers" and argument:
+        return SentenceTransformerEmbedder(argument)
+    raise ValueError(f"Invalid embedder '{spec}', expected 'hashing[:<dimensions>]' or 'sentence-transformers:<model>'")
+
+
+def chunk_text(text: str, size: int = 800, overlap: int = 100) -> List[Tuple[int, int, str]]:
+    """
+    Split a text into chunks of at most `size` characters overlapping by about `overlap`,
+    cut at a line break or space when possible.
+
+    Returns:
+        List[Tuple[int, int, str]]: (start, end, text) of every non-blank chunk
+    """
+    chunks = []
+    start = 0
+    length = len(text)
+    while start < length:
+        end = min(start + size, length)
+        if end < length:
+            cut = max(text.rfind("\n", start + size // 2, end), text.rfind(" ", start + size // 2, end))
+            if cut > start:
+                end = cut
+        piece = text[start:end].strip()
+        if piece:
+            chunks.append((start, end, piece))
+        if end >= length:
+            break
+        start = max(end - overlap, start + 1)
+    return chunks
+
+
+class KnowledgeIndex:
+    """
+    Memory-mapped vector index of the text files of a knowledge directory.
+    """
+
+    def __init__(self, knowledge_dir: str = DEFAULT_KNOWLEDGE_DIR, index_dir: Optional[str] = None,
+                 embedder=None, chunk_size: int = 800, chunk_overlap: int = 100):
+        """
+        Args:
+            knowledge_dir (str): Directory of the knowledge files
+            index_dir (str, optional): Directory of the index. Defaults to "knowledge" in the
+                crew cache directory (CREW_CACHE_DIR or ".crew_cache")
+            embedder (optional): Embedder with identity, dimensions and embed(texts); HashingEmbedder by default
+            chunk_size (int): Maximum characters per chunk
+            chunk_overlap (int): Characters shared by consecutive chunks
+        """
+        self.knowledge_dir = knowledge_dir
+        self.index_dir = index_dir or os.path.join(os.getenv("CREW_CACHE_DIR", DEFAULT_CACHE_DIR), "knowledge")
+        self.embedder = embedder or HashingEmbedder()
+        self.chunk_size = chunk_size
+        self.chunk_overlap = chunk_overlap
+        self._lock = threading.Lock()
+        self._manifest: Optional[Dict[str, Any]] = None
+        self._chunks: List[Dict[str, Any]] = []
+        self._vectors: Optional[np.ndarray] = None
+        self._load()
+
+    @property
+    def _manifest_path(self) -> str:
+        return os.path.join(self.index_dir, "manifest.json")
+
+    def _settings(self) -> Dict[str, Any]:
+        return {"embedder": self.embedder.identity, "dimensions": self.embedder.dimensions,
+                "chunk_size": self.chunk_size, "chunk_overlap": self.chunk_overlap}
+
+    def _load(self) -> None:
+        """
+        Open the current generation of the index, if any and built with the same settings.
+        """
+        try:
+            with open(self._manifest_path, "r", encoding="utf-8") as f:
+                manifest = json.load(f)
+            if manifest["settings"] != self._settings():
+                return
+            generation = manifest["generation"]
+            with open(os.path.join(self.index_dir, f"chunks-{generation}.json"), "r", encoding="utf-8") as f:
+                chunks = json.load(f)
+            vectors = np.load(os.path.join(self.index_dir, f"vectors-{generation}.npy"), mmap_mode="r")
+        except (OSError, ValueError, KeyError):
+            return
+        self._manifest, self._chunks, self._vectors = manifest, chunks, vectors
+
+    def __len__(self) -> int:
+        return len(self._chunks)
+
+    @property
+    def fingerprint(self) -> str:
+        """
+        Digest of the indexed files and settings, e.g. to key cached task outputs.
+        """
+        if self._manifest is None:
+            return ""
+        files = {path: entry["sha256"] for path, entry in self._manifest["files"].items()}
+        return hashlib.sha256(json.dumps([self._manifest["settings"], files], sort_keys=True).encode("utf-8")).hexdigest()
+
+    def _scan(self) -> List[str]:
+        paths = []
+        for root, directories, files in os.walk(self.knowledge_dir):
+            directories[:] = sorted(directory for directory in directories if not directory.startswith("."))
+            for name in sorted(files):
+                if os.path.splitext(name)[1].lower() in TEXT_EXTENSIONS:
+                    paths.append(os.path.relpath(os.path.join(root, name), self.knowledge_dir))
+        return paths
+
+    def update(self) -> Dict[str, int]:
+        """
+        Bring the index up to date with the knowledge directory, embedding only new and changed files.
+
+        Returns:
+            Dict[str, int]: Number of files, of files reused, embedded and removed, and of chunks
+        """
+        os.makedirs(self.index_dir, exist_ok=True)
+        with self._lock, open(os.path.join(self.index_dir, ".lock"), "a") as lock_file:
+            if fcntl is not None:
+                fcntl.flock(lock_file, fcntl.LOCK_EX)
+            # Start from the generation another process may have written meanwhile
+            self._load()
+            return self._update()
+
+    def _update(self) -> Dict[str, int]:
+        old_files = self._manifest["files"] if self._manifest is not None else {}
+        files: Dict[str, Dict[str, Any]] = {}
+        # Per file: the rows of the current index to copy, or the new chunks to embed
+        plan: List[Tuple[str, Optional[Tuple[int, int]], List[Tuple[int, int, str]]]] = []
+        stats = {"files": 0, "reused": 0, "embedded": 0, "removed": 0, "chunks": 0}
+        for path in self._scan():
+            full_path = os.path.join(self.knowledge_dir, path)
+            stat = os.stat(full_path)
+            entry = old_files.get(path)
+            if entry is not None and entry["size"] == stat.st_size and entry["mtime_ns"] == stat.st_mtime_ns:
+                files[path] = entry
+                plan.append((path, tuple(entry["rows"]), []))
+                stats["reused"] += 1
+                continue
+            with open(full_path, "rb") as f:
+                data = f.read()
+            digest = hashlib.sha256(data).hexdigest()
+            if entry is not None and entry["sha256"] == digest:
+                # Touched but unchanged
+                files[path] = dict(entry, size=stat.st_size, mtime_ns=stat.st_mtime_ns)
+                plan.append((path, tuple(entry["rows"]), []))
+                stats["reused"] += 1
+                continue
+            files[path] = {"size": stat.st_size, "mtime_ns": stat.st_mtime_ns, "sha256": digest}
+            plan.append((path, None, chunk_text(data.decode("utf-8", errors="replace"),
+                                                self.chunk_size, self.chunk_overlap)))
+            stats["embedded"] += 1
+        stats["files"] = len(files)
+        stats["removed"] = len(set(old_files) - set(files))
+        if self._manifest is not None and not stats["embedded"] and not stats["removed"]:
+            if any(files[path] is not old_files[path] for path in files):
+                # Only modification times changed: the vectors and chunks stay as they are
+                self._manifest = dict(self._manifest, files=files)
+                self._write_json(self._manifest_path, self._manifest)
+            stats["chunks"] = len(self._chunks)
+            return stats
+        self._write(files, plan)
+        stats["chunks"] = len(self._chunks)
+        return stats
+
+    def _write(self, files: Dict[str, Dict[str, Any]],
+               plan: List[Tuple[str, Optional[Tuple[int, int]], List[Tuple[int, int, str]]]]) -> None:
+        total = sum((rows[1] - rows[0]) if rows is not None else len(chunks) for _, rows, chunks in plan)
+        os.makedirs(self.index_dir, exist_ok=True)
+        generation = uuid.uuid4().hex[:12]
+        vectors_path = os.path.join(self.index_dir, f"vectors-{generation}.npy")
+        vectors = np.lib.format.open_memmap(vectors_path, mode="w+", dtype=np.float32,
+                                            shape=(total, self.embedder.dimensions))
+        chunks: List[Dict[str, Any]] = []
+        row = 0
+        for path, rows, new_chunks in plan:
+            start = row
+            if rows is not None:
+                count = rows[1] - rows[0]
+                vectors[row:row + count] = self._vectors[rows[0]:rows[1]]
+                chunks.extend(self._chunks[rows[0]:rows[1]])
+                row += count
+            else:
+                for batch_start in range(0, len(new_chunks), 64):
+                    batch = new_chunks[batch_start:batch_start + 64]
+                    vectors[row:row + len(batch)] = self.embedder.embed([text for _, _, text in batch])
+                    row += len(batch)
+                chunks.extend({"file": path, "start": chunk_start, "end": chunk_end, "text": text}
+                              for chunk_start, chunk_end, text in new_chunks)
+            files[path] = dict(files[path], rows=[start, row])
+        vectors.flush()
+        del vectors
+        self._write_json(os.path.join(self.index_dir, f"chunks-{generation}.json"), chunks)
+        try:
+            replaced_at = os.stat(self._manifest_path).st_mtime
+        except OSError:
+            replaced_at = None
+        # Replacing the manifest switches to the new generation
+        self._write_json(self._manifest_path, {"settings": self._settings(), "generation": generation, "files": files})
+        self._manifest = {"settings": self._settings(), "generation": generation, "files": files}
+        self._chunks = chunks
+        self._vectors = np.load(vectors_path, mmap_mode="r")
+        # Generations written before the replaced manifest (processes that still map one keep
+        # reading it after the removal); a newer one can only belong to another update
+        if replaced_at is None:
+            return
+        for name in os.listdir(self.index_dir):
+            path = os.path.join(self.index_dir, name)
+            if name.startswith(("vectors-", "chunks-")) and generation not in name:
+                try:
+                    if os.stat(path).st_mtime <= replaced_at:
+                        os.remove(path)
+                except OSError:
+                    pass
+
+    def _write_json(self, path: str, data: Any) -> None:
+        # Write to a temporary file first so an interrupted update never leaves a torn file
+        fd, tmp_path = tempfile.mkstemp(dir=os.path.dirname(path), suffix=".tmp")
+        try:
+            with os.fdopen(fd, "w", encoding="utf-8") as f:
+                json.dump(data, f, ensure_ascii=False)
+            os.replace(tmp_path, path)
+        except Exception:
+            if os.path.exists(tmp_path):
+                os.remove(tmp_path)
+            raise
+
+    def search(self, query: str, limit: int = 5) -> List[Dict[str, Any]]:
+        """
+        Return the chunks most similar to a query.
+
+        Args:
+            query (str): Text to look up
+            limit (int): Maximum number of chunks
+
+        Returns:
+            List[Dict[str, Any]]: Chunks ("file", "start", "end", "text") with their cosine "score", best first
+        """
+        if not self._chunks or limit <= 0:
+            return []
+        scores = self._vectors @ self.embedder.embed([query])[0]
+        limit = min(limit, len(scores))
+        best = np.argpartition(-scores, limit - 1)[:limit]
+        best = best[np.argsort(-scores[best])]
+        return [dict(self._chunks[index], score=round(float(scores[index]), 4)) for index in best if scores[index] > 0]
+
+
+_indexes: Dict[str, KnowledgeIndex] = {}
+_indexes_lock = threading.Lock()
+
+
+def knowledge_index_from_env(update: bool = True) -> KnowledgeIndex:
+    """
+    Return the process index of the knowledge directory, configured by CREW_KNOWLEDGE_DIR
+    (default "knowledge"), CREW_KNOWLEDGE_INDEX_DIR (default ".crew_cache/knowledge") and
+    CREW_KNOWLEDGE_EMBEDDER ("hashing" by default, or "sentence-transformers:<model>").
+
+    Args:
+        update (bool): Bring the index up to date the first time it is opened in this process
+    """
+    knowledge_dir = os.getenv("CREW_KNOWLEDGE_DIR", DEFAULT_KNOWLEDGE_DIR)
+    with _indexes_lock:
+        index = _indexes.get(knowledge_dir)
+        if index is None:
+            index = KnowledgeIndex(knowledge_dir, os.getenv("CREW_KNOWLEDGE_INDEX_DIR") or None,
+                                   make_embedder(os.getenv("CREW_KNOWLEDGE_EMBEDDER", "hashing")))
+            if update and os.path.isdir(knowledge_dir):
+                index.update()
+            _indexes[knowledge_dir] = index
+        return index
@@ -0,0 +1,100 @@
+#!/usr/bin/env python
+"""
+In-process metrics registry shared by the crew, the evaluators and the API.
+"""
+import threading
+from typing import Any, Dict, Optional, Tuple
+
+LabelKey = Tuple[Tuple[str, str], ...]
+
+
+def _label_key(labels: Optional[Dict[str, Any]]) -> LabelKey:
+    return tuple(sorted((str(k), str(v)) for k, v in (labels or {}).items()))
+
+
+class MetricsRegistry:
+    """
+    Thread-safe store of counters, gauges and summaries (count/sum/min/max).
+    """
+
+    def __init__(self):
+        """
+        Initialize an empty registry.
+        """
+        self._lock = threading.Lock()
+        self._counters: Dict[str, Dict[LabelKey, float]] = {}
+        self._gauges: Dict[str, Dict[LabelKey, float]] = {}
+        self._summaries: Dict[str, Dict[LabelKey, Dict[str, float]]] = {}
+
+    def inc(self, name: str, value: float = 1, labels: Optional[Dict[str, Any]] = None) -> None:
+        """
+        Increment a counter.
+        """
+        key = _label_key(labels)
+        with self._lock:
+            series = self._counters.setdefault(name, {})
+            series[key] = series.get(key, 0) + value
+
+    def set_gauge(self, name: str, value: float, labels: Optional[Dict[str, Any]] = None) -> None:
+        """
+        Set a gauge to an absolute value.
+        """
+        key = _label_key(labels)
+        with self._lock:
+            self._gauges.setdefault(name, {})[key] = value
+
+    def observe(self, name: str, value: float, labels: Optional[Dict[str, Any]] = None) -> None:
+        """
+        Record an observation in a summary.
+        """
+        key = _label_key(labels)
+        with self._lock:
+            series = self._summaries.setdefault(name, {})
+            summary = series.get(key)
+            if summary is None:
+                series[key] = {"count": 1, "sum": value, "min": value, "max": value}
+            else:
+                summary["count"] += 1
+                summary["sum"] += value
+                summary["min"] = min(summary["min"], value)
+                summary["max"] = max(summary["max"], value)
+
+    def snapshot(self) -> Dict[str, Any]:
+        """
+        Return a JSON-serialisable copy of all metrics.
+
+        Returns:
+            Dict[str, Any]: {"counters": ..., "gauges": ..., "summaries": ...}, each metric
+                being a list of {"labels": {...}, ...values}
+        """
+        with self._lock:
+            return {
+                "counters": {
+                    name: [{"labels": dict(key), "value": value} for key, value in series.items()]
+                    for name, series in self._counters.items()
+                },
+                "gauges": {
+                    name: [{"labels": dict(key), "value": value} for key, value in series.items()]
+                    for name, series in self._gauges.items()
+                },
+                "summaries": {
+                    name: [
+                        dict(labels=dict(key), avg=summary["sum"] / summary["count"], **summary)
+                        for key, summary in series.items()
+                    ]
+                    for name, series in self._summaries.items()
+                },
+            }
+
+    def reset(self) -> None:
+        """
+        Drop all recorded metrics.
+        """
+        with self._lock:
+            self._counters.clear()
+            self._gauges.clear()
+            self._summaries.clear()
+
+
+# Process-wide registry
+registry = MetricsRegistry()
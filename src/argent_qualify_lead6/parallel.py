@@ -0,0 +1,270 @@
+#!/usr/bin/env python
+"""
+Process-pool evaluation of transcript batches through shared memory.
+
+Sending transcripts to worker processes as task arguments pickles every
+transcript through a pipe, and sending back result objects pickles them
+again. Here a batch is written once into a shared memory block (the offsets
+of the transcripts followed by their concatenated UTF-8 bytes); tasks only
+carry the block name and a range of transcript indices, workers decode their
+transcripts straight from the block, and send the results back as a few
+flat arrays (status codes, scores, explanation ids, evidence offsets), which
+the parent turns into EvaluationResult objects. The size of the task
+messages stays flat as transcripts grow.
+"""
+import os
+from array import array
+from concurrent.futures import Executor, ProcessPoolExecutor
+from multiprocessing import resource_tracker, shared_memory
+from typing import Callable, Iterator, List, Optional, Sequence, Tuple
+
+from .call_quality_evaluator import LeadQualificationEvaluator
+from .results import EvaluationResult
+
+# Evaluation function run by the workers: (evaluator, criteria, transcript) -> EvaluationResult
+EvaluateFunction = Callable[[LeadQualificationEvaluator, List[str], str], EvaluationResult]
+
+_OFFSET = array("Q").itemsize
+
+
+def chunk_ranges(count: int, workers: int, chunk_size: Optional[int] = None) -> List[Tuple[int, int]]:
+    """
+    Split count transcripts into [start, end) ranges, by default sized to give
+    every worker a few tasks (at most 64 transcripts each).
+    """
+    chunk_size = chunk_size or max(1, min(64, -(-count // (workers * 4))))
+    return [(start, min(start + chunk_size, count)) for start in range(0, count, chunk_size)]
+
+
+class SharedTranscripts:
+    """
+    Transcripts packed into one shared memory block: the transcript count, count + 1
+    byte offsets and the UTF-8 bytes of all transcripts.
+
+    The workers reading the block must share the resource tracker of the process
+    creating it (start it with resource_tracker.ensure_running() before the pool
+    forks), otherwise their trackers report the block as leaked when they exit.
+    """
+
+    def __init__(self, transcripts: Sequence[str]):
+        """
+        Args:
+            transcripts (Sequence[str]): Transcripts of the batch, in order
+        """
+        encoded = [transcript.encode("utf-8") for transcript in transcripts]
+        offsets = array("Q", [len(encoded)])
+        position = 0
+        offsets.append(position)
+        for data in encoded:
+            position += len(data)
+            offsets.append(position)
+        header = offsets.tobytes()
+        self.count = len(encoded)
+        self._memory = shared_memory.SharedMemory(create=True, size=max(len(header) + position, 1))
+        self.name = self._memory.name
+        buffer = self._memory.buf
+        buffer[:len(header)] = header
+        start = len(header)
+        for data in encoded:
+            buffer[start:start + len(data)] = data
+            start += len(data)
+        del buffer
+
+    def close(self) -> None:
+        """
+        Release and remove the shared memory block.
+        """
+        self._memory.close()
+        self._memory.unlink()
+
+    def __enter__(self) -> "SharedTranscripts":
+        return self
+
+    def __exit__(self, *exc_info) -> None:
+        self.close()
+
+
+def _read_transcripts(name: str, start: int, end: int) -> List[str]:
+    """
+    Decode the transcripts [start, end) of a shared block.
+    """
+    memory = shared_memory.SharedMemory(name=name)
+    try:
+        offsets = memory.buf[:_OFFSET].cast("Q")
+        count = offsets[0]
+        offsets.release()
+        offsets = memory.buf[_OFFSET:_OFFSET * (count + 2)].cast("Q")
+        data_start = _OFFSET * (count + 2)
+        transcripts = [
+            str(memory.buf[data_start + offsets[index]:data_start + offsets[index + 1]], "utf-8")
+            for index in range(start, min(end, count))
+        ]
+        offsets.release()
+        return transcripts
+    finally:
+        memory.close()
+
+
+class PackedResults:
+    """
+    Results of a range of transcripts as flat arrays, cheap to send between processes.
+    """
+    __slots__ = ("count", "statuses", "scores", "explanations", "explanation_ids", "evidence", "evidence_bounds")
+
+    def __init__(self):
+        # Number of results, which the arrays alone do not give when there are no criteria
+        self.count = 0
+        self.statuses = array("B")
+        self.scores = array("B")
+        # Distinct explanations, referenced by index from explanation_ids
+        self.explanations: List[str] = []
+        self.explanation_ids = array("H")
+        self.evidence = array("I")
+        # Offsets into evidence of every criterion of every result, plus the end
+        self.evidence_bounds = array("I", [0])
+
+    def __getstate__(self):
+        return tuple(getattr(self, slot) for slot in self.__slots__)
+
+    def __setstate__(self, state):
+        for slot, value in zip(self.__slots__, state):
+            setattr(self, slot, value)
+
+    def append(self, result: EvaluationResult) -> None:
+        """
+        Add the per-criterion arrays of a result.
+        """
+        explanation_index = {explanation: index for index, explanation in enumerate(self.explanations)}
+        for explanation in result.explanations:
+            index = explanation_index.get(explanation)
+            if index is None:
+                index = explanation_index[explanation] = len(self.explanations)
+                self.explanations.append(explanation)
+            self.explanation_ids.append(index)
+        self.statuses.extend(result.statuses)
+        self.scores.extend(result.scores)
+        base = len(self.evidence)
+        self.evidence.extend(result.evidence)
+        self.evidence_bounds.extend(base + bound for bound in result.evidence_bounds[1:])
+        self.count += 1
+
+    def unpack(self, criteria: Sequence[str]) -> List[EvaluationResult]:
+        """
+        Rebuild the EvaluationResult objects, whose criteria are the given list.
+        """
+        width = len(criteria)
+        results = []
+        for index in range(self.count):
+            first = index * width
+            last = first + width
+            evidence_start = self.evidence_bounds[first]
+            results.append(EvaluationResult.from_arrays(
+                criteria,
+                self.statuses[first:last],
+                self.scores[first:last],
+                [self.explanations[index] for index in self.explanation_ids[first:last]],
+                self.evidence[evidence_start:self.evidence_bounds[last]],
+                array("I", (bound - evidence_start for bound in self.evidence_bounds[first:last + 1])),
+            ))
+        return results
+
+
+def evaluate_shared(name: str, start: int, end: int, criteria: List[str],
+                    evaluate: Optional[EvaluateFunction] = None) -> PackedResults:
+    """
+    Evaluate the transcripts [start, end) of a shared block (runs in a worker process).
+
+    Args:
+        name (str): Name of the shared memory block
+        start (int): First transcript index
+        end (int): End transcript index (exclusive)
+        criteria (List[str]): Evaluation criteria
+        evaluate (EvaluateFunction, optional): Module-level evaluation function,
+            LeadQualificationEvaluator.evaluate_result by default
+
+    Returns:
+        PackedResults: Per-criterion arrays of the results
+    """
+    evaluator = LeadQualificationEvaluator()
+    packed = PackedResults()
+    for transcript in _read_transcripts(name, start, end):
+        if evaluate is None:
+            packed.append(evaluator.evaluate_result(criteria, transcript))
+        else:
+            packed.append(evaluate(evaluator, criteria, transcript))
+    return packed
+
+
+class SharedMemoryEvaluatorPool:
+    """
+    Evaluates transcript batches in worker processes through shared memory.
+    """
+
+    def __init__(self, max_workers: Optional[int] = None, executor: Optional[Executor] = None,
+                 chunk_size: Optional[int] = None):
+        """
+        Args:
+            max_workers (int, optional): Worker processes, LEAD_EVAL_WORKERS or the number of CPUs by default
+            executor (Executor, optional): Existing process pool to run the tasks on (not shut down by close())
+            chunk_size (int, optional): Transcripts per task, sized to give each worker a few tasks by default
+        """
+        self.max_workers = max_workers or int(os.getenv("LEAD_EVAL_WORKERS", str(os.cpu_count() or 1)))
+        self.chunk_size = chunk_size
+        self._owns_executor = executor is None
+        if executor is None:
+            resource_tracker.ensure_running()
+        self._executor = executor or ProcessPoolExecutor(max_workers=self.max_workers)
+
+    def imap(self, criteria: List[str], transcripts: Sequence[str],
+             evaluate: Optional[EvaluateFunction] = None) -> Iterator[EvaluationResult]:
+        """
+        Evaluate transcripts against criteria, yielding the results in order as chunks complete.
+
+        At most two chunks per worker are in flight, so results are not held
+        in memory long before they are consumed.
+
+        Args:
+            criteria (List[str]): Evaluation criteria
+            transcripts (Sequence[str]): Transcripts to evaluate
+            evaluate (EvaluateFunction, optional): Module-level evaluation function run by the workers
+
+        Returns:
+            Iterator[EvaluationResult]: Results in transcript order
+        """
+        with SharedTranscripts(transcripts) as shared:
+            chunks = chunk_ranges(shared.count, self.max_workers, self.chunk_size)
+            pending = []
+            try:
+                for start, end in chunks:
+                    pending.append(self._executor.submit(evaluate_shared, shared.name, start, end, criteria, evaluate))
+                    if len(pending) >= 2 * self.max_workers:
+                        yield from pending.pop(0).result().unpack(criteria)
+                while pending:
+                    yield from pending.pop(0).result().unpack(criteria)
+            finally:
+                for future in pending:
+                    future.cancel()
+                # The block is removed on exit, wait for the tasks still reading it
+                for future in pending:
+                    if not future.cancelled():
+                        future.exception()
+
+    def map(self, criteria: List[str], transcripts: Sequence[str],
+            evaluate: Optional[EvaluateFunction] = None) -> List[EvaluationResult]:
+        """
+        Evaluate transcripts against criteria and return the results in order.
+        """
+        return list(self.imap(criteria, transcripts, evaluate))
+
+    def close(self) -> None:
+        """
+        Shut down the worker processes, unless the pool was given an executor.
+        """
+        if self._owns_executor:
+            self._executor.shutdown()
+
+    def __enter__(self) -> "SharedMemoryEvaluatorPool":
+        return self
+
+    def __exit__(self, *exc_info) -> None:
+        self.close()
@@ -0,0 +1,141 @@
+#!/usr/bin/env python
+"""
+Opt-in profiling of single evaluation requests.
+
+When LEAD_PROFILING is enabled, a request to /api/evaluate-lead* carrying the
+X-Lead-Profile header is evaluated under cProfile. The report (total time,
+time per evaluation phase and the top functions) is returned in the response
+("inline", the default) or written to LEAD_PROFILE_DIR ("store"). Requests
+without the header take the normal code path, and the phase timings are
+read from the profiler's statistics rather than from timers in the
+evaluator, so nothing is measured unless a profile is requested.
+"""
+import cProfile
+import json
+import os
+import pstats
+import threading
+import time
+import uuid
+from typing import Any, Callable, Dict, Optional, Tuple
+
+PROFILE_HEADER = "X-Lead-Profile"
+PROFILE_ID_HEADER = "X-Lead-Profile-Id"
+PROFILE_INLINE = "inline"
+PROFILE_STORE = "store"
+PROFILE_MODES = (PROFILE_INLINE, PROFILE_STORE)
+
+# Evaluation phase -> (source file, function name) whose cumulative time is the phase time
+PHASES = {
+    "parse_criteria": ("criteria_parser.py", "parse_criteria"),
+    "normalize_transcript": ("text_normalization.py", "normalize_text"),
+    "extract_entities": ("entities.py", "build"),
+    "score_criteria": ("call_quality_evaluator.py", "_score_criterion"),
+    "aggregate": ("results.py", "finish"),
+}
+
+# Only one profiler may be active in a process (Python 3.12 raises otherwise), so
+# profiled requests served by concurrent threads are profiled one after the other
+_profile_lock = threading.Lock()
+
+
+def profiling_enabled() -> bool:
+    """
+    Return True when LEAD_PROFILING allows requests to ask for a profile.
+    """
+    return os.getenv("LEAD_PROFILING", "").lower() in ("1", "true", "yes")
+
+
+def requested_profile(headers) -> Optional[str]:
+    """
+    Return the profile mode asked for by the request headers, or None.
+
+    Args:
+        headers: Mapping of request headers (Flask or Starlette)
+
+    Returns:
+        Optional[str]: One of PROFILE_MODES, or None when no profile is requested or profiling is disabled
+    """
+    value = headers.get(PROFILE_HEADER)
+    if not value or not profiling_enabled():
+        return None
+    value = value.strip().lower()
+    return value if value in PROFILE_MODES else PROFILE_INLINE
+
+
+def _function_label(function: Tuple[str, int, str]) -> str:
+    filename, line, name = function
+    if filename == "~":
+        return name
+    return f"{os.path.basename(filename)}:{line}({name})"
+
+
+def profile_call(function: Callable[..., Any], *args, top: int = 20, **kwargs) -> Tuple[Any, Dict[str, Any]]:
+    """
+    Call a function under cProfile and build a profile report. Concurrent calls
+    wait for each other.
+
+    Args:
+        function (Callable): Function to profile
+        top (int): Number of functions listed, by cumulative time
+
+    Returns:
+        Tuple[Any, Dict[str, Any]]: (function result, report with "total_seconds",
+            "phases" and "top_functions")
+    """
+    profiler = cProfile.Profile()
+    with _profile_lock:
+        start = time.perf_counter()
+        result = profiler.runcall(function, *args, **kwargs)
+        total = time.perf_counter() - start
+
+    stats = pstats.Stats(profiler)
+    phases = {}
+    for phase, (filename, name) in PHASES.items():
+        phases[phase] = round(sum(
+            cumulative for (path, _, function_name), (_, _, _, cumulative, callers) in stats.stats.items()
+            if function_name == name and os.path.basename(path) == filename
+            # Only outermost calls, so recursive and nested calls are not counted twice
+            and not any(caller[2] == name for caller in callers)
+        ), 6)
+
+    rows = sorted(stats.stats.items(), key=lambda item: item[1][3], reverse=True)[:top]
+    top_functions = [
+        {
+            "function": _function_label(key),
+            "calls": calls,
+            "total_seconds": round(total_time, 6),
+            "cumulative_seconds": round(cumulative, 6),
+        }
+        for key, (_, calls, total_time, cumulative, _) in rows
+    ]
+    return result, {"total_seconds": round(total, 6), "phases": phases, "top_functions": top_functions}
+
+
+def attach_profile(body: Dict[str, Any], report: Dict[str, Any], mode: str,
+                   context: Optional[Dict[str, Any]] = None) -> Dict[str, str]:
+    """
+    Add a profile report to a response body, or store it, depending on the mode.
+
+    Stored reports are written to LEAD_PROFILE_DIR (default "profiles") as
+    <profile id>.json, together with the request context (route, userId, flowId).
+
+    Args:
+        body (Dict[str, Any]): Response body, modified in place in inline mode
+        report (Dict[str, Any]): Report built by profile_call
+        mode (str): One of PROFILE_MODES
+        context (Dict[str, Any], optional): Request information saved with stored reports
+
+    Returns:
+        Dict[str, str]: Response headers to add
+    """
+    if mode != PROFILE_STORE:
+        body["profile"] = report
+        return {}
+    profile_id = uuid.uuid4().hex
+    directory = os.getenv("LEAD_PROFILE_DIR", "profiles")
+    os.makedirs(directory, exist_ok=True)
+    with open(os.path.join(directory, f"{profile_id}.json"), "w", encoding="utf-8") as f:
+        json.dump({"profile_id": profile_id, "created_at": time.time(), **(context or {}), **report},
+                  f, ensure_ascii=False, indent=2)
+    return {PROFILE_ID_HEADER: profile_id}
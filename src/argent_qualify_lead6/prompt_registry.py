@@ -0,0 +1,181 @@
+#!/usr/bin/env python
+"""
+Versioned registry of business prompts.
+
+Each flow has a fixed business prompt, so instead of sending the full prompt
+text with every evaluation, clients register it once and refer to it by
+prompt id (or let it be resolved from the lead's flowId). The criteria of
+each version are extracted when it is registered and stored with it, so
+evaluations never parse the prompt again.
+
+Versions are immutable: updating a prompt adds a version, and jobs pin the
+version that was current when they were submitted.
+"""
+import json
+import os
+import sqlite3
+import threading
+import time
+import uuid
+from typing import Any, Dict, List, Optional
+
+from .criteria_parser import parse_criteria
+
+
+class PromptNotFound(Exception):
+    """
+    Raised when a prompt id, version or flow has no registered prompt.
+    """
+
+
+class PromptRegistry:
+    """
+    SQLite persistence of prompt versions, with an in-process cache of their criteria.
+    """
+
+    def __init__(self, db_path: str):
+        """
+        Open (and create if needed) the prompt database.
+
+        Args:
+            db_path (str): Path of the SQLite database file
+        """
+        self.db_path = db_path
+        self._lock = threading.Lock()
+        # (prompt_id, version) -> record; versions never change so entries never go stale
+        self._cache: Dict[tuple, Dict[str, Any]] = {}
+        # Transactions are opened explicitly, so processes registering versions of the same prompt are serialised
+        self._conn = sqlite3.connect(db_path, check_same_thread=False, timeout=30, isolation_level=None)
+        self._conn.row_factory = sqlite3.Row
+        with self._lock:
+            self._conn.execute("PRAGMA journal_mode=WAL")
+            self._conn.execute("""
+                CREATE TABLE IF NOT EXISTS prompts (
+                    prompt_id TEXT NOT NULL,
+                    version INTEGER NOT NULL,
+                    prompt TEXT NOT NULL,
+                    criteria TEXT NOT NULL,
+                    flow_id TEXT NOT NULL DEFAULT '',
+                    created_at REAL NOT NULL,
+                    PRIMARY KEY (prompt_id, version)
+                )
+            """)
+            self._conn.execute("CREATE INDEX IF NOT EXISTS prompts_flow_id ON prompts (flow_id, created_at)")
+
+    def register(self, prompt: str, prompt_id: Optional[str] = None,
+                 flow_id: Optional[str] = None) -> Dict[str, Any]:
+        """
+        Register a prompt, or a new version of an existing one.
+
+        Registering the same text (and flow) as the latest version is a no-op.
+
+        Args:
+            prompt (str): Business prompt containing the evaluation criteria
+            prompt_id (str, optional): Id of the prompt to update. A new id is generated when omitted.
+            flow_id (str, optional): flowId whose leads are evaluated with this prompt.
+                Defaults to the flowId of the previous version.
+
+        Returns:
+            Dict[str, Any]: Registered version, with a "created" flag
+        """
+        prompt_id = prompt_id or uuid.uuid4().hex
+        criteria = parse_criteria(prompt)
+        with self._lock:
+            # Take the write lock before reading the latest version, so two processes
+            # registering the same prompt cannot both pick the next version number
+            self._conn.execute("BEGIN IMMEDIATE")
+            try:
+                latest = self._conn.execute(
+                    "SELECT * FROM prompts WHERE prompt_id = ? ORDER BY version DESC LIMIT 1", (prompt_id,)
+                ).fetchone()
+                if flow_id is None:
+                    flow_id = latest["flow_id"] if latest else ""
+                if latest and latest["prompt"] == prompt and latest["flow_id"] == flow_id:
+                    self._conn.execute("COMMIT")
+                    return {**self._record(latest), "created": False}
+                version = latest["version"] + 1 if latest else 1
+                self._conn.execute(
+                    "INSERT INTO prompts (prompt_id, version, prompt, criteria, flow_id, created_at)"
+                    " VALUES (?, ?, ?, ?, ?, ?)",
+                    (prompt_id, version, prompt, json.dumps(criteria, ensure_ascii=False), flow_id, time.time()),
+                )
+                row = self._conn.execute(
+                    "SELECT * FROM prompts WHERE prompt_id = ? AND version = ?", (prompt_id, version)
+                ).fetchone()
+                self._conn.execute("COMMIT")
+            except BaseException:
+                self._conn.execute("ROLLBACK")
+                raise
+            return {**self._record(row), "created": True}
+
+    def get(self, prompt_id: str, version: Optional[int] = None) -> Dict[str, Any]:
+        """
+        Return a version of a prompt (the latest by default).
+
+        Raises:
+            PromptNotFound: When the prompt or the version does not exist
+        """
+        if version is not None and (prompt_id, version) in self._cache:
+            return self._cache[(prompt_id, version)]
+        with self._lock:
+            if version is None:
+                row = self._conn.execute(
+                    "SELECT * FROM prompts WHERE prompt_id = ? ORDER BY version DESC LIMIT 1", (prompt_id,)
+                ).fetchone()
+            else:
+                row = self._conn.execute(
+                    "SELECT * FROM prompts WHERE prompt_id = ? AND version = ?", (prompt_id, version)
+                ).fetchone()
+        if row is None:
+            suffix = f" version {version}" if version is not None else ""
+            raise PromptNotFound(f"Prompt '{prompt_id}'{suffix} not found")
+        return self._record(row)
+
+    def for_flow(self, flow_id: str) -> Dict[str, Any]:
+        """
+        Return the latest prompt version registered for a flowId.
+
+        Raises:
+            PromptNotFound: When no prompt is registered for the flow
+        """
+        with self._lock:
+            row = self._conn.execute(
+                "SELECT * FROM prompts WHERE flow_id = ? ORDER BY created_at DESC, version DESC LIMIT 1",
+                (flow_id,),
+            ).fetchone()
+        if row is None:
+            raise PromptNotFound(f"No prompt registered for flow '{flow_id}'")
+        return self._record(row)
+
+    def versions(self, prompt_id: str) -> List[Dict[str, Any]]:
+        """
+        Return the version numbers, flowIds and creation times of a prompt, oldest first.
+        """
+        with self._lock:
+            rows = self._conn.execute(
+                "SELECT version, flow_id, created_at FROM prompts WHERE prompt_id = ? ORDER BY version",
+                (prompt_id,),
+            ).fetchall()
+        return [dict(row) for row in rows]
+
+    def _record(self, row: sqlite3.Row) -> Dict[str, Any]:
+        key = (row["prompt_id"], row["version"])
+        record = self._cache.get(key)
+        if record is None:
+            record = {
+                "prompt_id": row["prompt_id"],
+                "version": row["version"],
+                "prompt": row["prompt"],
+                "criteria": json.loads(row["criteria"]),
+                "flow_id": row["flow_id"],
+                "created_at": row["created_at"],
+            }
+            self._cache[key] = record
+        return record
+
+
+def prompt_registry_from_env() -> PromptRegistry:
+    """
+    Build a prompt registry stored in LEAD_PROMPTS_DB (default "prompts.db").
+    """
+    return PromptRegistry(os.getenv("LEAD_PROMPTS_DB", "prompts.db"))
@@ -0,0 +1,195 @@
+#!/usr/bin/env python
+"""
+Compact representation of evaluation results.
+
+An EvaluationResult keeps the per-criterion outcomes in arrays (status codes,
+scores, evidence offsets into the transcript) and references the criteria
+list instead of copying it, so bulk jobs holding many results stay small.
+It renders to the verbose response format ("criteria_evaluation" keyed by
+criterion text, the default) or to the compact one (status codes keyed by
+criterion index).
+"""
+import sys
+from array import array
+from enum import IntEnum
+from typing import Any, Dict, List, Optional, Sequence, Tuple
+
+FORMAT_VERBOSE = "verbose"
+FORMAT_COMPACT = "compact"
+RESULT_FORMATS = (FORMAT_VERBOSE, FORMAT_COMPACT)
+
+
+class CriterionStatus(IntEnum):
+    """
+    Status of a criterion. The values are the codes of the compact format.
+    """
+    NOT_MET = 0
+    UNCLEAR = 1
+    MET = 2
+
+    @property
+    def label(self) -> str:
+        return STATUS_LABELS[self]
+
+    @classmethod
+    def from_label(cls, label: str) -> "CriterionStatus":
+        return cls(STATUS_LABELS.index(label))
+
+
+STATUS_LABELS = ("Not Met", "Unclear", "Met")
+
+
+class CriterionResult:
+    """
+    Outcome of one criterion: status, score (0-100), explanation and evidence
+    as (start, end) offsets into the transcript.
+    """
+    __slots__ = ("status", "score", "explanation", "evidence")
+
+    def __init__(self, status: CriterionStatus, score: int, explanation: str,
+                 evidence: Sequence[Tuple[int, int]] = ()):
+        self.status = status
+        self.score = score
+        self.explanation = explanation
+        self.evidence = tuple(evidence)
+
+
+class EvaluationResult:
+    """
+    Array-backed evaluation result of one transcript against a list of criteria.
+    """
+    __slots__ = ("criteria", "statuses", "scores", "explanations", "evidence", "evidence_bounds",
+                 "reused", "qualification_status", "confidence_score", "notes")
+
+    def __init__(self, criteria: Sequence[str]):
+        """
+        Args:
+            criteria (Sequence[str]): Criteria in evaluation order (referenced, not copied)
+        """
+        self.criteria = criteria
+        self.statuses = array("B")
+        self.scores = array("B")
+        self.explanations: List[str] = []
+        # Flat (start, end) pairs; the pairs of criterion i are evidence[evidence_bounds[i]:evidence_bounds[i + 1]]
+        self.evidence = array("I")
+        self.evidence_bounds = array("I", [0])
+        # Indices of the criteria whose outcome was taken from a stored or similar result rather than scored
+        self.reused: Tuple[int, ...] = ()
+        self.qualification_status = "Needs More Info"
+        self.confidence_score = 0
+        self.notes = "No additional notes."
+
+    @classmethod
+    def from_arrays(cls, criteria: Sequence[str], statuses: array, scores: array, explanations: List[str],
+                    evidence: array, evidence_bounds: array) -> "EvaluationResult":
+        """
+        Build a result from its per-criterion arrays (e.g. sent back by a worker process)
+        and compute the overall outcome.
+        """
+        result = cls(criteria)
+        result.statuses = statuses
+        result.scores = scores
+        result.explanations = [sys.intern(explanation) for explanation in explanations]
+        result.evidence = evidence
+        result.evidence_bounds = evidence_bounds
+        return result.finish()
+
+    def __len__(self) -> int:
+        return len(self.statuses)
+
+    def add(self, status: CriterionStatus, score: int, explanation: str,
+            evidence: Sequence[Tuple[int, int]] = ()) -> None:
+        """
+        Append the outcome of the next criterion.
+        """
+        self.statuses.append(status)
+        self.scores.append(max(0, min(100, score)))
+        # Explanations come from a small set of messages, share them between results
+        self.explanations.append(sys.intern(explanation))
+        for start, end in evidence:
+            self.evidence.append(start)
+            self.evidence.append(end)
+        self.evidence_bounds.append(len(self.evidence))
+
+    def criterion(self, index: int) -> CriterionResult:
+        """
+        Return the outcome of the criterion at an index.
+        """
+        flat = self.evidence[self.evidence_bounds[index]:self.evidence_bounds[index + 1]]
+        return CriterionResult(CriterionStatus(self.statuses[index]), self.scores[index], self.explanations[index],
+                               list(zip(flat[::2], flat[1::2])))
+
+    def finish(self) -> "EvaluationResult":
+        """
+        Compute the qualification status, confidence score and notes from the criterion statuses.
+
+        Returns:
+            EvaluationResult: self
+        """
+        met_count = self.statuses.count(CriterionStatus.MET)
+        unclear_count = self.statuses.count(CriterionStatus.UNCLEAR)
+        not_met_count = self.statuses.count(CriterionStatus.NOT_MET)
+        total_criteria = len(self.statuses)
+
+        if total_criteria > 0:
+            # More weight to "Met" criteria and partial credit for "Unclear" criteria
+            self.confidence_score = int(((met_count + (unclear_count * 0.5)) / total_criteria) * 100)
+            if met_count == total_criteria:
+                self.qualification_status = "Qualified"
+            elif not_met_count > 0:
+                self.qualification_status = "Disqualified"
+            else:
+                self.qualification_status = "Needs More Info"
+        else:
+            self.confidence_score = 0
+            self.qualification_status = "Needs More Info"
+
+        notes = []
+        if unclear_count > 0:
+            notes.append(f"There are {unclear_count} unclear criteria that need more information.")
+        if not_met_count > 0:
+            notes.append(f"There are {not_met_count} criteria that are not met.")
+        self.notes = sys.intern(". ".join(notes)) if notes else "No additional notes."
+        return self
+
+    def to_verbose(self) -> Dict[str, Any]:
+        """
+        Render the default response format, with "Status - explanation" strings keyed by criterion text.
+        """
+        criteria_evaluation = {}
+        for criterion, status, explanation in zip(self.criteria, self.statuses, self.explanations):
+            criteria_evaluation[criterion] = f"{STATUS_LABELS[status]} - {explanation}"
+        return {
+            "qualification_status": self.qualification_status,
+            "confidence_score": self.confidence_score,
+            "criteria_evaluation": criteria_evaluation,
+            "notes": self.notes,
+        }
+
+    def to_compact(self, include_criteria: bool = False) -> Dict[str, Any]:
+        """
+        Render the compact response format: "criteria_status" lists the status
+        code of each criterion by index (0 Not Met, 1 Unclear, 2 Met) and
+        "criteria_score" its score.
+
+        Args:
+            include_criteria (bool): Add the criteria texts, for clients that do not know
+                the criteria list (e.g. when they sent the prompt text rather than a prompt id)
+        """
+        result = {
+            "qualification_status": self.qualification_status,
+            "confidence_score": self.confidence_score,
+            "criteria_status": self.statuses.tolist(),
+            "criteria_score": self.scores.tolist(),
+        }
+        if include_criteria:
+            result["criteria"] = list(self.criteria)
+        return result
+
+    def to_dict(self, result_format: Optional[str] = None, include_criteria: bool = False) -> Dict[str, Any]:
+        """
+        Render the result in one of RESULT_FORMATS (verbose by default).
+        """
+        if result_format == FORMAT_COMPACT:
+            return self.to_compact(include_criteria)
+        return self.to_verbose()
@@ -0,0 +1,332 @@
+#!/usr/bin/env python
+"""
+Bulk output of evaluation results.
+
+Backfills evaluate millions of leads; writing one JSON file per lead leaves
+downstream analytics with millions of files to parse. A ResultWriter buffers
+one flat record per lead (lead id, user id, flow id, status, confidence and
+the status code of every criterion) and appends them in batches to one or
+more sinks:
+
+- SQLite: a lead_results table, one row per lead, plus a criteria_sets table
+  holding the criteria lists the status codes refer to
+- Parquet (requires the optional pyarrow package): a directory of part
+  files, one per run, with one row group per flushed batch
+
+A batch is flushed when it reaches batch_size records or when flush_interval
+seconds have passed since the previous flush, and on close.
+"""
+import hashlib
+import json
+import os
+import sqlite3
+import time
+import uuid
+from typing import Any, Dict, Iterator, List, NamedTuple, Optional, Sequence
+
+from .results import EvaluationResult
+
+try:
+    import pyarrow
+    import pyarrow.parquet
+except ImportError:  # Parquet output is optional
+    pyarrow = None
+
+SINK_SQLITE = "sqlite"
+SINK_PARQUET = "parquet"
+SINK_KINDS = (SINK_SQLITE, SINK_PARQUET)
+
+
+class ResultRecord(NamedTuple):
+    """
+    Flat result of one lead.
+    """
+    lead_id: str
+    user_id: str
+    flow_id: str
+    qualification_status: str
+    confidence_score: int
+    # Status code of each criterion (0 Not Met, 1 Unclear, 2 Met), in the order of the criteria set
+    criteria_status: bytes
+    criteria_key: str
+    evaluated_at: float
+
+
+def criteria_key(criteria: Sequence[str]) -> str:
+    """
+    Return the id of a criteria list, under which its criteria are stored once.
+    """
+    return hashlib.sha1("\n".join(criteria).encode("utf-8")).hexdigest()[:16]
+
+
+def _oid(document: Dict[str, Any], field: str) -> str:
+    value = document.get(field, "") if isinstance(document, dict) else ""
+    return value.get("$oid", "") if isinstance(value, dict) else str(value)
+
+
+def make_record(lead_data: Dict[str, Any], result: EvaluationResult, key: Optional[str] = None) -> ResultRecord:
+    """
+    Build the record of a lead document and its evaluation result.
+
+    Args:
+        lead_data (Dict[str, Any]): Lead document (with "_id", "userId", "flowId")
+        result (EvaluationResult): Evaluation result of the lead
+        key (str, optional): criteria_key() of the result's criteria, computed when omitted
+    """
+    return ResultRecord(
+        lead_id=_oid(lead_data, "_id"),
+        user_id=_oid(lead_data, "userId"),
+        flow_id=_oid(lead_data, "flowId"),
+        qualification_status=result.qualification_status,
+        confidence_score=result.confidence_score,
+        criteria_status=result.statuses.tobytes(),
+        criteria_key=key or criteria_key(result.criteria),
+        evaluated_at=time.time(),
+    )
+
+
+def create_result_tables(conn: sqlite3.Connection) -> None:
+    """
+    Create the criteria_sets and lead_results tables of a SQLite result database.
+    """
+    conn.execute("""
+        CREATE TABLE IF NOT EXISTS criteria_sets (
+            criteria_key TEXT PRIMARY KEY,
+            criteria TEXT NOT NULL
+        )
+    """)
+    # criteria_status holds one digit per criterion, e.g. "201", so it can be queried with substr()
+    conn.execute("""
+        CREATE TABLE IF NOT EXISTS lead_results (
+            lead_id TEXT,
+            user_id TEXT NOT NULL,
+            flow_id TEXT NOT NULL,
+            qualification_status TEXT NOT NULL,
+            confidence_score INTEGER NOT NULL,
+            criteria_status TEXT NOT NULL,
+            criteria_key TEXT NOT NULL,
+            evaluated_at REAL NOT NULL,
+            UNIQUE (lead_id, criteria_key)
+        )
+    """)
+    conn.execute("CREATE INDEX IF NOT EXISTS lead_results_flow ON lead_results (flow_id, qualification_status)")
+
+
+def insert_criteria(conn: sqlite3.Connection, key: str, criteria: Sequence[str]) -> None:
+    """
+    Store a criteria list in a SQLite result database, unless already stored.
+    """
+    conn.execute("INSERT OR IGNORE INTO criteria_sets (criteria_key, criteria) VALUES (?, ?)",
+                 (key, json.dumps(list(criteria), ensure_ascii=False)))
+
+
+def insert_records(conn: sqlite3.Connection, records: Sequence[ResultRecord]) -> None:
+    """
+    Insert records in a SQLite result database, replacing the rows of the same lead and criteria.
+    """
+    conn.executemany(
+        "INSERT OR REPLACE INTO lead_results (lead_id, user_id, flow_id, qualification_status,"
+        " confidence_score, criteria_status, criteria_key, evaluated_at) VALUES (?, ?, ?, ?, ?, ?, ?, ?)",
+        [(record.lead_id or None, record.user_id, record.flow_id, record.qualification_status,
+          record.confidence_score, "".join(str(code) for code in record.criteria_status),
+          record.criteria_key, record.evaluated_at) for record in records],
+    )
+
+
+def read_records(conn: sqlite3.Connection, batch_size: int = 1000) -> Iterator[List[ResultRecord]]:
+    """
+    Read back the records of a SQLite result database, in batches.
+    """
+    cursor = conn.execute(
+        "SELECT lead_id, user_id, flow_id, qualification_status, confidence_score, criteria_status,"
+        " criteria_key, evaluated_at FROM lead_results ORDER BY rowid"
+    )
+    while True:
+        rows = cursor.fetchmany(batch_size)
+        if not rows:
+            return
+        yield [ResultRecord(row[0] or "", row[1], row[2], row[3], row[4], bytes(int(code) for code in row[5]),
+                            row[6], row[7]) for row in rows]
+
+
+class SQLiteResultSink:
+    """
+    Appends result batches to a SQLite database. Re-evaluating a lead under the
+    same criteria replaces its row.
+    """
+
+    def __init__(self, db_path: str):
+        """
+        Args:
+            db_path (str): Path of the SQLite database file
+        """
+        self.db_path = db_path
+        self._conn = sqlite3.connect(db_path)
+        self._known_criteria = set()
+        with self._conn:
+            self._conn.execute("PRAGMA journal_mode=WAL")
+            self._conn.execute("PRAGMA synchronous=NORMAL")
+            create_result_tables(self._conn)
+
+    def add_criteria(self, key: str, criteria: Sequence[str]) -> None:
+        """
+        Store a criteria list (once per key).
+        """
+        if key in self._known_criteria:
+            return
+        with self._conn:
+            insert_criteria(self._conn, key, criteria)
+        self._known_criteria.add(key)
+
+    def write(self, records: List[ResultRecord]) -> None:
+        """
+        Append a batch of records in one transaction.
+        """
+        with self._conn:
+            insert_records(self._conn, records)
+
+    def close(self) -> None:
+        self._conn.close()
+
+
+class ParquetResultSink:
+    """
+    Appends result batches to a Parquet dataset directory: every run writes its own
+    part file, with one row group per batch. Criteria lists are written to
+    criteria_sets.json in the same directory.
+    """
+
+    def __init__(self, directory: str):
+        """
+        Args:
+            directory (str): Dataset directory, created if needed
+
+        Raises:
+            RuntimeError: When pyarrow is not installed
+        """
+        if pyarrow is None:
+            raise RuntimeError("Parquet output requires the pyarrow package (pip install pyarrow)")
+        self.directory = directory
+        os.makedirs(directory, exist_ok=True)
+        self.path = os.path.join(directory, f"part-{time.strftime('%Y%m%d-%H%M%S')}-{uuid.uuid4().hex[:8]}.parquet")
+        self.schema = pyarrow.schema([
+            ("lead_id", pyarrow.string()),
+            ("user_id", pyarrow.string()),
+            ("flow_id", pyarrow.string()),
+            ("qualification_status", pyarrow.dictionary(pyarrow.int8(), pyarrow.string())),
+            ("confidence_score", pyarrow.uint8()),
+            ("criteria_status", pyarrow.list_(pyarrow.uint8())),
+            ("criteria_key", pyarrow.dictionary(pyarrow.int32(), pyarrow.string())),
+            ("evaluated_at", pyarrow.float64()),
+        ])
+        self._writer = None
+        self._criteria_path = os.path.join(directory, "criteria_sets.json")
+
+    def add_criteria(self, key: str, criteria: Sequence[str]) -> None:
+        """
+        Store a criteria list (once per key).
+        """
+        try:
+            with open(self._criteria_path, "r", encoding="utf-8") as f:
+                criteria_sets = json.load(f)
+        except (OSError, ValueError):
+            criteria_sets = {}
+        if key in criteria_sets:
+            return
+        criteria_sets[key] = list(criteria)
+        temporary_path = f"{self._criteria_path}.{uuid.uuid4().hex}.tmp"
+        with open(temporary_path, "w", encoding="utf-8") as f:
+            json.dump(criteria_sets, f, ensure_ascii=False, indent=2)
+        os.replace(temporary_path, self._criteria_path)
+
+    def write(self, records: List[ResultRecord]) -> None:
+        """
+        Append a batch of records as a row group.
+        """
+        columns = {name: [getattr(record, name) for record in records] for name in ResultRecord._fields}
+        columns["criteria_status"] = [list(codes) for codes in columns["criteria_status"]]
+        table = pyarrow.Table.from_pydict(columns, schema=self.schema)
+        if self._writer is None:
+            self._writer = pyarrow.parquet.ParquetWriter(self.path, self.schema, compression="zstd")
+        self._writer.write_table(table)
+
+    def close(self) -> None:
+        if self._writer is not None:
+            self._writer.close()
+
+
+def open_sink(spec: str):
+    """
+    Open a sink from a "<kind>:<path>" specification, e.g. "sqlite:results.db" or "parquet:results/".
+    """
+    kind, separator, path = spec.partition(":")
+    if not separator or kind not in SINK_KINDS or not path:
+        raise ValueError(f"Invalid sink '{spec}', expected <kind>:<path> with kind one of: {', '.join(SINK_KINDS)}")
+    if kind == SINK_SQLITE:
+        return SQLiteResultSink(path)
+    return ParquetResultSink(path)
+
+
+class ResultWriter:
+    """
+    Buffers result records and appends them to the sinks in batches.
+    """
+
+    def __init__(self, sinks: Sequence[Any], batch_size: int = 1000, flush_interval: float = 5.0):
+        """
+        Args:
+            sinks (Sequence): Sinks the batches are written to
+            batch_size (int): Records buffered before a flush
+            flush_interval (float): Maximum seconds between flushes while records are added
+        """
+        self.sinks = list(sinks)
+        self.batch_size = batch_size
+        self.flush_interval = flush_interval
+        self.written = 0
+        self._buffer: List[ResultRecord] = []
+        # id of a criteria list -> (the list, kept alive so the id is not reused, its key)
+        self._criteria_keys: Dict[int, tuple] = {}
+        self._last_flush = time.monotonic()
+
+    def add(self, lead_data: Dict[str, Any], result: EvaluationResult) -> ResultRecord:
+        """
+        Buffer the result of a lead, flushing when the batch is full or the interval has passed.
+        """
+        # Results of a run share their criteria list, key it once per list object
+        known = self._criteria_keys.get(id(result.criteria))
+        if known is None:
+            known = (result.criteria, criteria_key(result.criteria))
+            for sink in self.sinks:
+                sink.add_criteria(known[1], result.criteria)
+            self._criteria_keys[id(result.criteria)] = known
+        key = known[1]
+        record = make_record(lead_data, result, key)
+        self._buffer.append(record)
+        if len(self._buffer) >= self.batch_size or time.monotonic() - self._last_flush >= self.flush_interval:
+            self.flush()
+        return record
+
+    def flush(self) -> None:
+        """
+        Write the buffered records to every sink.
+        """
+        if self._buffer:
+            for sink in self.sinks:
+                sink.write(self._buffer)
+            self.written += len(self._buffer)
+            self._buffer = []
+        self._last_flush = time.monotonic()
+
+    def close(self) -> None:
+        """
+        Flush the remaining records and close the sinks.
+        """
+        self.flush()
+        for sink in self.sinks:
+            sink.close()
+
+    def __enter__(self) -> "ResultWriter":
+        return self
+
+    def __exit__(self, *exc_info) -> None:
+        self.close()
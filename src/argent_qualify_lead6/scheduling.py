@@ -0,0 +1,204 @@
+#!/usr/bin/env python
+"""
+Priority-aware, tenant-fair scheduling of evaluation work.
+
+Work is split into priority lanes (real-time before batch). Inside a lane,
+items are shared between tenants (userId) and then between their flows
+(flowId) by weighted fair queuing: every queue carries a virtual finish time
+advanced by cost / weight each time it is served, and the non-empty queue with
+the smallest virtual finish time is served next. A tenant submitting a large
+backfill therefore only gets its weighted share of the workers.
+"""
+import collections
+import queue
+import threading
+import time
+from typing import Any, Dict, Optional, Tuple
+
+from .metrics import registry
+
+LANE_REALTIME = "realtime"
+LANE_BATCH = "batch"
+LANES = (LANE_REALTIME, LANE_BATCH)
+
+
+class _FairQueue:
+    """
+    Weighted fair queue over keyed children, each a FIFO (leaf) or another _FairQueue.
+    """
+
+    def __init__(self, leaf: bool):
+        self.leaf = leaf
+        self.size = 0
+        self.virtual_time = 0.0
+        self.children: Dict[str, Any] = {}
+        self.finish: Dict[str, float] = {}
+        self.weights: Dict[str, float] = {}
+
+    def push(self, path: Tuple[str, ...], weights: Tuple[float, ...], entry: Any) -> None:
+        key = path[0]
+        child = self.children.get(key)
+        if child is None:
+            child = collections.deque() if self.leaf else _FairQueue(leaf=True)
+            self.children[key] = child
+        if len(child) == 0:
+            # A queue becoming active starts at the current virtual time, so idle
+            # tenants do not bank credit they could later use to starve others
+            self.finish[key] = max(self.finish.get(key, 0.0), self.virtual_time)
+        self.weights[key] = weights[0]
+        if self.leaf:
+            child.append(entry)
+        else:
+            child.push(path[1:], weights[1:], entry)
+        self.size += 1
+
+    def pop(self) -> Any:
+        key = min((k for k, child in self.children.items() if len(child)), key=lambda k: self.finish[k])
+        child = self.children[key]
+        entry = child.popleft() if self.leaf else child.pop()
+        self.size -= 1
+        self.virtual_time = self.finish[key]
+        self.finish[key] += entry[1] / self.weights[key]
+        if len(child) == 0:
+            # Drop idle queues so the scan stays proportional to active tenants
+            del self.children[key]
+            del self.weights[key]
+            if len(self.finish) > 2 * len(self.children) + 64:
+                # Finish times at or behind the virtual time carry no state, forget them
+                self.finish = {k: v for k, v in self.finish.items()
+                               if k in self.children or v > self.virtual_time}
+        return entry
+
+    def __len__(self) -> int:
+        return self.size
+
+
+class FairScheduler:
+    """
+    Bounded scheduler with priority lanes and weighted fair queuing across tenants.
+
+    Exposes the subset of the queue.Queue interface used by the job workers
+    (put_nowait, put, get, qsize, full).
+    """
+
+    def __init__(self, max_size: int = 100, max_per_tenant: Optional[int] = None,
+                 tenant_weights: Optional[Dict[str, float]] = None, batch_share: int = 10):
+        """
+        Initialize the scheduler.
+
+        Args:
+            max_size (int): Maximum number of queued items across all lanes
+            max_per_tenant (int, optional): Maximum number of queued items per tenant
+            tenant_weights (Dict[str, float], optional): userId -> weight (default 1)
+            batch_share (int): While both lanes have work, one in every batch_share
+                dispatches goes to the batch lane so backfills always progress
+        """
+        self.max_size = max_size
+        self.max_per_tenant = max_per_tenant
+        self.tenant_weights = tenant_weights or {}
+        self.batch_share = batch_share
+        self._lanes = {lane: _FairQueue(leaf=False) for lane in LANES}
+        self._tenant_depth: Dict[Tuple[str, str, str], int] = collections.Counter()
+        self._user_depth: Dict[str, int] = collections.Counter()
+        self._dispatches = 0
+        self._not_empty = threading.Condition()
+
+    def put_nowait(self, item: Any, lane: str = LANE_BATCH, user_id: str = "",
+                   flow_id: str = "", cost: float = 1) -> None:
+        """
+        Enqueue an item without blocking.
+
+        Args:
+            item: Work item
+            lane (str): "realtime" or "batch"
+            user_id (str): Tenant the item belongs to
+            flow_id (str): Flow of the tenant the item belongs to
+            cost (float): Relative amount of work (e.g. number of leads)
+
+        Raises:
+            ValueError: Unknown lane
+            queue.Full: Scheduler or tenant at capacity
+        """
+        self._put(item, lane, user_id, flow_id, cost, block=False)
+
+    def put(self, item: Any, lane: str = LANE_BATCH, user_id: str = "",
+            flow_id: str = "", cost: float = 1) -> None:
+        """
+        Enqueue an item, waiting for free capacity if needed.
+        """
+        self._put(item, lane, user_id, flow_id, cost, block=True)
+
+    def get(self, timeout: Optional[float] = None) -> Any:
+        """
+        Dequeue the next item according to lane priority and tenant fairness.
+
+        Raises:
+            queue.Empty: Nothing became available before the timeout
+        """
+        with self._not_empty:
+            if not self._not_empty.wait_for(self._size, timeout):
+                raise queue.Empty
+            lane = self._next_lane()
+            item, _, user_id, flow_id, enqueued_at = self._lanes[lane].pop()
+            self._dispatches += 1
+            self._update_depth(lane, user_id, flow_id, -1)
+            self._not_empty.notify_all()
+        registry.observe("scheduler.wait_seconds", time.time() - enqueued_at,
+                         {"lane": lane, "user_id": user_id, "flow_id": flow_id})
+        return item
+
+    def qsize(self) -> int:
+        with self._not_empty:
+            return self._size()
+
+    def full(self) -> bool:
+        with self._not_empty:
+            return self._size() >= self.max_size
+
+    def depth(self, user_id: str) -> int:
+        """
+        Return the number of queued items of a tenant across lanes.
+        """
+        with self._not_empty:
+            return self._user_depth[user_id]
+
+    def _put(self, item: Any, lane: str, user_id: str, flow_id: str, cost: float, block: bool) -> None:
+        if lane not in self._lanes:
+            raise ValueError(f"Unknown lane '{lane}', expected one of: {', '.join(LANES)}")
+        with self._not_empty:
+            while not self._has_room(user_id):
+                if not block:
+                    raise queue.Full
+                self._not_empty.wait()
+            weight = float(self.tenant_weights.get(user_id, 1))
+            self._lanes[lane].push((user_id, flow_id), (weight, 1.0),
+                                   (item, max(cost, 1), user_id, flow_id, time.time()))
+            self._update_depth(lane, user_id, flow_id, 1)
+            self._not_empty.notify_all()
+
+    def _has_room(self, user_id: str) -> bool:
+        if self._size() >= self.max_size:
+            return False
+        return self.max_per_tenant is None or self._user_depth[user_id] < self.max_per_tenant
+
+    def _next_lane(self) -> str:
+        realtime, batch = self._lanes[LANE_REALTIME], self._lanes[LANE_BATCH]
+        if not len(realtime):
+            return LANE_BATCH
+        if len(batch) and self.batch_share and self._dispatches % self.batch_share == self.batch_share - 1:
+            return LANE_BATCH
+        return LANE_REALTIME
+
+    def _size(self) -> int:
+        return sum(len(lane) for lane in self._lanes.values())
+
+    def _update_depth(self, lane: str, user_id: str, flow_id: str, delta: int) -> None:
+        key = (lane, user_id, flow_id)
+        self._tenant_depth[key] += delta
+        self._user_depth[user_id] += delta
+        registry.set_gauge("scheduler.queue_depth", self._tenant_depth[key],
+                           {"lane": lane, "user_id": user_id, "flow_id": flow_id})
+        if self._tenant_depth[key] == 0:
+            del self._tenant_depth[key]
+        if self._user_depth[user_id] == 0:
+            del self._user_depth[user_id]
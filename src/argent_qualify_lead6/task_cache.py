@@ -0,0 +1,114 @@
+#!/usr/bin/env python
+"""
+Persistent local cache of crew task outputs.
+
+Each task output is stored under a key derived from the task configuration,
+the agent configuration, the crew inputs and the context handed over by the
+previous tasks, so a task is only re-executed when something it depends on
+has changed.
+"""
+import hashlib
+import json
+import os
+import tempfile
+import time
+from typing import Any, Dict, List, Optional
+
+DEFAULT_CACHE_DIR = ".crew_cache"
+
+
+class TaskOutputCache:
+    """
+    File-backed store of task outputs keyed by a content hash.
+    """
+
+    def __init__(self, cache_dir: Optional[str] = None):
+        """
+        Initialize the cache.
+
+        Args:
+            cache_dir (str, optional): Directory holding the cache. Defaults to
+                the CREW_CACHE_DIR environment variable or ".crew_cache".
+        """
+        self.cache_dir = cache_dir or os.getenv("CREW_CACHE_DIR", DEFAULT_CACHE_DIR)
+        self.tasks_dir = os.path.join(self.cache_dir, "tasks")
+        os.makedirs(self.tasks_dir, exist_ok=True)
+
+    @staticmethod
+    def make_key(task_config: Dict[str, Any], agent_config: Dict[str, Any],
+                 inputs: Dict[str, Any], context: str = "") -> str:
+        """
+        Build the cache key of a task execution.
+
+        Args:
+            task_config (Dict[str, Any]): Task template (name, description, expected output)
+            agent_config (Dict[str, Any]): Agent template (role, goal, backstory)
+            inputs (Dict[str, Any]): Inputs interpolated into the templates
+            context (str): Raw output of the upstream tasks
+
+        Returns:
+            str: Hex digest identifying the execution
+        """
+        inputs_hash = hashlib.sha256(
+            json.dumps(inputs, sort_keys=True, ensure_ascii=False, default=str).encode("utf-8")
+        ).hexdigest()
+        payload = json.dumps({
+            "task": task_config,
+            "agent": agent_config,
+            "inputs": inputs_hash,
+            "context": hashlib.sha256(context.encode("utf-8")).hexdigest(),
+        }, sort_keys=True, ensure_ascii=False, default=str)
+        return hashlib.sha256(payload.encode("utf-8")).hexdigest()
+
+    def get(self, key: str) -> Optional[Dict[str, Any]]:
+        """
+        Return the cached record for a key, or None if absent.
+        """
+        path = os.path.join(self.tasks_dir, f"{key}.json")
+        try:
+            with open(path, "r", encoding="utf-8") as f:
+                return json.load(f)
+        except (OSError, ValueError):
+            return None
+
+    def set(self, key: str, task_name: str, raw_output: str) -> None:
+        """
+        Store the raw output of a task execution.
+        """
+        self._write_json(os.path.join(self.tasks_dir, f"{key}.json"), {
+            "task": task_name,
+            "raw": raw_output,
+            "created_at": time.time(),
+        })
+
+    def save_last_run(self, inputs: Dict[str, Any], task_keys: List[Dict[str, str]]) -> None:
+        """
+        Remember the inputs and task keys of the latest run so it can be replayed.
+        """
+        self._write_json(os.path.join(self.cache_dir, "last_run.json"), {
+            "inputs": inputs,
+            "tasks": task_keys,
+            "created_at": time.time(),
+        })
+
+    def load_last_run(self) -> Optional[Dict[str, Any]]:
+        """
+        Return the record of the latest run, or None if the crew never ran.
+        """
+        try:
+            with open(os.path.join(self.cache_dir, "last_run.json"), "r", encoding="utf-8") as f:
+                return json.load(f)
+        except (OSError, ValueError):
+            return None
+
+    def _write_json(self, path: str, data: Dict[str, Any]) -> None:
+        # Write to a temporary file first so an interrupted run never leaves a torn entry
+        fd, tmp_path = tempfile.mkstemp(dir=os.path.dirname(path), suffix=".tmp")
+        try:
+            with os.fdopen(fd, "w", encoding="utf-8") as f:
+                json.dump(data, f, ensure_ascii=False)
+            os.replace(tmp_path, path)
+        except Exception:
+            if os.path.exists(tmp_path):
+                os.remove(tmp_path)
+            raise
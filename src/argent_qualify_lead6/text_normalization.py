@@ -0,0 +1,135 @@
+#!/usr/bin/env python
+"""
+Unicode normalisation of transcripts, done once per transcript and shared by the analyzers.
+
+Speech recognition output mixes composed (NFC) and decomposed (NFD) Vietnamese
+text, and sometimes drops the diacritics altogether ("ngan sach" for "ngân
+sách"). normalize_text() produces a single buffer that is NFC, case-folded
+and optionally diacritic-folded, with an offset map back to the original
+transcript so matches can be reported against the text the caller sent.
+Keyword tables are normalised the same way once, at import time.
+"""
+import re
+import unicodedata
+from array import array
+from typing import Iterable, Tuple, Union
+
+# Letters whose diacritic is not a combining mark and survives NFD
+_FOLD_LETTERS = {"đ": "d", "Đ": "d", "ø": "o", "ł": "l"}
+
+
+def _fold(text: str) -> str:
+    """
+    Remove the diacritics of already case-folded text.
+    """
+    decomposed = unicodedata.normalize("NFD", text)
+    return "".join(_FOLD_LETTERS.get(char, char) for char in decomposed if not unicodedata.combining(char))
+
+
+def normalize_keyword(keyword: str, fold_diacritics: bool = False) -> str:
+    """
+    Normalise a keyword like normalize_text() normalises a transcript.
+    """
+    text = unicodedata.normalize("NFC", keyword).casefold()
+    return _fold(text) if fold_diacritics else text
+
+
+class NormalizedText:
+    """
+    Normalised copy of a text with the offset of every normalised character in the original.
+    """
+    __slots__ = ("original", "text", "offsets", "folded")
+
+    def __init__(self, original: str, text: str, offsets: array, folded: bool):
+        self.original = original
+        self.text = text
+        # offsets[i] is the index in the original of the character text[i]; offsets[len(text)] == len(original)
+        self.offsets = offsets
+        self.folded = folded
+
+    def original_span(self, start: int, end: int) -> Tuple[int, int]:
+        """
+        Map a [start, end) span of the normalised text to the original text.
+        """
+        if end <= start:
+            return self.offsets[start], self.offsets[start]
+        last = self.offsets[end - 1]
+        # The end is the start of the next original cluster
+        original_end = self.offsets[end] if self.offsets[end] > last else last + 1
+        return self.offsets[start], original_end
+
+
+def normalize_text(text: Union[str, NormalizedText], fold_diacritics: bool = False) -> NormalizedText:
+    """
+    Normalise a text to NFC and case-fold it, optionally removing diacritics.
+
+    Base characters and the combining marks following them are normalised
+    together, so the result maps back to the original cluster by cluster.
+    A NormalizedText with the same folding is returned as is.
+
+    Args:
+        text (Union[str, NormalizedText]): Text to normalise
+        fold_diacritics (bool): Also remove diacritics ("ngân sách" -> "ngan sach")
+
+    Returns:
+        NormalizedText: Normalised buffer and offset map
+    """
+    if isinstance(text, NormalizedText):
+        if text.folded == fold_diacritics:
+            return text
+        text = text.original
+
+    if text.isascii():
+        # Fast path: case folding of ASCII text keeps every offset
+        return NormalizedText(text, text.lower(), array("I", range(len(text) + 1)), fold_diacritics)
+
+    parts = []
+    offsets = array("I")
+    length = len(text)
+    index = 0
+    while index < length:
+        end = index + 1
+        while end < length and unicodedata.combining(text[end]):
+            end += 1
+        cluster = unicodedata.normalize("NFC", text[index:end]).casefold()
+        if fold_diacritics:
+            cluster = _fold(cluster)
+        parts.append(cluster)
+        offsets.extend([index] * len(cluster))
+        index = end
+    offsets.append(length)
+    return NormalizedText(text, "".join(parts), offsets, fold_diacritics)
+
+
+def has_diacritics(text: NormalizedText) -> bool:
+    """
+    Return True when a (non-folded) normalised text contains letters with diacritics.
+    """
+    return not text.text.isascii() and _fold(text.text) != text.text
+
+
+class KeywordTable:
+    """
+    Keywords normalised once, matched against normalised transcripts.
+
+    Exact (diacritic-preserving) matching is a substring test. Matching with
+    folded diacritics requires word boundaries, since removing the diacritics
+    turns short keywords into substrings of unrelated words ("giá" -> "gia"
+    in "gia đình").
+    """
+
+    def __init__(self, keywords: Iterable[str]):
+        self.keywords = tuple(keywords)
+        self.exact = tuple(normalize_keyword(keyword) for keyword in self.keywords)
+        self.folded = tuple(
+            re.compile(r"\b" + re.escape(normalize_keyword(keyword, fold_diacritics=True)) + r"\b")
+            for keyword in self.keywords
+        )
+
+    def count(self, text: NormalizedText) -> int:
+        """
+        Return how many keywords of the table occur in a normalised text.
+        """
+        if text.folded:
+            return sum(1 for pattern in self.folded if pattern.search(text.text))
+        return sum(1 for keyword in self.exact if keyword in text.text)
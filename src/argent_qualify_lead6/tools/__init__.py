@@ -1,3 +1,4 @@
 from .lead_analyzer_tool import LeadConversationAnalyzer
+from .knowledge_tool import KnowledgeSearchTool
 
-__all__ = ["LeadConversationAnalyzer"]
+__all__ = ["LeadConversationAnalyzer", "KnowledgeSearchTool"]
@@ -0,0 +1,30 @@
+from crewai.tools import BaseTool
+from typing import Type
+from pydantic import BaseModel, Field
+import json
+
+from ..instrumentation import span
+from ..knowledge_index import knowledge_index_from_env
+
+
+class KnowledgeSearchInput(BaseModel):
+    """Input schema for KnowledgeSearchTool."""
+    query: str = Field(..., description="Câu hỏi hoặc chủ đề cần tra cứu trong tài liệu nội bộ.")
+    limit: int = Field(5, description="Số đoạn tài liệu tối đa trả về.")
+
+class KnowledgeSearchTool(BaseTool):
+    name: str = "Knowledge Search"
+    description: str = (
+        "Công cụ này tra cứu tài liệu nội bộ trong thư mục knowledge/ (thông tin sản phẩm, "
+        "cách xử lý phản đối, ...) và trả về các đoạn liên quan nhất cùng điểm tương đồng."
+    )
+    args_schema: Type[BaseModel] = KnowledgeSearchInput
+
+    def _run(self, query: str, limit: int = 5) -> str:
+        """
+        Tìm các đoạn tài liệu liên quan nhất trong chỉ mục đã tính sẵn.
+        """
+        with span("tool", self.name):
+            # Chỉ mục được tạo (hoặc cập nhật) một lần mỗi tiến trình, không nhúng lại tài liệu
+            results = knowledge_index_from_env().search(query, limit)
+            return json.dumps({"query": query, "results": results}, ensure_ascii=False)
@@ -1,8 +1,13 @@
 from crewai.tools import BaseTool
-from typing import Type, Dict, Any, Union
+from typing import Type, Dict, Any, Optional, Union
 from pydantic import BaseModel, Field
 import json
 
+from .. import bant
+from ..bant import AUTHORITY_KEYWORDS, BUDGET_KEYWORDS, INTEREST_KEYWORDS, NEEDS_KEYWORDS, TIMELINE_KEYWORDS
+from ..instrumentation import span
+from ..text_normalization import KeywordTable, NormalizedText, has_diacritics, normalize_text
+
 
 class LeadConversationAnalyzerInput(BaseModel):
     """Input schema for LeadConversationAnalyzer."""
@@ -15,11 +20,22 @@ class LeadConversationAnalyzer(BaseTool):
         "nhu cầu của khách hàng, ngân sách, quyền quyết định, thời gian triển khai và mức độ quan tâm."
     )
     args_schema: Type[BaseModel] = LeadConversationAnalyzerInput
+    # So khớp không dấu cho transcript ASR bị mất dấu ("ngan sach"): True, False,
+    # hoặc None để tự bật khi transcript không có dấu
+    fold_diacritics: Optional[bool] = False
 
     def _run(self, lead_data: str) -> str:
         """
         Phân tích dữ liệu lead customer và trả về đánh giá về lead dưới dạng JSON.
         """
+        # Ghi nhận thời gian của mỗi lần gọi công cụ vào trace của lần chạy crew
+        with span("tool", self.name):
+            return self._analyze_lead(lead_data)
+
+    def _analyze_lead(self, lead_data: str) -> str:
+        """
+        Thực hiện phân tích dữ liệu lead customer.
+        """
         try:
             # Parse JSON input
             lead_json = json.loads(lead_data)
@@ -34,6 +50,9 @@ class LeadConversationAnalyzer(BaseTool):
                     "qualification_status": "Not Pass"
                 })
             
+            # Chuẩn hóa transcript một lần, dùng chung cho mọi bước phân tích
+            transcript = self._normalize(transcript)
+            
             # Phân tích đoạn hội thoại
             analysis = {
                 "needs_identified": self._analyze_needs(transcript),
@@ -45,7 +64,7 @@ class LeadConversationAnalyzer(BaseTool):
             
             # Tính điểm và đưa ra kết luận
             qualification_score = self._calculate_qualification_score(analysis)
-            qualification_status = "Pass" if qualification_score >= 7 else "Not Pass"
+            qualification_status = "Pass" if qualification_score >= bant.PASS_SCORE else "Not Pass"
             
             # Tạo kết quả trả về
             result = {
@@ -72,82 +91,44 @@ class LeadConversationAnalyzer(BaseTool):
                 "qualification_status": "Not Pass"
             })
     
+    def _normalize(self, transcript: Union[str, NormalizedText]) -> NormalizedText:
+        """Chuẩn hóa transcript (NFC, casefold, bỏ dấu nếu được cấu hình)"""
+        if isinstance(transcript, NormalizedText) and self.fold_diacritics is None:
+            return transcript
+        fold = self.fold_diacritics
+        if fold is None:
+            fold = not has_diacritics(normalize_text(transcript))
+        return normalize_text(transcript, fold_diacritics=fold)
+    
+    def _keyword_score(self, transcript: Union[str, NormalizedText], table: KeywordTable) -> float:
+        """Cộng 1.5 điểm cho mỗi từ khóa của bảng xuất hiện trong đoạn hội thoại, tối đa 10"""
+        return bant.keyword_score(self._normalize(transcript), table)
+    
     def _analyze_needs(self, transcript):
         """Phân tích nhu cầu của khách hàng từ đoạn hội thoại"""
         # Đây là phiên bản đơn giản, trong thực tế cần dùng NLP phức tạp hơn
-        keywords = ["tìm kiếm", "cần", "giải quyết", "vấn đề", "thách thức", "khó khăn"]
-        score = 0
-        
-        # Đếm số từ khóa xuất hiện trong đoạn hội thoại
-        for keyword in keywords:
-            if keyword.lower() in transcript.lower():
-                score += 1.5
-        
-        # Điều chỉnh điểm số về thang 10
-        return min(score, 10)
+        return self._keyword_score(transcript, NEEDS_KEYWORDS)
     
     def _analyze_budget(self, transcript):
         """Phân tích thông tin về ngân sách"""
-        budget_keywords = ["ngân sách", "chi phí", "đầu tư", "giá", "tiền", "USD", "VND"]
-        score = 0
-        
-        for keyword in budget_keywords:
-            if keyword.lower() in transcript.lower():
-                score += 1.5
-        
-        return min(score, 10)
+        return self._keyword_score(transcript, BUDGET_KEYWORDS)
     
     def _analyze_authority(self, transcript):
         """Phân tích quyền quyết định của lead"""
-        authority_keywords = ["quyết định", "phê duyệt", "giám đốc", "quản lý", "CEO", "CFO", "CTO"]
-        score = 0
-        
-        for keyword in authority_keywords:
-            if keyword.lower() in transcript.lower():
-                score += 1.5
-        
-        return min(score, 10)
+        return self._keyword_score(transcript, AUTHORITY_KEYWORDS)
     
     def _analyze_timeline(self, transcript):
         """Phân tích thông tin về thời gian triển khai"""
-        timeline_keywords = ["khi nào", "thời gian", "triển khai", "tháng", "quý", "năm", "lịch trình"]
-        score = 0
-        
-        for keyword in timeline_keywords:
-            if keyword.lower() in transcript.lower():
-                score += 1.5
-        
-        return min(score, 10)
+        return self._keyword_score(transcript, TIMELINE_KEYWORDS)
     
     def _analyze_interest(self, transcript):
         """Phân tích mức độ quan tâm của lead"""
-        interest_keywords = ["quan tâm", "thích", "ưu tiên", "muốn", "cần", "sẵn sàng"]
-        score = 0
-        
-        for keyword in interest_keywords:
-            if keyword.lower() in transcript.lower():
-                score += 1.5
-        
-        return min(score, 10)
+        return self._keyword_score(transcript, INTEREST_KEYWORDS)
     
     def _calculate_qualification_score(self, analysis):
         """Tính điểm đánh giá dựa trên các yếu tố phân tích"""
-        weights = {
-            "needs_identified": 0.25,
-            "budget_discussed": 0.25,
-            "decision_maker": 0.2,
-            "timeline_defined": 0.15,
-            "interest_level": 0.15
-        }
-        
-        score = sum(analysis[key] * weights[key] for key in weights)
-        return round(score, 1)
+        return bant.qualification_score(analysis)
     
     def _generate_recommendation(self, analysis, score):
         """Tạo đề xuất dựa trên phân tích"""
-        if score >= 7:
-            return "Nên tiếp tục tương tác với lead này. Có cơ hội cao để chuyển đổi thành khách hàng."
-        elif score >= 5:
-            return "Lead có tiềm năng nhưng cần thêm thông tin. Đề xuất một cuộc gọi theo dõi để làm rõ các điểm chưa rõ."
-        else:
-            return "Lead chưa sẵn sàng hoặc không phù hợp. Nên chuyển sang nurturing hoặc xem xét lại sau." 
\ No newline at end of file
+        return bant.recommendation(score) 
\ No newline at end of file
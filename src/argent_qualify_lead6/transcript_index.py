@@ -0,0 +1,344 @@
+#!/usr/bin/env python
+"""
+Inverted index over evaluated transcripts.
+
+Answering "leads of flow X that mentioned a budget over $20k last month" by
+re-running the evaluator means rescanning every transcript. Instead, every
+lead evaluated through the API is added to the index once, with:
+
+- its flowId, userId, createdAt and overall outcome
+- the distinct tokens of its transcript (normalised, diacritics folded)
+- the money amounts and forward-looking timeframes extracted from it
+- the status of every criterion it was evaluated against
+
+and queries are answered from the posting tables alone. The index is a
+SQLite database, so it is shared between the processes of a server and
+survives restarts; re-indexing a lead replaces its postings.
+"""
+import os
+import re
+import sqlite3
+import threading
+import time
+from datetime import datetime, timezone
+from typing import Any, Dict, List, Optional, Tuple
+
+from .criterion_store import criterion_key, transcript_hash
+from .entities import CURRENCIES, EntityIndex
+from .metrics import registry
+from .results import CriterionStatus, EvaluationResult
+from .text_normalization import normalize_keyword, normalize_text
+
+_TOKEN_RE = re.compile(r"\w+")
+
+QUERY_FIELDS = ("flow_id", "user_id", "created_after", "created_before", "created_within_days", "terms",
+                "amount", "timeframe_days", "criteria", "qualification_status", "limit", "offset")
+MAX_QUERY_LIMIT = 1000
+
+
+def _oid(document: Dict[str, Any], field: str) -> str:
+    value = document.get(field, "") if isinstance(document, dict) else ""
+    return value.get("$oid", "") if isinstance(value, dict) else str(value)
+
+
+def parse_timestamp(value: Any) -> Optional[float]:
+    """
+    Convert a timestamp to epoch seconds: epoch seconds, an ISO 8601 date or datetime
+    string, or a MongoDB extended JSON date ({"$date": {"$numberLong": "<ms>"}},
+    {"$date": <ms>} or {"$date": "<ISO string>"}).
+
+    Raises:
+        ValueError: When the value is not a timestamp
+    """
+    if value is None or value == "":
+        return None
+    if isinstance(value, dict) and "$date" in value:
+        value = value["$date"]
+        if isinstance(value, dict):
+            value = value.get("$numberLong")
+        if isinstance(value, (int, float)) or (isinstance(value, str) and value.isdigit()):
+            return float(value) / 1000
+    if isinstance(value, bool):
+        raise ValueError(f"Invalid timestamp '{value}'")
+    if isinstance(value, (int, float)):
+        return float(value)
+    if isinstance(value, str):
+        try:
+            parsed = datetime.fromisoformat(value.replace("Z", "+00:00"))
+        except ValueError:
+            raise ValueError(f"Invalid timestamp '{value}'") from None
+        if parsed.tzinfo is None:
+            parsed = parsed.replace(tzinfo=timezone.utc)
+        return parsed.timestamp()
+    raise ValueError(f"Invalid timestamp '{value}'")
+
+
+def transcript_tokens(transcript: str) -> List[str]:
+    """
+    Return the distinct tokens of a transcript, normalised and diacritic-folded.
+    """
+    return sorted(set(_TOKEN_RE.findall(normalize_text(transcript, fold_diacritics=True).text)))
+
+
+def _range(value: Any, field: str) -> Tuple[Optional[float], Optional[float]]:
+    if not isinstance(value, dict):
+        raise ValueError(f"'{field}' must be an object with 'min' and/or 'max'")
+    bounds = []
+    for name in ("min", "max"):
+        bound = value.get(name)
+        if bound is not None and (isinstance(bound, bool) or not isinstance(bound, (int, float))):
+            raise ValueError(f"'{field}.{name}' must be a number")
+        bounds.append(bound)
+    return bounds[0], bounds[1]
+
+
+class TranscriptIndex:
+    """
+    SQLite inverted index of evaluated leads.
+    """
+
+    def __init__(self, db_path: str):
+        """
+        Open (and create if needed) the index.
+
+        Args:
+            db_path (str): Path of the SQLite database file
+        """
+        self.db_path = db_path
+        self._lock = threading.Lock()
+        self._conn = sqlite3.connect(db_path, check_same_thread=False, timeout=30)
+        with self._lock, self._conn:
+            self._conn.execute("PRAGMA journal_mode=WAL")
+            self._conn.execute("PRAGMA synchronous=NORMAL")
+            self._conn.execute("""
+                CREATE TABLE IF NOT EXISTS indexed_leads (
+                    doc_id INTEGER PRIMARY KEY,
+                    flow_id TEXT NOT NULL,
+                    lead_key TEXT NOT NULL,
+                    lead_id TEXT NOT NULL,
+                    user_id TEXT NOT NULL,
+                    created_at REAL NOT NULL,
+                    qualification_status TEXT NOT NULL,
+                    confidence_score INTEGER NOT NULL,
+                    indexed_at REAL NOT NULL,
+                    UNIQUE (flow_id, lead_key)
+                )
+            """)
+            self._conn.execute("CREATE INDEX IF NOT EXISTS indexed_leads_created ON indexed_leads (flow_id, created_at)")
+            self._conn.execute("CREATE INDEX IF NOT EXISTS indexed_leads_user ON indexed_leads (user_id, created_at)")
+            self._conn.execute("""
+                CREATE TABLE IF NOT EXISTS lead_tokens (
+                    token TEXT NOT NULL,
+                    doc_id INTEGER NOT NULL,
+                    PRIMARY KEY (token, doc_id)
+                ) WITHOUT ROWID
+            """)
+            self._conn.execute("""
+                CREATE TABLE IF NOT EXISTS lead_amounts (
+                    currency TEXT NOT NULL,
+                    value REAL NOT NULL,
+                    doc_id INTEGER NOT NULL
+                )
+            """)
+            self._conn.execute("CREATE INDEX IF NOT EXISTS lead_amounts_value ON lead_amounts (currency, value)")
+            self._conn.execute("CREATE INDEX IF NOT EXISTS lead_amounts_doc ON lead_amounts (doc_id)")
+            self._conn.execute("""
+                CREATE TABLE IF NOT EXISTS lead_timeframes (
+                    days REAL NOT NULL,
+                    doc_id INTEGER NOT NULL
+                )
+            """)
+            self._conn.execute("CREATE INDEX IF NOT EXISTS lead_timeframes_days ON lead_timeframes (days)")
+            self._conn.execute("CREATE INDEX IF NOT EXISTS lead_timeframes_doc ON lead_timeframes (doc_id)")
+            self._conn.execute("""
+                CREATE TABLE IF NOT EXISTS lead_outcomes (
+                    criterion_key TEXT NOT NULL,
+                    status INTEGER NOT NULL,
+                    doc_id INTEGER NOT NULL,
+                    PRIMARY KEY (criterion_key, status, doc_id)
+                ) WITHOUT ROWID
+            """)
+
+    def add(self, lead_data: Dict[str, Any], transcript: str, result: EvaluationResult) -> Optional[int]:
+        """
+        Index an evaluated lead document, replacing the postings of an earlier evaluation
+        (criterion outcomes are replaced per criterion).
+
+        Leads are keyed by (flowId, _id); a lead without _id is keyed by its transcript.
+
+        Args:
+            lead_data (Dict[str, Any]): Lead document ("_id", "userId", "flowId", "createdAt")
+            transcript (str): Transcript of the lead
+            result (EvaluationResult): Evaluation result of the lead
+
+        Returns:
+            Optional[int]: Document id of the lead in the index
+        """
+        try:
+            created_at = parse_timestamp(lead_data.get("createdAt"))
+        except ValueError:
+            created_at = None
+        created_at = created_at or time.time()
+        reference = datetime.fromtimestamp(created_at, timezone.utc).date()
+        entities = EntityIndex.build(transcript, reference_date=reference)
+        tokens = transcript_tokens(transcript)
+        lead_id = _oid(lead_data, "_id")
+        lead_key = lead_id or transcript_hash(transcript)
+        statuses = {}
+        for criterion, status in zip(result.criteria, result.statuses):
+            statuses[criterion_key(criterion)] = status
+
+        with self._lock, self._conn:
+            row = self._conn.execute("SELECT doc_id FROM indexed_leads WHERE flow_id = ? AND lead_key = ?",
+                                     (_oid(lead_data, "flowId"), lead_key)).fetchone()
+            if row is not None:
+                doc_id = row[0]
+                for table in ("lead_tokens", "lead_amounts", "lead_timeframes"):
+                    self._conn.execute(f"DELETE FROM {table} WHERE doc_id = ?", (doc_id,))
+                # Outcomes of criteria of other prompts stay queryable
+                self._conn.executemany("DELETE FROM lead_outcomes WHERE criterion_key = ? AND doc_id = ?",
+                                       [(key, doc_id) for key in statuses])
+            cursor = self._conn.execute(
+                "INSERT OR REPLACE INTO indexed_leads (doc_id, flow_id, lead_key, lead_id, user_id, created_at,"
+                " qualification_status, confidence_score, indexed_at) VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?)",
+                (row[0] if row else None, _oid(lead_data, "flowId"), lead_key, lead_id, _oid(lead_data, "userId"),
+                 created_at, result.qualification_status, result.confidence_score, time.time()),
+            )
+            doc_id = cursor.lastrowid
+            self._conn.executemany("INSERT INTO lead_tokens (token, doc_id) VALUES (?, ?)",
+                                   [(token, doc_id) for token in tokens])
+            self._conn.executemany("INSERT INTO lead_amounts (currency, value, doc_id) VALUES (?, ?, ?)",
+                                   [(amount.currency or "", amount.value, doc_id) for amount in entities.amounts])
+            self._conn.executemany("INSERT INTO lead_timeframes (days, doc_id) VALUES (?, ?)",
+                                   [(days, doc_id) for days in entities.days_ahead()])
+            self._conn.executemany("INSERT INTO lead_outcomes (criterion_key, status, doc_id) VALUES (?, ?, ?)",
+                                   [(key, status, doc_id) for key, status in statuses.items()])
+        registry.inc("index.leads_indexed")
+        return doc_id
+
+    def query(self, filters: Dict[str, Any]) -> Dict[str, Any]:
+        """
+        Return the indexed leads matching all the given filters, most recent first.
+
+        Filters (all optional):
+            flow_id, user_id (str): Owner of the leads
+            created_after, created_before: Bounds of createdAt (epoch seconds or ISO 8601)
+            created_within_days (number): createdAt within the last N days
+            terms (List[str]): Words that must all occur in the transcript
+            amount ({"min", "max", "currency"}): A money amount in the range was mentioned
+            timeframe_days ({"min", "max"}): A timeframe (in days from the call) in the range was mentioned
+            criteria (Dict[str, str]): Criterion text -> status ("Met", "Unclear", "Not Met")
+            qualification_status (str): Overall outcome of the lead
+            limit (int): Maximum leads returned (default 100, at most MAX_QUERY_LIMIT)
+            offset (int): Leads skipped, for paging
+
+        Returns:
+            Dict[str, Any]: {"total": <matching leads>, "leads": [...]}
+
+        Raises:
+            ValueError: When a filter is unknown or invalid
+        """
+        unknown = [field for field in filters if field not in QUERY_FIELDS]
+        if unknown:
+            raise ValueError(f"Unknown query fields: {', '.join(unknown)}")
+        conditions: List[str] = []
+        parameters: List[Any] = []
+        for field in ("flow_id", "user_id", "qualification_status"):
+            if filters.get(field) is not None:
+                conditions.append(f"{field} = ?")
+                parameters.append(str(filters[field]))
+
+        created_after = parse_timestamp(filters.get("created_after"))
+        if filters.get("created_within_days") is not None:
+            days = filters["created_within_days"]
+            if isinstance(days, bool) or not isinstance(days, (int, float)):
+                raise ValueError("'created_within_days' must be a number")
+            created_after = max(created_after or 0.0, time.time() - days * 86400)
+        if created_after is not None:
+            conditions.append("created_at >= ?")
+            parameters.append(created_after)
+        created_before = parse_timestamp(filters.get("created_before"))
+        if created_before is not None:
+            conditions.append("created_at < ?")
+            parameters.append(created_before)
+
+        terms = filters.get("terms") or []
+        if isinstance(terms, str) or not all(isinstance(term, str) for term in terms):
+            raise ValueError("'terms' must be a list of strings")
+        for term in terms:
+            # A phrase requires all its words
+            for token in _TOKEN_RE.findall(normalize_keyword(term, fold_diacritics=True)):
+                conditions.append("doc_id IN (SELECT doc_id FROM lead_tokens WHERE token = ?)")
+                parameters.append(token)
+
+        if filters.get("amount") is not None:
+            low, high = _range(filters["amount"], "amount")
+            subquery = ["SELECT doc_id FROM lead_amounts WHERE 1"]
+            currency = filters["amount"].get("currency")
+            if currency is not None:
+                currency = CURRENCIES.get(str(currency).lower(), str(currency).upper())
+                subquery.append("currency = ?")
+                parameters.append(currency)
+            if low is not None:
+                subquery.append("value >= ?")
+                parameters.append(low)
+            if high is not None:
+                subquery.append("value <= ?")
+                parameters.append(high)
+            conditions.append(f"doc_id IN ({' AND '.join(subquery)})")
+        if filters.get("timeframe_days") is not None:
+            low, high = _range(filters["timeframe_days"], "timeframe_days")
+            subquery = ["SELECT doc_id FROM lead_timeframes WHERE 1"]
+            if low is not None:
+                subquery.append("days >= ?")
+                parameters.append(low)
+            if high is not None:
+                subquery.append("days <= ?")
+                parameters.append(high)
+            conditions.append(f"doc_id IN ({' AND '.join(subquery)})")
+
+        criteria = filters.get("criteria") or {}
+        if not isinstance(criteria, dict):
+            raise ValueError("'criteria' must map criterion texts to statuses")
+        for criterion, label in criteria.items():
+            try:
+                status = CriterionStatus.from_label(label)
+            except ValueError:
+                raise ValueError(f"Unknown status '{label}', expected one of: Met, Unclear, Not Met") from None
+            conditions.append("doc_id IN (SELECT doc_id FROM lead_outcomes WHERE criterion_key = ? AND status = ?)")
+            parameters.extend((criterion_key(criterion), int(status)))
+
+        limit, offset = filters.get("limit", 100), filters.get("offset", 0)
+        if not isinstance(limit, int) or not isinstance(offset, int) or limit < 0 or offset < 0:
+            raise ValueError("'limit' and 'offset' must be non-negative integers")
+        limit = min(limit, MAX_QUERY_LIMIT)
+
+        where = f" WHERE {' AND '.join(conditions)}" if conditions else ""
+        started = time.perf_counter()
+        with self._lock:
+            total = self._conn.execute(f"SELECT COUNT(*) FROM indexed_leads{where}", parameters).fetchone()[0]
+            rows = self._conn.execute(
+                "SELECT lead_id, user_id, flow_id, created_at, qualification_status, confidence_score"
+                f" FROM indexed_leads{where} ORDER BY created_at DESC, doc_id DESC LIMIT ? OFFSET ?",
+                (*parameters, limit, offset),
+            ).fetchall()
+        registry.observe("index.query_seconds", time.perf_counter() - started)
+        return {
+            "total": total,
+            "leads": [
+                {"lead_id": lead_id, "user_id": user_id, "flow_id": flow_id, "created_at": created_at,
+                 "qualification_status": status, "confidence_score": score}
+                for lead_id, user_id, flow_id, created_at, status, score in rows
+            ],
+        }
+
+    def close(self) -> None:
+        self._conn.close()
+
+
+def transcript_index_from_env() -> Optional[TranscriptIndex]:
+    """
+    Open the index at LEAD_INDEX_DB, or return None when it is not set (indexing is opt-in).
+    """
+    db_path = os.getenv("LEAD_INDEX_DB", "")
+    return TranscriptIndex(db_path) if db_path else None
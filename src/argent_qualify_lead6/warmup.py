@@ -0,0 +1,80 @@
+#!/usr/bin/env python
+"""
+Warm-up of the rule engine and readiness state of the serving process.
+
+warm_up() compiles the rule tables and runs one sample evaluation so that
+lazily initialised state (regex caches, imports) is built before traffic
+arrives. Under a preforking server it runs once in the master, and the
+workers inherit the result copy-on-write.
+"""
+import contextlib
+import io
+import threading
+import time
+
+from .call_quality_evaluator import LeadQualificationEvaluator, precompile_rule_tables
+
+_ready = threading.Event()
+_warm_up_lock = threading.Lock()
+_warm_up_info = {}
+
+SAMPLE_PROMPT = """
+Lead qualification criteria:
+- Customer has a minimum budget of $10,000
+- Customer has decision-making authority
+- Customer has a clear need for the product
+- Customer needs implementation within 3 months
+"""
+
+SAMPLE_TRANSCRIPT = """
+Sales: What's the budget for this project?
+Customer: About $15,000. I need a human resources management system and want to implement it next month.
+Sales: Are you the final decision maker?
+Customer: Yes, I'm the HR director and I have the authority to make this decision.
+"""
+
+
+def warm_up() -> dict:
+    """
+    Pre-compile the rule tables and mark the process as ready. Idempotent.
+
+    Returns:
+        dict: Warm-up information (compiled pattern count, duration)
+    """
+    with _warm_up_lock:
+        if _ready.is_set():
+            return dict(_warm_up_info)
+        start = time.perf_counter()
+        compiled = precompile_rule_tables()
+        # Exercise the whole evaluation path once, without its debug output
+        with contextlib.redirect_stdout(io.StringIO()):
+            LeadQualificationEvaluator().evaluate(SAMPLE_PROMPT, SAMPLE_TRANSCRIPT)
+        _warm_up_info.update({
+            "compiled_keyword_patterns": compiled,
+            "warm_up_seconds": round(time.perf_counter() - start, 6),
+        })
+        _ready.set()
+        return dict(_warm_up_info)
+
+
+def is_ready() -> bool:
+    """
+    Return True once warm-up has completed in this process (or its parent).
+    """
+    return _ready.is_set()
+
+
+def readiness() -> tuple:
+    """
+    Return (body, status code) of the readiness probe.
+    """
+    if not is_ready():
+        return {"status": "warming up"}, 503
+    return {"status": "ready", **_warm_up_info}, 200
+
+
+def liveness() -> tuple:
+    """
+    Return (body, status code) of the liveness probe.
+    """
+    return {"status": "alive"}, 200
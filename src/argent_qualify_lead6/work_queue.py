@@ -0,0 +1,454 @@
+#!/usr/bin/env python
+"""
+Durable work queue of lead chunks shared by backfill workers on several hosts.
+
+The queue is a SQLite database on shared storage, the only service the
+batch environment offers. A backfill is enqueued once as chunks of lead
+documents; any number of worker processes, on any host, then lease chunks,
+evaluate them and commit their results:
+
+- A lease holds a chunk for lease_seconds and is renewed by a heartbeat
+  thread while the chunk is evaluated. The chunk of a worker that died (or
+  lost contact with the storage) is leased again once its lease expired.
+- Every lease gets a new token. Completing a chunk stores its results and
+  marks it done in one transaction, only if the worker's token is still the
+  chunk's, so the results of a chunk are committed exactly once even when
+  a lease expired and the chunk was evaluated twice.
+- A chunk whose evaluation fails is retried, up to max_attempts leases,
+  then marked failed with its error.
+
+Results are stored in the lead_results and criteria_sets tables of the
+queue database (the schema of the SQLite result sink), from which they can
+be exported to the other sinks.
+
+The database uses a rollback journal rather than WAL, since WAL needs shared
+memory between processes of a single host. The shared filesystem must
+support POSIX locks (e.g. NFSv4), and lease_seconds should be well above
+the clock skew between hosts.
+"""
+import json
+import os
+import socket
+import sqlite3
+import threading
+import time
+import uuid
+import zlib
+from contextlib import contextmanager
+from typing import Any, Callable, Dict, Iterable, Iterator, List, NamedTuple, Optional
+
+from .results_sink import (ResultRecord, create_result_tables, criteria_key, insert_criteria, insert_records,
+                           read_records)
+
+CHUNK_PENDING = "pending"
+CHUNK_LEASED = "leased"
+CHUNK_DONE = "done"
+CHUNK_FAILED = "failed"
+CHUNK_STATUSES = (CHUNK_PENDING, CHUNK_LEASED, CHUNK_DONE, CHUNK_FAILED)
+
+
+class Lease(NamedTuple):
+    """
+    A chunk leased by a worker.
+    """
+    chunk_id: int
+    token: str
+    attempt: int
+    documents: List[Dict[str, Any]]
+
+
+class WorkQueue:
+    """
+    SQLite work queue of lead chunks with leases, heartbeats and retries.
+    """
+
+    def __init__(self, db_path: str, lease_seconds: float = 120.0, max_attempts: int = 3,
+                 owner: Optional[str] = None, timeout: float = 60.0):
+        """
+        Open (and create if needed) the queue database.
+
+        Args:
+            db_path (str): Path of the SQLite database file, on storage shared by the workers
+            lease_seconds (float): Time a chunk stays leased without a heartbeat
+            max_attempts (int): Leases of a chunk before it is marked failed
+            owner (str, optional): Name of this worker, "<host>:<pid>" by default
+            timeout (float): Seconds to wait for the database lock
+        """
+        self.db_path = db_path
+        self.lease_seconds = lease_seconds
+        self.max_attempts = max_attempts
+        self.owner = owner or f"{socket.gethostname()}:{os.getpid()}"
+        self._lock = threading.Lock()
+        # Transactions are explicit (BEGIN IMMEDIATE), so concurrent leases are serialised
+        self._conn = sqlite3.connect(db_path, timeout=timeout, isolation_level=None, check_same_thread=False)
+        self._conn.row_factory = sqlite3.Row
+        self._conn.execute("PRAGMA journal_mode=DELETE")
+        with self._transaction():
+            self._conn.execute("""
+                CREATE TABLE IF NOT EXISTS queue_info (
+                    key TEXT PRIMARY KEY,
+                    value TEXT NOT NULL
+                )
+            """)
+            self._conn.execute("""
+                CREATE TABLE IF NOT EXISTS chunks (
+                    id INTEGER PRIMARY KEY,
+                    source TEXT NOT NULL,
+                    first_index INTEGER NOT NULL,
+                    size INTEGER NOT NULL,
+                    documents BLOB NOT NULL,
+                    status TEXT NOT NULL,
+                    attempts INTEGER NOT NULL DEFAULT 0,
+                    lease_token TEXT,
+                    lease_owner TEXT,
+                    lease_expires REAL,
+                    first_leased_at REAL,
+                    finished_at REAL,
+                    leads INTEGER NOT NULL DEFAULT 0,
+                    skipped INTEGER NOT NULL DEFAULT 0,
+                    error TEXT,
+                    UNIQUE (source, first_index)
+                )
+            """)
+            self._conn.execute("CREATE INDEX IF NOT EXISTS chunks_status ON chunks (status, id)")
+            create_result_tables(self._conn)
+
+    @contextmanager
+    def _transaction(self) -> Iterator[sqlite3.Connection]:
+        with self._lock:
+            self._conn.execute("BEGIN IMMEDIATE")
+            try:
+                yield self._conn
+            except BaseException:
+                self._conn.execute("ROLLBACK")
+                raise
+            self._conn.execute("COMMIT")
+
+    def set_criteria(self, criteria: List[str]) -> str:
+        """
+        Set the criteria every chunk of the queue is evaluated against.
+
+        Returns:
+            str: criteria_key() of the criteria
+
+        Raises:
+            ValueError: When the queue already has different criteria
+        """
+        key = criteria_key(criteria)
+        with self._transaction() as conn:
+            row = conn.execute("SELECT value FROM queue_info WHERE key = 'criteria_key'").fetchone()
+            if row is not None and row["value"] != key:
+                raise ValueError("The queue was created with different criteria; use another queue database")
+            conn.execute("INSERT OR REPLACE INTO queue_info (key, value) VALUES ('criteria', ?)",
+                         (json.dumps(criteria, ensure_ascii=False),))
+            conn.execute("INSERT OR REPLACE INTO queue_info (key, value) VALUES ('criteria_key', ?)", (key,))
+            insert_criteria(conn, key, criteria)
+        return key
+
+    def criteria(self) -> Optional[List[str]]:
+        """
+        Return the criteria of the queue, or None before set_criteria().
+        """
+        with self._lock:
+            row = self._conn.execute("SELECT value FROM queue_info WHERE key = 'criteria'").fetchone()
+        return json.loads(row["value"]) if row is not None else None
+
+    def enqueue(self, source: str, documents: Iterable[Dict[str, Any]], chunk_size: int = 500) -> int:
+        """
+        Add the documents of a source as chunks. Enqueuing the same source again
+        only adds the chunks that are not in the queue yet.
+
+        Args:
+            source (str): Name of the input (e.g. its absolute path), identifying its chunks
+            documents (Iterable[Dict[str, Any]]): Lead documents, in a stable order
+            chunk_size (int): Documents per chunk
+
+        Returns:
+            int: Number of chunks added
+        """
+        added = 0
+        chunk: List[Dict[str, Any]] = []
+        first_index = 0
+        for index, document in enumerate(documents):
+            if not chunk:
+                first_index = index
+            chunk.append(document)
+            if len(chunk) >= chunk_size:
+                added += self._add_chunk(source, first_index, chunk)
+                chunk = []
+        if chunk:
+            added += self._add_chunk(source, first_index, chunk)
+        return added
+
+    def _add_chunk(self, source: str, first_index: int, documents: List[Dict[str, Any]]) -> int:
+        blob = zlib.compress(json.dumps(documents, ensure_ascii=False).encode("utf-8"))
+        with self._transaction() as conn:
+            cursor = conn.execute(
+                "INSERT OR IGNORE INTO chunks (source, first_index, size, documents, status) VALUES (?, ?, ?, ?, ?)",
+                (source, first_index, len(documents), blob, CHUNK_PENDING),
+            )
+            return cursor.rowcount
+
+    def lease(self) -> Optional[Lease]:
+        """
+        Lease the oldest pending chunk, or a chunk whose lease expired.
+
+        Returns:
+            Optional[Lease]: The leased chunk, or None when no chunk is available
+        """
+        now = time.time()
+        with self._transaction() as conn:
+            while True:
+                row = conn.execute(
+                    "SELECT id, attempts, documents FROM chunks WHERE status = ?"
+                    " OR (status = ? AND lease_expires < ?) ORDER BY id LIMIT 1",
+                    (CHUNK_PENDING, CHUNK_LEASED, now),
+                ).fetchone()
+                if row is None:
+                    return None
+                if row["attempts"] >= self.max_attempts:
+                    # Every lease of this chunk expired: its worker died or hung each time
+                    conn.execute(
+                        "UPDATE chunks SET status = ?, lease_token = NULL, finished_at = ?,"
+                        " error = COALESCE(error, 'Lease expired') WHERE id = ?",
+                        (CHUNK_FAILED, now, row["id"]),
+                    )
+                    continue
+                token = uuid.uuid4().hex
+                conn.execute(
+                    "UPDATE chunks SET status = ?, attempts = attempts + 1, lease_token = ?, lease_owner = ?,"
+                    " lease_expires = ?, first_leased_at = COALESCE(first_leased_at, ?) WHERE id = ?",
+                    (CHUNK_LEASED, token, self.owner, now + self.lease_seconds, now, row["id"]),
+                )
+                documents = json.loads(zlib.decompress(row["documents"]).decode("utf-8"))
+                return Lease(row["id"], token, row["attempts"] + 1, documents)
+
+    def heartbeat(self, lease: Lease) -> bool:
+        """
+        Renew a lease.
+
+        Returns:
+            bool: False when the lease was lost (it expired and the chunk was leased again)
+        """
+        with self._transaction() as conn:
+            cursor = conn.execute(
+                "UPDATE chunks SET lease_expires = ? WHERE id = ? AND lease_token = ? AND status = ?",
+                (time.time() + self.lease_seconds, lease.chunk_id, lease.token, CHUNK_LEASED),
+            )
+            return cursor.rowcount == 1
+
+    def complete(self, lease: Lease, records: List[ResultRecord], skipped: int = 0) -> bool:
+        """
+        Store the results of a leased chunk and mark it done, in one transaction.
+
+        Args:
+            lease (Lease): Lease of the chunk
+            records (List[ResultRecord]): Results of the chunk's leads
+            skipped (int): Documents of the chunk that could not be evaluated (no transcript)
+
+        Returns:
+            bool: False when the lease was lost; nothing is stored then
+        """
+        with self._transaction() as conn:
+            cursor = conn.execute(
+                "UPDATE chunks SET status = ?, lease_token = NULL, lease_expires = NULL, finished_at = ?,"
+                " leads = ?, skipped = ?, error = NULL WHERE id = ? AND lease_token = ? AND status = ?",
+                (CHUNK_DONE, time.time(), len(records), skipped, lease.chunk_id, lease.token, CHUNK_LEASED),
+            )
+            if cursor.rowcount != 1:
+                return False
+            insert_records(conn, records)
+        return True
+
+    def fail(self, lease: Lease, error: str) -> Optional[str]:
+        """
+        Give a leased chunk back after a failed evaluation: it is retried, or
+        marked failed once it was leased max_attempts times.
+
+        Returns:
+            Optional[str]: New status of the chunk, None when the lease was lost
+        """
+        status = CHUNK_FAILED if lease.attempt >= self.max_attempts else CHUNK_PENDING
+        with self._transaction() as conn:
+            cursor = conn.execute(
+                "UPDATE chunks SET status = ?, lease_token = NULL, lease_expires = NULL, error = ?,"
+                " finished_at = CASE WHEN ? = ? THEN ? END WHERE id = ? AND lease_token = ? AND status = ?",
+                (status, error, status, CHUNK_FAILED, time.time(), lease.chunk_id, lease.token, CHUNK_LEASED),
+            )
+        return status if cursor.rowcount == 1 else None
+
+    def retry_failed(self) -> int:
+        """
+        Put the failed chunks back in the queue with fresh attempts.
+
+        Returns:
+            int: Number of chunks re-queued
+        """
+        with self._transaction() as conn:
+            cursor = conn.execute(
+                "UPDATE chunks SET status = ?, attempts = 0, finished_at = NULL WHERE status = ?",
+                (CHUNK_PENDING, CHUNK_FAILED),
+            )
+            return cursor.rowcount
+
+    def progress(self, window: float = 300.0) -> Dict[str, Any]:
+        """
+        Return the progress of the queue and its throughput.
+
+        Args:
+            window (float): Seconds over which the recent throughput is measured
+
+        Returns:
+            Dict[str, Any]: Chunks and documents by status, evaluated and skipped leads,
+                throughput (overall and over the window, in leads per second), estimated
+                seconds remaining, and the chunks and leads done by each worker
+        """
+        now = time.time()
+        with self._lock:
+            by_status = {row["status"]: (row["chunks"], row["documents"]) for row in self._conn.execute(
+                "SELECT status, COUNT(*) AS chunks, SUM(size) AS documents FROM chunks GROUP BY status"
+            )}
+            totals = self._conn.execute(
+                "SELECT SUM(leads) AS leads, SUM(skipped) AS skipped, MIN(first_leased_at) AS started,"
+                " MAX(finished_at) AS last FROM chunks WHERE status = ?", (CHUNK_DONE,)
+            ).fetchone()
+            recent = self._conn.execute(
+                "SELECT SUM(size) AS documents FROM chunks WHERE status = ? AND finished_at >= ?",
+                (CHUNK_DONE, now - window),
+            ).fetchone()
+            workers = self._conn.execute(
+                "SELECT lease_owner, COUNT(*) AS chunks, SUM(leads) AS leads FROM chunks WHERE status = ?"
+                " GROUP BY lease_owner ORDER BY lease_owner", (CHUNK_DONE,)
+            ).fetchall()
+        chunks = {status: by_status.get(status, (0, 0))[0] for status in CHUNK_STATUSES}
+        documents = {status: by_status.get(status, (0, 0))[1] or 0 for status in CHUNK_STATUSES}
+        done_documents = documents[CHUNK_DONE]
+        remaining = documents[CHUNK_PENDING] + documents[CHUNK_LEASED]
+        elapsed = (totals["last"] - totals["started"]) if totals["started"] and totals["last"] else 0
+        overall_rate = done_documents / elapsed if elapsed > 0 else 0.0
+        # The window is shorter while the backfill has run for less than it
+        span = min(window, now - totals["started"]) if totals["started"] else window
+        recent_rate = (recent["documents"] or 0) / span if span > 0 else 0.0
+        rate = recent_rate or overall_rate
+        return {
+            "chunks": dict(chunks, total=sum(chunks.values())),
+            "documents": dict(documents, total=sum(documents.values())),
+            "leads_evaluated": totals["leads"] or 0,
+            "leads_skipped": totals["skipped"] or 0,
+            "throughput": round(overall_rate, 2),
+            "recent_throughput": round(recent_rate, 2),
+            "eta_seconds": round(remaining / rate) if rate and remaining else (0 if not remaining else None),
+            "workers": {row["lease_owner"]: {"chunks": row["chunks"], "leads": row["leads"] or 0}
+                        for row in workers},
+        }
+
+    def records(self, batch_size: int = 1000) -> Iterator[List[ResultRecord]]:
+        """
+        Read the stored results in batches, e.g. to export them to other sinks.
+        """
+        yield from read_records(self._conn, batch_size)
+
+    def close(self) -> None:
+        with self._lock:
+            self._conn.close()
+
+
+class LeaseKeeper:
+    """
+    Renews a lease from a background thread while its chunk is evaluated.
+    """
+
+    def __init__(self, queue: WorkQueue, lease: Lease):
+        self.queue = queue
+        self.lease = lease
+        # Set when a heartbeat finds that the chunk was leased again
+        self.lost = threading.Event()
+        self._stop = threading.Event()
+        self._thread = threading.Thread(target=self._beat, name=f"lease-{lease.chunk_id}", daemon=True)
+
+    def _beat(self) -> None:
+        while not self._stop.wait(self.queue.lease_seconds / 3):
+            try:
+                renewed = self.queue.heartbeat(self.lease)
+            except sqlite3.Error:
+                # The storage may be briefly unavailable; the lease lasts until it expires
+                continue
+            if not renewed:
+                self.lost.set()
+                return
+
+    def __enter__(self) -> "LeaseKeeper":
+        self._thread.start()
+        return self
+
+    def __exit__(self, *exc_info) -> None:
+        self._stop.set()
+        self._thread.join()
+
+
+def run_worker(queue: WorkQueue, evaluate: Callable[[Dict[str, Any]], Optional[ResultRecord]],
+               poll_interval: float = 5.0, report: Optional[Callable[[str], None]] = print,
+               max_chunks: Optional[int] = None) -> Dict[str, int]:
+    """
+    Lease, evaluate and complete chunks until the queue is drained.
+
+    While other workers hold leases the worker keeps polling, since their
+    chunks come back to the queue if they die.
+
+    Args:
+        queue (WorkQueue): Queue to work on
+        evaluate (Callable): Lead document -> its result record, or None when it cannot be evaluated
+        poll_interval (float): Seconds between two polls while no chunk is available
+        report (Callable, optional): Receives a progress line after every chunk
+        max_chunks (int, optional): Stop after completing this many chunks
+
+    Returns:
+        Dict[str, int]: Chunks completed, retried, failed and lost, and leads evaluated by this worker
+    """
+    stats = {"chunks": 0, "leads": 0, "retried": 0, "failed": 0, "lost": 0}
+    while max_chunks is None or stats["chunks"] < max_chunks:
+        lease = queue.lease()
+        if lease is None:
+            chunks = queue.progress()["chunks"]
+            if not chunks[CHUNK_PENDING] and not chunks[CHUNK_LEASED]:
+                break
+            time.sleep(poll_interval)
+            continue
+        start = time.perf_counter()
+        records: List[ResultRecord] = []
+        skipped = 0
+        try:
+            with LeaseKeeper(queue, lease) as keeper:
+                for document in lease.documents:
+                    if keeper.lost.is_set():
+                        break
+                    record = evaluate(document)
+                    if record is None:
+                        skipped += 1
+                    else:
+                        records.append(record)
+        except Exception as e:
+            status = queue.fail(lease, f"{type(e).__name__}: {e}")
+            if status is None:
+                # The lease expired meanwhile, the chunk belongs to another worker now
+                stats["lost"] += 1
+            else:
+                stats["failed" if status == CHUNK_FAILED else "retried"] += 1
+            if report:
+                report(f"Chunk {lease.chunk_id} failed (attempt {lease.attempt}): {e}")
+            continue
+        if keeper.lost.is_set() or not queue.complete(lease, records, skipped):
+            stats["lost"] += 1
+            if report:
+                report(f"Chunk {lease.chunk_id}: lease lost, results discarded")
+            continue
+        stats["chunks"] += 1
+        stats["leads"] += len(records)
+        if report:
+            elapsed = time.perf_counter() - start
+            progress = queue.progress()
+            report(f"Chunk {lease.chunk_id}: {len(records)} leads in {elapsed:.1f}s "
+                   f"({len(lease.documents) / elapsed if elapsed else 0:.0f} leads/s); "
+                   f"{progress['chunks'][CHUNK_DONE]}/{progress['chunks']['total']} chunks done, "
+                   f"queue at {progress['recent_throughput']} leads/s")
+    return stats
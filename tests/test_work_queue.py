@@ -0,0 +1,97 @@
+"""
+Tests of the lease, completion and retry rules of the shared work queue.
+"""
+import time
+
+from src.argent_qualify_lead6.results_sink import ResultRecord
+from src.argent_qualify_lead6.work_queue import CHUNK_DONE, CHUNK_FAILED, CHUNK_PENDING, WorkQueue, run_worker
+
+LEASE_SECONDS = 0.2
+LEADS = [{"_id": {"$oid": f"{index:024x}"}, "leadData": {"transcript": "budget"}} for index in range(3)]
+
+
+def make_record(document):
+    return ResultRecord(document["_id"]["$oid"], "", "", "Qualified", 100, b"\x02", "criteria", time.time())
+
+
+def open_queue(tmp_path, max_attempts=3):
+    queue = WorkQueue(str(tmp_path / "queue.db"), lease_seconds=LEASE_SECONDS, max_attempts=max_attempts)
+    queue.set_criteria(["Customer has a budget"])
+    queue.enqueue("leads.json", LEADS, chunk_size=len(LEADS))
+    return queue
+
+
+def stored_records(queue):
+    return [record for batch in queue.records() for record in batch]
+
+
+def chunk_status(queue):
+    return queue.progress()["chunks"]
+
+
+def test_stale_lease_cannot_complete(tmp_path):
+    queue = open_queue(tmp_path)
+    stale = queue.lease()
+    assert queue.lease() is None
+    time.sleep(LEASE_SECONDS * 1.5)
+
+    # The expired chunk is leased again, under a new token
+    current = queue.lease()
+    assert current.chunk_id == stale.chunk_id
+    assert current.token != stale.token
+    assert current.attempt == 2
+    assert not queue.heartbeat(stale)
+
+    assert queue.complete(stale, [make_record(document) for document in stale.documents]) is False
+    assert stored_records(queue) == []
+    assert queue.fail(stale, "late failure") is None
+
+    assert queue.complete(current, [make_record(document) for document in current.documents]) is True
+    assert len(stored_records(queue)) == len(LEADS)
+    assert chunk_status(queue)[CHUNK_DONE] == 1
+    # Results are committed once: completing again is refused
+    assert queue.complete(current, [make_record(document) for document in current.documents]) is False
+    assert len(stored_records(queue)) == len(LEADS)
+
+
+def test_fail_retries_until_max_attempts(tmp_path):
+    queue = open_queue(tmp_path, max_attempts=2)
+    first = queue.lease()
+    assert queue.fail(first, "ValueError: boom") == CHUNK_PENDING
+    second = queue.lease()
+    assert second.attempt == 2
+    assert queue.fail(second, "ValueError: boom") == CHUNK_FAILED
+    assert queue.lease() is None
+    assert chunk_status(queue)[CHUNK_FAILED] == 1
+
+    assert queue.retry_failed() == 1
+    assert queue.lease().attempt == 1
+
+
+def test_expired_leases_count_as_attempts(tmp_path):
+    queue = open_queue(tmp_path, max_attempts=2)
+    queue.lease()
+    time.sleep(LEASE_SECONDS * 1.5)
+    queue.lease()
+    time.sleep(LEASE_SECONDS * 1.5)
+    # Both leases expired without an answer: the chunk is failed rather than leased a third time
+    assert queue.lease() is None
+    assert chunk_status(queue)[CHUNK_FAILED] == 1
+
+
+def test_run_worker_counts_lost_failures(tmp_path):
+    queue = open_queue(tmp_path)
+    # A worker whose heartbeats stall loses its chunk to another worker
+    queue.heartbeat = lambda lease: True
+    other = WorkQueue(queue.db_path, lease_seconds=LEASE_SECONDS)
+
+    def evaluate(document):
+        time.sleep(LEASE_SECONDS * 1.5)
+        lease = other.lease()
+        assert other.complete(lease, [make_record(document) for document in lease.documents])
+        raise RuntimeError("evaluation failed")
+
+    stats = run_worker(queue, evaluate, poll_interval=0.01, report=None)
+    assert stats == {"chunks": 0, "leads": 0, "retried": 0, "failed": 0, "lost": 1}
+    assert chunk_status(queue)[CHUNK_DONE] == 1
+    assert len(stored_records(queue)) == len(LEADS)
@@ -0,0 +1,89 @@
+#!/usr/bin/env python
+"""
+Local stand-in for a CRM webhook, to try result delivery without the real endpoint.
+Usage: python webhook_receiver.py [--port 8900] [--fail-rate 0.3] [--delay 0.5]
+
+Start it, then run the API with LEAD_WEBHOOK_URLS=http://127.0.0.1:8900/results.
+Every batch is logged with its size and Idempotency-Key; batches already received
+(retried after a lost answer) are acknowledged without being counted again.
+"""
+
+import argparse
+import json
+import random
+import threading
+import time
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+def parse_args(argv=None):
+    parser = argparse.ArgumentParser(description="Local stand-in receiver for result webhooks.")
+    parser.add_argument("--host", default="127.0.0.1", help="Address to listen on (default 127.0.0.1)")
+    parser.add_argument("--port", type=int, default=8900, help="Port to listen on (default 8900)")
+    parser.add_argument("--fail-rate", type=float, default=0.0,
+                        help="Share of batches answered 503, to exercise retries (default 0)")
+    parser.add_argument("--delay", type=float, default=0.0, help="Seconds to wait before answering (default 0)")
+    parser.add_argument("--output", help="File receiving every delivered result as one JSON line")
+    return parser.parse_args(argv)
+
+def make_handler(args):
+    """Build the request handler class of the receiver."""
+    seen = set()
+    lock = threading.Lock()
+    totals = {"batches": 0, "results": 0}
+
+    class Handler(BaseHTTPRequestHandler):
+        protocol_version = "HTTP/1.1"  # keep-alive, as the delivery session reuses connections
+
+        def do_POST(self):
+            body = self.rfile.read(int(self.headers.get("Content-Length", 0)))
+            if args.delay:
+                time.sleep(args.delay)
+            if random.random() < args.fail_rate:
+                self._answer(503, {"error": "simulated failure"})
+                return
+            try:
+                results = json.loads(body)["results"]
+            except (ValueError, KeyError, TypeError):
+                self._answer(400, {"error": "expected {\"results\": [...]}"})
+                return
+            key = self.headers.get("Idempotency-Key", "")
+            with lock:
+                duplicate = key in seen
+                if not duplicate:
+                    seen.add(key)
+                    totals["batches"] += 1
+                    totals["results"] += len(results)
+                    if args.output:
+                        with open(args.output, "a", encoding="utf-8") as f:
+                            for result in results:
+                                f.write(json.dumps(result, ensure_ascii=False) + "\n")
+                print(f"{'duplicate' if duplicate else 'received'} batch {key[:8]}: {len(results)} results "
+                      f"(total {totals['results']} results in {totals['batches']} batches)")
+            self._answer(200, {"received": len(results), "duplicate": duplicate})
+
+        def _answer(self, status, body):
+            data = json.dumps(body).encode("utf-8")
+            self.send_response(status)
+            self.send_header("Content-Type", "application/json")
+            self.send_header("Content-Length", str(len(data)))
+            self.end_headers()
+            self.wfile.write(data)
+
+        def log_message(self, format, *log_args):
+            pass
+
+    return Handler
+
+def main():
+    args = parse_args()
+    server = ThreadingHTTPServer((args.host, args.port), make_handler(args))
+    print(f"Webhook receiver listening on http://{args.host}:{args.port}/")
+    try:
+        server.serve_forever()
+    except KeyboardInterrupt:
+        pass
+    finally:
+        server.server_close()
+
+if __name__ == "__main__":
+    main()
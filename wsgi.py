@@ -0,0 +1,18 @@
+#!/usr/bin/env python
+"""
+WSGI entry point for production servers.
+
+Importing this module warms up the rule engine, so with gunicorn's
+preload_app the work happens once in the master before workers are forked.
+"""
+
+import os
+import sys
+
+# Add root directory to sys.path for easier imports
+sys.path.insert(0, os.path.abspath(os.path.dirname(__file__)))
+
+from src.argent_qualify_lead6.api import app
+from src.argent_qualify_lead6.warmup import warm_up
+
+warm_up()